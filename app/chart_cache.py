@@ -0,0 +1,115 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import orjson
+
+from .config import CHART_CACHE_MAX_BYTES, INGEST_SETTLE_SECONDS
+
+# Fingerprints of closed ranges never change, so a small memo of them lets
+# conditional requests be answered without querying MongoDB at all
+MAX_REMEMBERED_FINGERPRINTS = 4096
+
+
+class ChartCache:
+    """Thread-safe LRU of rendered chart images bounded by total bytes"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._fingerprints = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            image = self._entries.get(key)
+            if image is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return image
+
+    def put(self, key, image):
+        if len(image) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = image
+            self._size += len(image)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+
+    def fingerprint_for(self, range_key):
+        with self._lock:
+            return self._fingerprints.get(range_key)
+
+    def remember_fingerprint(self, range_key, fingerprint):
+        with self._lock:
+            self._fingerprints[range_key] = fingerprint
+            self._fingerprints.move_to_end(range_key)
+            if len(self._fingerprints) > MAX_REMEMBERED_FINGERPRINTS:
+                self._fingerprints.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._fingerprints.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0, # noqa
+            }
+
+
+chart_cache = ChartCache(CHART_CACHE_MAX_BYTES)
+
+
+def is_closed_range(end):
+    """True once `end` is older than the ingest settle window"""
+    settled_before = datetime.utcnow() - timedelta(seconds=INGEST_SETTLE_SECONDS) # noqa
+    return end < settled_before
+
+
+def records_fingerprint(records):
+    """
+    (count, digest of the canonicalized records).
+
+    Hashes every value, not just the count and latest timestamp, so two
+    payloads that differ anywhere (an edited reading, another device)
+    never share a cached image or ETag.
+    """
+    canonical = orjson.dumps(records, default=str, option=orjson.OPT_SORT_KEYS) # noqa
+    return (len(records), hashlib.sha1(canonical).hexdigest())
+
+
+def make_etag(key):
+    """Strong ETag derived from the full cache key"""
+    digest = hashlib.sha1(repr(key).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def etag_matches(if_none_match, etag):
+    """Evaluate an If-None-Match header against an ETag"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
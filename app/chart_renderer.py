@@ -0,0 +1,279 @@
+"""
+Chart rendering service backed by a pool of warm worker processes.
+
+Callers send compact series specs (plain dicts of labels and values, never
+raw MongoDB documents) and get image bytes back. Each worker builds one
+Figure/FigureCanvasAgg template per chart kind at spawn and afterwards only
+updates the data artists, so no pyplot state is involved and rendering
+runs in parallel across cores without holding the API process's GIL.
+"""
+import asyncio
+import io
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from .config import CHART_RENDER_WORKERS
+
+CHART_FORMATS = {
+    "png": "image/png",
+    "webp": "image/webp",
+    "svg": "image/svg+xml",
+}
+# Thumbnails reuse the full-size template at a fraction of the pixels
+THUMBNAIL_DPI = 40
+MAX_X_TICKS = 12
+
+
+class _IndexedPanel:
+    """
+    Axes whose x positions are sample indexes labelled from `self.labels`.
+
+    Numeric positions keep matplotlib off its slow categorical-units path,
+    and the locator thins labels out when there are many buckets.
+    """
+
+    def __init__(self, ax):
+        from matplotlib.ticker import FuncFormatter, MaxNLocator
+
+        self.ax = ax
+        self.labels = []
+        ax.xaxis.set_major_locator(MaxNLocator(MAX_X_TICKS, integer=True))
+        ax.xaxis.set_major_formatter(FuncFormatter(self._label_for))
+        ax.tick_params(axis="x", rotation=45)
+
+    def _label_for(self, x, _pos):
+        i = int(round(x))
+        return self.labels[i] if 0 <= i < len(self.labels) else ""
+
+
+class _BarPanel(_IndexedPanel):
+    """Consumption bars; only the bar heights change between renders"""
+
+    def __init__(self, ax):
+        super().__init__(ax)
+        self.bars = None
+        ax.set_ylabel("Total CSM")
+
+    def update(self, labels, values, title, xlabel):
+        ax = self.ax
+        self.labels = labels
+        if self.bars is not None and len(self.bars) == len(values):
+            for rect, value in zip(self.bars, values):
+                rect.set_height(value)
+        else:
+            if self.bars is not None:
+                self.bars.remove()
+            self.bars = ax.bar(range(len(values)), values, color="skyblue")
+        ax.set_title(title, fontsize=11)
+        ax.set_xlabel(xlabel)
+        ax.set_xlim(-0.6, max(len(values), 1) - 0.4)
+        ax.relim()
+        ax.autoscale_view(scalex=False)
+
+
+class _LinePanel(_IndexedPanel):
+    """Battery voltage line plus a status badge"""
+
+    def __init__(self, ax):
+        super().__init__(ax)
+        (self.line,) = ax.plot(
+            [], [], color="green", marker="o", linewidth=2
+        )
+        self.badge = ax.text(
+            0.02,
+            0.98,
+            "",
+            transform=ax.transAxes,
+            verticalalignment="top",
+            bbox=dict(boxstyle="round", facecolor="gray", alpha=0.3),
+        )
+        ax.set_xlabel("Hour")
+        ax.set_ylabel("Voltage (V)")
+        ax.grid(True, alpha=0.3)
+
+    def update(self, labels, values, title, battery):
+        ax = self.ax
+        self.labels = labels
+        self.line.set_data(range(len(values)), values)
+        self.badge.set_text(
+            f"Current Status: {battery['status']} ({battery['voltage']})"
+        )
+        self.badge.get_bbox_patch().set_facecolor(battery["status_color"])
+        ax.set_title(title, fontsize=11)
+        ax.set_xlim(-0.6, max(len(values), 1) - 0.4)
+        if values:
+            ax.relim()
+            ax.autoscale_view(scalex=False)
+
+
+class _ConsumptionTemplate:
+    """Single consumption bar chart (web charts)"""
+
+    def __init__(self):
+        from matplotlib.figure import Figure
+
+        self.figure = Figure(figsize=(8, 4))
+        # Fixed margins stand in for tight_layout/bbox_inches="tight"
+        self.figure.subplots_adjust(left=0.09, right=0.98, top=0.91, bottom=0.27) # noqa
+        self.bars = _BarPanel(self.figure.add_subplot())
+
+    def update(self, spec):
+        self.bars.update(
+            spec["labels"],
+            spec["values"],
+            spec["title"],
+            spec.get("xlabel", "Hour"),
+        )
+
+
+class _EmailReportTemplate:
+    """Consumption bars above the battery voltage line, as in the email"""
+
+    def __init__(self):
+        from matplotlib.figure import Figure
+
+        self.figure = Figure(figsize=(10, 6))
+        self.figure.subplots_adjust(
+            left=0.08, right=0.98, top=0.95, bottom=0.12, hspace=0.6
+        )
+        ax1, ax2 = self.figure.subplots(2, 1)
+        self.bars = _BarPanel(ax1)
+        self.voltage = _LinePanel(ax2)
+
+    def update(self, spec):
+        device_id = spec["device_id"]
+        self.bars.update(
+            spec["labels"],
+            spec["consumption"],
+            f"Hourly Consumption - {device_id}",
+            "Hour",
+        )
+        self.voltage.update(
+            spec["labels"],
+            spec["voltage"],
+            f"Battery Voltage Over Time - {device_id}",
+            spec["battery"],
+        )
+
+
+_TEMPLATES = {
+    "consumption": _ConsumptionTemplate,
+    "email_report": _EmailReportTemplate,
+}
+
+# Worker-process state: one template per chart kind, built on first use
+_templates = {}
+
+
+def _template_for(kind):
+    template = _templates.get(kind)
+    if template is None:
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        template = _TEMPLATES[kind]()
+        FigureCanvasAgg(template.figure)
+        _templates[kind] = template
+    return template
+
+
+def _warm_worker():
+    """Process initializer: build the templates and prime font/text caches"""
+    from matplotlib import font_manager
+
+    font_manager.findfont(font_manager.FontProperties())
+    for kind in _TEMPLATES:
+        # One throwaway render fills the glyph and Agg text caches
+        _template_for(kind).figure.savefig(io.BytesIO(), format="png", dpi=10)
+
+
+def _ping():
+    return True
+
+
+def render_chart(spec):
+    """
+    Worker entry point: draw `spec` into its template and return the bytes.
+
+    `spec["format"]` picks png/webp/svg and `spec["thumbnail"]` drops the
+    resolution to THUMBNAIL_DPI; the figure is drawn exactly once.
+    """
+    template = _template_for(spec["kind"])
+    template.update(spec)
+
+    fmt = spec.get("format", "png")
+    dpi = THUMBNAIL_DPI if spec.get("thumbnail") else spec["dpi"]
+    kwargs = {"pil_kwargs": {"quality": 80}} if fmt == "webp" else {}
+    buf = io.BytesIO()
+    template.figure.savefig(buf, format=fmt, dpi=dpi, **kwargs)
+    return buf.getvalue()
+
+
+class ChartRenderer:
+    """Process pool that renders chart specs to image bytes"""
+
+    def __init__(self, workers=CHART_RENDER_WORKERS):
+        self.workers = workers
+        self._pool = None
+        self._lock = threading.Lock()
+        self.rendered = 0
+        self.restarts = 0
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_warm_worker,
+                )
+            return self._pool
+
+    def _reset_pool(self, broken):
+        with self._lock:
+            if self._pool is broken:
+                self._pool = None
+                self.restarts += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def start(self):
+        """Spawn every worker now so the first requests don't pay for it"""
+        pool = self._get_pool()
+        for _ in range(self.workers):
+            pool.submit(_ping)
+        logging.info(f"🎨 Chart renderer started with {self.workers} workers")
+
+    async def render(self, spec):
+        """Render without blocking the event loop"""
+        pool = self._get_pool()
+        try:
+            png = await asyncio.wrap_future(pool.submit(render_chart, spec))
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM); rebuild the pool and retry once
+            logging.warning("⚠️ Chart renderer pool broken, restarting")
+            self._reset_pool(pool)
+            png = await asyncio.wrap_future(
+                self._get_pool().submit(render_chart, spec)
+            )
+        self.rendered += 1
+        return png
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "running": self._pool is not None,
+            "rendered": self.rendered,
+            "restarts": self.restarts,
+        }
+
+
+# Global renderer shared by the API and the email pipeline
+chart_renderer = ChartRenderer()
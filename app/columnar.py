@@ -0,0 +1,336 @@
+"""
+Columnar decoding of raw BSON record batches into typed numpy arrays.
+
+Cursors are opened with find_raw_batches, so pymongo hands over each batch
+as one bytes object and no per-record dict is built. Records in a batch
+almost always share one layout (same keys, value types and length): the
+layout is parsed once from its first record, and every record matching it
+byte-for-byte outside the value slots is decoded with vectorized gathers
+at fixed offsets. Anything else (a missing field, a value stored with
+another type, a BSON type the layout parser doesn't know) falls back to
+bson.decode for that record alone.
+"""
+import struct
+
+import bson
+import numpy as np
+import pandas as pd
+
+# Decoded fields: column name -> path in the record
+FIELDS = {
+    "devicetime": ("devicetime",),
+    "etm": ("data", "evt", "etm"),
+    "csm": ("data", "evt", "csm"),
+    "bvt": ("data", "binfo", "bvt"),
+    "bpon": ("data", "binfo", "bpon"),
+}
+VALUE_FIELDS = ("etm", "csm", "bvt", "bpon")
+# Value dtypes (devicetime is datetime64[ms]); etm is a running meter
+# total and would outgrow float32's 24-bit mantissa
+DTYPES = {
+    "etm": np.float64,
+    "csm": np.float32,
+    "bvt": np.float32,
+    "bpon": np.bool_,
+}
+_PATH_FIELDS = {path: name for name, path in FIELDS.items()}
+
+_DOUBLE = 0x01
+_STRING = 0x02
+_DOCUMENT = 0x03
+_ARRAY = 0x04
+_BINARY = 0x05
+_BOOL = 0x08
+_DATETIME = 0x09
+_NULL = 0x0A
+_INT32 = 0x10
+_INT64 = 0x12
+# Fixed-size scalars that decode straight from their bytes
+_SCALARS = {
+    _DOUBLE: np.dtype("<f8"),
+    _BOOL: np.dtype("u1"),
+    _DATETIME: np.dtype("<i8"),
+    _NULL: None,
+    _INT32: np.dtype("<i4"),
+    _INT64: np.dtype("<i8"),
+}
+_SIZES = {0x07: 12, 0x11: 8, 0x13: 16, 0xFF: 0, 0x7F: 0, 0x06: 0}
+_MAX_LAYOUTS = 8
+
+_int32 = struct.Struct("<i").unpack_from
+
+
+def columns_projection(fields=VALUE_FIELDS, deviceid=False):
+    """find() projection for the given value columns (devicetime always)"""
+    projection = {"_id": 0, "devicetime": 1}
+    if deviceid:
+        projection["deviceid"] = 1
+    for name in fields:
+        projection[".".join(FIELDS[name])] = 1
+    return projection
+
+
+class RecordColumns:
+    """
+    Typed per-record columns in cursor order.
+
+    Absent values are NaT/NaN (False for bpon). `device_codes` index into
+    `device_ids`, which hold the stored `deviceid` values.
+    """
+
+    def __init__(self, devicetime, etm, csm, bvt, bpon, device_codes, device_ids): # noqa
+        self.devicetime = devicetime
+        self.etm = etm
+        self.csm = csm
+        self.bvt = bvt
+        self.bpon = bpon
+        self.device_codes = device_codes
+        self.device_ids = device_ids
+
+    def __len__(self):
+        return len(self.devicetime)
+
+    @property
+    def nbytes(self):
+        return sum(
+            getattr(self, name).nbytes for name in (*FIELDS, "device_codes")
+        )
+
+
+class _Layout:
+    """Byte layout shared by records with the same keys, types and length"""
+
+    def __init__(self, doc):
+        self.fixed = np.ones(len(doc), dtype=bool)
+        self.values = {}  # column -> (offset, dtype)
+        self.device = None  # (offset, length, subtype) of a binary deviceid
+        self.decodable = True
+        self.unknown = None  # first BSON type the walk could not size
+        self._walk(doc, 0, ())
+        self.template = np.frombuffer(doc, dtype=np.uint8)
+        self.fixed_at = np.flatnonzero(self.fixed)
+
+    def _walk(self, doc, start, path):
+        end = start + _int32(doc, start)[0] - 1
+        pos = start + 4
+        while pos < end:
+            kind = doc[pos]
+            key_end = doc.index(b"\x00", pos + 1)
+            key = path + (doc[pos + 1:key_end].decode(),)
+            value = key_end + 1
+            if kind in (_DOCUMENT, _ARRAY):
+                self._walk(doc, value, key)
+                if self.unknown is not None:
+                    return
+                pos = value + _int32(doc, value)[0]
+                continue
+
+            name = _PATH_FIELDS.get(key)
+            if kind in _SCALARS:
+                dtype = _SCALARS[kind]
+                size = dtype.itemsize if dtype is not None else 0
+                self.fixed[value:value + size] = False
+                if name is not None and (name == "devicetime") == (kind == _DATETIME): # noqa
+                    self.values[name] = (value, dtype)
+                elif name is not None:
+                    self.decodable = False
+            elif kind in (_STRING, _BINARY):
+                length = _int32(doc, value)[0]
+                head = 5 if kind == _BINARY else 4
+                size = head + length
+                self.fixed[value + head:value + size] = False
+                if key == ("deviceid",) and kind == _BINARY:
+                    self.device = (value + head, length, doc[value + 4])
+                if name is not None:
+                    self.decodable = False
+            elif kind in _SIZES:
+                size = _SIZES[kind]
+                self.fixed[value:value + size] = False
+                if name is not None:
+                    self.decodable = False
+            else:
+                # Size unknown (regex, code, ...): leave it to bson.decode
+                self.decodable = False
+                self.unknown = kind
+                return
+            pos = value + size
+
+    def matches(self, rows):
+        return (rows[:, self.fixed_at] == self.template[self.fixed_at]).all(axis=1) # noqa
+
+
+def _gather(rows, offset, dtype):
+    """One fixed-offset scalar per row, reinterpreted as `dtype`"""
+    raw = np.ascontiguousarray(rows[:, offset:offset + dtype.itemsize])
+    return raw.view(dtype).ravel()
+
+
+def _number(value):
+    """Float for a decoded value; NaN for None, text and non-numbers"""
+    if value is None or isinstance(value, (str, bytes)):
+        return np.nan
+    if isinstance(value, bson.Decimal128):
+        value = value.to_decimal()
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _lookup(doc, path):
+    for key in path:
+        doc = doc.get(key) if isinstance(doc, dict) else None
+    return doc
+
+
+class ColumnDecoder:
+    """
+    Accumulates decoded batches; `columns()` concatenates them.
+
+    `dtypes` overrides DTYPES per column, e.g. float64 values for output
+    that is serialized to JSON.
+    """
+
+    def __init__(self, dtypes=None):
+        self.dtypes = {**DTYPES, **(dtypes or {})}
+        self._chunks = []
+        self._device_codes = {}
+        self._device_ids = []
+        self.fast = 0
+        self.fallback = 0
+
+    def _device_code(self, deviceid):
+        key = bytes(deviceid) if isinstance(deviceid, bytes) else deviceid
+        code = self._device_codes.get(key)
+        if code is None:
+            code = self._device_codes[key] = len(self._device_codes)
+            self._device_ids.append(deviceid)
+        return code
+
+    def _empty(self, n):
+        chunk = {
+            name: np.full(n, np.nan, dtype=self.dtypes[name])
+            for name in ("etm", "csm", "bvt")
+        }
+        chunk["devicetime"] = np.full(n, np.datetime64("NaT"), dtype="datetime64[ms]") # noqa
+        chunk["bpon"] = np.zeros(n, dtype=np.bool_)
+        chunk["device_codes"] = np.full(n, -1, dtype=np.int32)
+        return chunk
+
+    def add_documents(self, docs):
+        """Decode already-materialized records (dicts, e.g. from JSON)"""
+        chunk = self._empty(len(docs))
+        self._fill_from_documents(chunk, np.arange(len(docs)), docs)
+        self._chunks.append(chunk)
+
+    def _fill_from_documents(self, chunk, index, docs):
+        if not len(index):
+            return
+        times = [doc.get("devicetime") for doc in docs]
+        chunk["devicetime"][index] = (
+            pd.to_datetime(times, errors="coerce").values.astype("datetime64[ms]") # noqa
+        )
+        for name in VALUE_FIELDS:
+            values = [_lookup(doc, FIELDS[name]) for doc in docs]
+            if name == "bpon":
+                chunk[name][index] = [bool(v) for v in values]
+            else:
+                chunk[name][index] = [_number(v) for v in values]
+        chunk["device_codes"][index] = [
+            self._device_code(doc["deviceid"]) if doc.get("deviceid") is not None else -1 # noqa
+            for doc in docs
+        ]
+        self.fallback += len(docs)
+
+    def add_batch(self, batch):
+        """Decode one raw batch (concatenated BSON documents)"""
+        self._chunks.append(self.decode_batch(batch))
+
+    def add_chunk(self, chunk):
+        """Queue a chunk from decode_batch; chunks concatenate in call order"""
+        self._chunks.append(chunk)
+
+    def decode_batch(self, batch):
+        """
+        Decode one raw batch into a chunk without queuing it.
+
+        Lets concurrent readers decode as batches arrive and queue the
+        chunks in order afterwards; device codes stay shared.
+        """
+        starts = []
+        pos, size = 0, len(batch)
+        while pos < size:
+            starts.append(pos)
+            pos += _int32(batch, pos)[0]
+        starts = np.array(starts, dtype=np.int64)
+        lengths = np.diff(np.append(starts, size))
+        chunk = self._empty(starts.size)
+        data = np.frombuffer(batch, dtype=np.uint8)
+
+        leftover = []
+        for length in np.unique(lengths):
+            index = np.flatnonzero(lengths == length)
+            rows = data[starts[index, None] + np.arange(length)]
+            for _ in range(_MAX_LAYOUTS):
+                start = starts[index[0]]
+                layout = _Layout(batch[start:start + length])
+                if not layout.decodable:
+                    break
+                match = layout.matches(rows)
+                self._fill_from_layout(chunk, index[match], rows[match], layout) # noqa
+                index, rows = index[~match], rows[~match]
+                if not index.size:
+                    break
+            leftover.extend(index.tolist())
+
+        if leftover:
+            docs = [
+                bson.decode(batch[starts[i]:starts[i] + lengths[i]])
+                for i in leftover
+            ]
+            self._fill_from_documents(chunk, np.array(leftover), docs)
+        return chunk
+
+    def _fill_from_layout(self, chunk, index, rows, layout):
+        for name, (offset, dtype) in layout.values.items():
+            if dtype is None:  # null
+                continue
+            values = _gather(rows, offset, dtype)
+            if name == "devicetime":
+                values = values.view("datetime64[ms]")
+            chunk[name][index] = values
+        if layout.device is not None:
+            offset, length, subtype = layout.device
+            keys = np.ascontiguousarray(rows[:, offset:offset + length])
+            keys = keys.view(np.dtype((np.void, length))).ravel()
+            unique, inverse = np.unique(keys, return_inverse=True)
+            codes = np.array([
+                self._device_code(bson.Binary(key.tobytes(), subtype))
+                for key in unique
+            ], dtype=np.int32)
+            chunk["device_codes"][index] = codes[inverse.ravel()]
+        self.fast += index.size
+
+    def columns(self):
+        chunks = self._chunks or [self._empty(0)]
+        merged = {
+            name: np.concatenate([chunk[name] for chunk in chunks])
+            for name in chunks[0]
+        }
+        self._chunks = []
+        return RecordColumns(device_ids=list(self._device_ids), **merged)
+
+
+def columns_from_batches(batches, dtypes=None):
+    """RecordColumns for an iterable of raw BSON batches"""
+    decoder = ColumnDecoder(dtypes)
+    for batch in batches:
+        decoder.add_batch(batch)
+    return decoder.columns()
+
+
+def columns_from_documents(docs, dtypes=None):
+    """RecordColumns for records that are already dicts"""
+    decoder = ColumnDecoder(dtypes)
+    decoder.add_documents(docs)
+    return decoder.columns()
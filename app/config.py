@@ -9,12 +9,19 @@ load_dotenv()
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
 DB_NAME = os.getenv("DB_NAME", "aquesa_management")
 COLLECTION_NAME = os.getenv("COLLECTION_NAME", "raw_data_ts")
+AQS_DEVICE_STATUS = os.getenv("AQS_DEVICE_STATUS", "aqs_device_status")
+AQS_ROLLUP_HOURLY = os.getenv("AQS_ROLLUP_HOURLY", "aqs_rollup_hourly")
+AQS_ROLLUP_DAILY = os.getenv("AQS_ROLLUP_DAILY", "aqs_rollup_daily")
 
 # Email Configuration
 EMAIL_ADDRESS = os.getenv("EMAIL_ADDRESS", "")
 EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD", "")
 SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
 SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+# Disable to test against a plain local SMTP stand-in
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() == "true"
+SMTP_TIMEOUT = int(os.getenv("SMTP_TIMEOUT", "60"))
+SMTP_SESSION_MAX_MESSAGES = int(os.getenv("SMTP_SESSION_MAX_MESSAGES", "100")) # noqa
 
 # Device Email Mapping
 try:
@@ -26,6 +33,18 @@ except json.JSONDecodeError:
 SCHEDULE_TIME = os.getenv("SCHEDULE_TIME", "08:00")
 TIMEZONE = os.getenv("TIMEZONE", "UTC")
 
+# Email Pipeline (per-stage concurrency limits)
+EMAIL_FETCH_CONCURRENCY = int(os.getenv("EMAIL_FETCH_CONCURRENCY", "8"))
+# Devices fetched per batched $in query
+EMAIL_FETCH_CHUNK_SIZE = int(os.getenv("EMAIL_FETCH_CHUNK_SIZE", "50"))
+EMAIL_SEND_CONCURRENCY = int(os.getenv("EMAIL_SEND_CONCURRENCY", "4"))
+
+# Email Outbox (durable delivery with exponential-backoff retries)
+EMAIL_OUTBOX_PATH = os.getenv("EMAIL_OUTBOX_PATH", "email_outbox.sqlite3")
+EMAIL_RETRY_BASE_SECONDS = int(os.getenv("EMAIL_RETRY_BASE_SECONDS", "60"))
+EMAIL_RETRY_MAX_SECONDS = int(os.getenv("EMAIL_RETRY_MAX_SECONDS", "3600"))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "8"))
+
 # Application Settings
 APP_HOST = os.getenv("APP_HOST", "127.0.0.1")
 APP_PORT = int(os.getenv("APP_PORT", "8000"))
@@ -36,12 +55,44 @@ MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "10"))
 MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "2"))
 THREAD_POOL_WORKERS = int(os.getenv("THREAD_POOL_WORKERS", "4"))
 CHART_DPI = int(os.getenv("CHART_DPI", "200"))
+# Each worker is a matplotlib process (~60-80 MB); keep the default small
+# enough for 512 MB instances and raise it explicitly on larger hosts
+CHART_RENDER_WORKERS = int(os.getenv("CHART_RENDER_WORKERS", str(min(2, os.cpu_count() or 1)))) # noqa
+CHART_CACHE_MAX_BYTES = int(os.getenv("CHART_CACHE_MAX_BYTES", str(32 * 1024 * 1024))) # noqa
+# Data older than this is considered final (no more late ingests)
+INGEST_SETTLE_SECONDS = int(os.getenv("INGEST_SETTLE_SECONDS", "900"))
 MAX_RECORDS_LIMIT = int(os.getenv("MAX_RECORDS_LIMIT", "10000"))
+MONGO_BATCH_SIZE = int(os.getenv("MONGO_BATCH_SIZE", "1000"))
+DUPLICATES_TIME_BUDGET_MS = int(os.getenv("DUPLICATES_TIME_BUDGET_MS", "30000")) # noqa
+# Long raw scans are split into time slices fetched concurrently. The
+# defaults are untuned: measure with benchmarks/bench_sliced_fetch.py
+FETCH_SLICE_HOURS = float(os.getenv("FETCH_SLICE_HOURS", "168"))
+FETCH_PARALLELISM = int(os.getenv("FETCH_PARALLELISM", "4"))
+if FETCH_SLICE_HOURS <= 0 or FETCH_PARALLELISM < 1:
+    # A zero span would never advance and a zero limit never fetch
+    raise ValueError(
+        "FETCH_SLICE_HOURS must be > 0 and FETCH_PARALLELISM >= 1, got "
+        f"{FETCH_SLICE_HOURS} and {FETCH_PARALLELISM}"
+    )
+EXPORT_CHUNK_BYTES = int(os.getenv("EXPORT_CHUNK_BYTES", "65536"))
+EXPORT_GZIP_LEVEL = int(os.getenv("EXPORT_GZIP_LEVEL", "6"))
+RESPONSE_COMPRESS_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESS_MIN_BYTES", "1024")) # noqa
+RESPONSE_GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", "5"))
+RESPONSE_BROTLI_QUALITY = int(os.getenv("RESPONSE_BROTLI_QUALITY", "4"))
+# Bodies at least this large are compressed in the threadpool
+RESPONSE_OFFLOAD_MIN_BYTES = int(os.getenv("RESPONSE_OFFLOAD_MIN_BYTES", str(256 * 1024))) # noqa
+RESULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH", "result_cache.sqlite3")
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(256 * 1024 * 1024))) # noqa
 
 # Security Settings
 SECRET_KEY = os.getenv("SECRET_KEY", "change-me-in-production")
 ALLOWED_HOSTS = os.getenv("ALLOWED_HOSTS", "localhost,127.0.0.1").split(",")
 
 # Monitoring Settings
+# Seconds between proactive refreshes of the fleet status cache
 MONITOR_INTERVAL = int(os.getenv("MONITOR_INTERVAL", "10"))
+STATUS_FOLD_INTERVAL = int(os.getenv("STATUS_FOLD_INTERVAL", "60"))
+STATUS_FOLD_WINDOW_HOURS = int(os.getenv("STATUS_FOLD_WINDOW_HOURS", "24"))
+ROLLUP_INTERVAL = int(os.getenv("ROLLUP_INTERVAL", "300"))
+ROLLUP_CHUNK_HOURS = int(os.getenv("ROLLUP_CHUNK_HOURS", "24"))
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
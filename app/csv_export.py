@@ -0,0 +1,105 @@
+"""
+CSV encoding shared by the streaming export endpoint and the email reports.
+
+Rows are written straight off a MongoDB cursor into a small text buffer
+that is flushed (optionally through gzip) every EXPORT_CHUNK_BYTES, so an
+export's memory use depends on the chunk size, not the range length.
+"""
+import csv
+import io
+import logging
+import zlib
+
+from .config import EXPORT_CHUNK_BYTES, EXPORT_GZIP_LEVEL
+
+# Selectable value columns: (path in the record, CSV header)
+EXPORT_COLUMNS = {
+    "etm": (("data", "evt", "etm"), "etm"),
+    "csm": (("data", "evt", "csm"), "csm"),
+    "bvt": (("data", "binfo", "bvt"), "battery_voltage"),
+    "bpon": (("data", "binfo", "bpon"), "battery_power"),
+}
+DEFAULT_COLUMNS = tuple(EXPORT_COLUMNS)
+
+
+def parse_columns(value):
+    """Comma-separated column names -> validated tuple (ValueError if bad)"""
+    if not value:
+        return DEFAULT_COLUMNS
+    columns = tuple(c.strip() for c in value.split(",") if c.strip())
+    unknown = [c for c in columns if c not in EXPORT_COLUMNS]
+    if unknown or not columns:
+        raise ValueError(
+            f"Unknown columns: {', '.join(unknown) or value}. "
+            f"Choose from {', '.join(EXPORT_COLUMNS)}"
+        )
+    return columns
+
+
+def csv_header(columns=DEFAULT_COLUMNS):
+    return ["devicetime", "device_id"] + [EXPORT_COLUMNS[c][1] for c in columns] # noqa
+
+
+def csv_row(record, device_id, columns=DEFAULT_COLUMNS):
+    """One record as a CSV row; missing fields become empty cells"""
+    row = [record.get("devicetime", ""), device_id]
+    for column in columns:
+        value = record
+        for key in EXPORT_COLUMNS[column][0]:
+            value = value.get(key) if isinstance(value, dict) else None
+        row.append("" if value is None else value)
+    return row
+
+
+def write_csv(records, device_id, out, columns=DEFAULT_COLUMNS):
+    """Write header and rows for `records` to the text stream `out`"""
+    writer = csv.writer(out, lineterminator="\n")
+    writer.writerow(csv_header(columns))
+    for record in records:
+        writer.writerow(csv_row(record, device_id, columns))
+
+
+async def iter_csv(cursor, device_id, columns=DEFAULT_COLUMNS, gzip=False):
+    """
+    Yield the CSV for `cursor` as byte chunks of about EXPORT_CHUNK_BYTES.
+
+    With `gzip` the chunks form one gzip member. The cursor is always
+    closed; an error after the first chunk can only abort the response.
+    """
+    compressor = (
+        zlib.compressobj(EXPORT_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        if gzip
+        else None
+    )
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+
+    def drain():
+        data = buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+        return compressor.compress(data) if compressor else data
+
+    rows = 0
+    try:
+        writer.writerow(csv_header(columns))
+        async for record in cursor:
+            writer.writerow(csv_row(record, device_id, columns))
+            rows += 1
+            if buffer.tell() >= EXPORT_CHUNK_BYTES:
+                chunk = drain()
+                if chunk:
+                    yield chunk
+        chunk = drain()
+        if compressor:
+            chunk += compressor.flush()
+        if chunk:
+            yield chunk
+        logging.info(f"📤 CSV export for {device_id}: {rows} rows")
+    except Exception as e:
+        # Headers are already sent; aborting leaves the client with a
+        # visibly incomplete download rather than a silently short file
+        logging.error(f"CSV export error for {device_id} after {rows} rows: {e}") # noqa
+        raise
+    finally:
+        await cursor.close()
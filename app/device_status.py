@@ -0,0 +1,328 @@
+"""
+Per-device status summary maintained incrementally from raw data.
+
+The summary collection holds one document per `data.devId` with
+first/latest activity, a record count and the last battery reading.
+A background worker folds raw documents into it in two parts:
+
+* the settled part, older than INGEST_SETTLE_SECONDS, is folded exactly
+  once, chunk by chunk, behind a stored `settled_through` watermark;
+* the recent part, still subject to late ingests, is re-aggregated on
+  every pass and stored as an absolute count.
+
+The summary is only served once a pass has caught up with the whole
+history (the `backfilled` flag); until then readers fall back to a scan.
+
+Reads never scan raw data; Active/Inactive is derived from `now` at
+read time.
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING, UpdateOne
+
+from .config import (
+    DB_NAME,
+    COLLECTION_NAME,
+    AQS_DEVICE_STATUS,
+    INGEST_SETTLE_SECONDS,
+    STATUS_FOLD_INTERVAL,
+    STATUS_FOLD_WINDOW_HOURS,
+)
+from .db import get_mongo_client
+
+WATERMARK_ID = "settled_through"
+BACKFILLED_ID = "backfilled"
+INACTIVE_AFTER = timedelta(hours=1)
+_MIN_TIME = datetime(1970, 1, 1)
+
+_status_worker = None
+
+
+def _collections():
+    db = get_mongo_client()[DB_NAME]
+    return (
+        db[COLLECTION_NAME],
+        db[AQS_DEVICE_STATUS],
+        db[f"{AQS_DEVICE_STATUS}_meta"],
+    )
+
+
+def _group_by_device(raw, time_range):
+    """Per-device aggregates for raw documents within a devicetime range"""
+    pipeline = [
+        {"$match": {"devicetime": time_range}},
+        {
+            "$project": {
+                "devId": "$data.devId",
+                "deviceid": 1,
+                "devicetime": 1,
+                "bvt": "$data.binfo.bvt",
+                "bpon": "$data.binfo.bpon",
+            }
+        },
+        {"$sort": {"devicetime": 1}},
+        {
+            "$group": {
+                "_id": "$devId",
+                "deviceid": {"$last": "$deviceid"},
+                "first_seen": {"$min": "$devicetime"},
+                "latest_time": {"$max": "$devicetime"},
+                "count": {"$sum": 1},
+                "bvt": {"$last": "$bvt"},
+                "bpon": {"$last": "$bpon"},
+            }
+        },
+    ]
+    return [
+        group
+        for group in raw.aggregate(pipeline, allowDiskUse=True)
+        if group["_id"] is not None
+    ]
+
+
+def _summary_update(group, count_fields):
+    """Pipeline update merging one device's aggregates into its summary"""
+    latest = {"$literal": group["latest_time"]}
+    first = {"$literal": group["first_seen"]}
+    is_newer = {"$gte": [latest, {"$ifNull": ["$latest_time", _MIN_TIME]}]}
+
+    def if_newer(value, field):
+        return {"$cond": [is_newer, {"$literal": value}, f"${field}"]}
+
+    merge = {
+        "device_id": {"$literal": str(group["_id"])},
+        "deviceid": if_newer(group["deviceid"], "deviceid"),
+        "first_seen": {"$min": [{"$ifNull": ["$first_seen", first]}, first]},
+        "latest_time": {"$max": [{"$ifNull": ["$latest_time", latest]}, latest]}, # noqa
+        "battery_voltage": if_newer(group.get("bvt"), "battery_voltage"),
+        "battery_power": if_newer(group.get("bpon"), "battery_power"),
+    }
+    merge.update(count_fields)
+    total = {
+        "record_count": {
+            "$add": [
+                {"$ifNull": ["$settled_count", 0]},
+                {"$ifNull": ["$recent_count", 0]},
+            ]
+        }
+    }
+    return UpdateOne(
+        {"_id": group["_id"]}, [{"$set": merge}, {"$set": total}], upsert=True
+    )
+
+
+def _fold_settled_chunk(raw, summary, start, end):
+    """Fold [start, end) into settled counts; safe to repeat after a crash"""
+    groups = _group_by_device(raw, {"$gte": start, "$lt": end})
+    # A device already folded through `end` keeps its count unchanged
+    is_fresh = {
+        "$lt": [{"$ifNull": ["$settled_through", _MIN_TIME]}, end]
+    }
+    updates = [
+        _summary_update(group, {
+            "settled_count": {
+                "$cond": [
+                    is_fresh,
+                    {"$add": [{"$ifNull": ["$settled_count", 0]}, group["count"]]}, # noqa
+                    "$settled_count",
+                ]
+            },
+            "settled_through": {
+                "$max": [{"$ifNull": ["$settled_through", end]}, end]
+            },
+        })
+        for group in groups
+    ]
+    if updates:
+        summary.bulk_write(updates, ordered=False)
+    return len(groups)
+
+
+def _refresh_recent(raw, summary, since):
+    """Replace the not-yet-settled counts with a fresh aggregate"""
+    groups = _group_by_device(raw, {"$gte": since})
+    updates = [
+        _summary_update(group, {"recent_count": {"$literal": group["count"]}})
+        for group in groups
+    ]
+    if updates:
+        summary.bulk_write(updates, ordered=False)
+
+    # Devices with nothing recent must not keep a stale recent count
+    summary.update_many(
+        {"recent_count": {"$gt": 0}, "_id": {"$nin": [g["_id"] for g in groups]}}, # noqa
+        [
+            {"$set": {"recent_count": 0}},
+            {"$set": {"record_count": {"$ifNull": ["$settled_count", 0]}}},
+        ],
+    )
+
+
+def _earliest_devicetime(raw):
+    first = raw.find_one({}, {"devicetime": 1}, sort=[("devicetime", 1)])
+    return first["devicetime"] if first else None
+
+
+def fold_new_records(now=None):
+    """
+    Bring the summary up to date with raw data.
+
+    Settled data is folded in chunks of STATUS_FOLD_WINDOW_HOURS, with the
+    watermark advanced after each chunk so a restart resumes where it
+    stopped. Returns the number of settled chunks folded.
+    """
+    raw, summary, meta = _collections()
+    now = now or datetime.utcnow()
+    settle_before = now - timedelta(seconds=INGEST_SETTLE_SECONDS)
+    window = timedelta(hours=STATUS_FOLD_WINDOW_HOURS)
+
+    mark = meta.find_one({"_id": WATERMARK_ID})
+    settled_through = mark["value"] if mark else _earliest_devicetime(raw)
+
+    chunks = 0
+    while settled_through is not None and settled_through < settle_before:
+        chunk_end = min(settled_through + window, settle_before)
+        _fold_settled_chunk(raw, summary, settled_through, chunk_end)
+        meta.update_one(
+            {"_id": WATERMARK_ID},
+            {"$set": {"value": chunk_end, "updated_at": datetime.utcnow()}},
+            upsert=True,
+        )
+        settled_through = chunk_end
+        chunks += 1
+
+    _refresh_recent(raw, summary, settled_through or settle_before)
+    if settled_through is None:
+        # Empty collection: start the watermark here for the next pass
+        meta.update_one(
+            {"_id": WATERMARK_ID},
+            {"$set": {"value": settle_before, "updated_at": datetime.utcnow()}}, # noqa
+            upsert=True,
+        )
+    # Only a pass that got all the way through makes the summary servable
+    meta.update_one(
+        {"_id": BACKFILLED_ID},
+        {
+            "$set": {"updated_at": datetime.utcnow()},
+            "$setOnInsert": {"value": settled_through or settle_before},
+        },
+        upsert=True,
+    )
+    return chunks
+
+
+def summary_is_ready():
+    """True once a fold pass has caught up with the whole history"""
+    _, _, meta = _collections()
+    return meta.find_one({"_id": BACKFILLED_ID}) is not None
+
+
+def ensure_status_indexes():
+    """Fold and refresh passes match raw data on devicetime alone"""
+    raw, _, _ = _collections()
+    raw.create_index([("devicetime", ASCENDING)])
+
+
+def format_status_row(device_id, latest_time, first_seen, record_count, now):
+    """Status row as served by /api/all-device-status"""
+    hours_since_last = (now - latest_time) / timedelta(hours=1)
+    is_active = now - latest_time <= INACTIVE_AFTER
+
+    device_data = {
+        "device_id": device_id,
+        "status": "Active" if is_active else "Inactive",
+        "latest_time": latest_time.strftime("%Y-%m-%d %H:%M:%S"),
+        "hours_since_last": round(hours_since_last, 1),
+        "record_count": record_count,
+        "first_seen": (
+            first_seen.strftime("%Y-%m-%d %H:%M:%S")
+            if first_seen
+            else "Unknown"
+        ),
+    }
+
+    # Set inactive start/end times
+    if not is_active:
+        device_data["inactive_start"] = latest_time.strftime("%Y-%m-%d %H:%M")
+        device_data["inactive_end"] = "Ongoing"
+
+        # Calculate how long it's been inactive
+        if hours_since_last < 24:
+            device_data["inactive_duration"] = (
+                f"{round(hours_since_last, 1)} hours"
+            )
+        else:
+            days = round(hours_since_last / 24, 1)
+            device_data["inactive_duration"] = f"{days} days"
+    else:
+        device_data["inactive_start"] = "-"
+        device_data["inactive_end"] = "-"
+        device_data["inactive_duration"] = "-"
+
+    return device_data
+
+
+def sort_status_rows(rows):
+    """Active first, then by latest activity"""
+    rows.sort(key=lambda row: row["latest_time"], reverse=True)
+    rows.sort(key=lambda row: row["status"])
+    return rows
+
+
+def read_fleet_status(now=None):
+    """All devices' status from the summary collection"""
+    _, summary, _ = _collections()
+    now = now or datetime.utcnow()
+
+    rows = []
+    for doc in summary.find({}, {"deviceid": 0}):
+        row = format_status_row(
+            doc["device_id"],
+            doc["latest_time"],
+            doc.get("first_seen"),
+            doc.get("record_count", 0),
+            now,
+        )
+        voltage = doc.get("battery_voltage")
+        row["battery_voltage"] = voltage
+        row["battery_power"] = (
+            bool(doc["battery_power"])
+            if doc.get("battery_power") is not None
+            else None
+        )
+        rows.append(row)
+    return sort_status_rows(rows)
+
+
+def _run_status_worker():
+    logging.info(
+        f"📈 Device status worker started (every {STATUS_FOLD_INTERVAL}s)"
+    )
+    try:
+        ensure_status_indexes()
+    except Exception as e:
+        logging.error(f"Device status index creation failed: {e}")
+    while True:
+        try:
+            started = time.time()
+            chunks = fold_new_records()
+            logging.info(
+                f"📈 Device status summary updated ({chunks} settled chunks) in {time.time() - started:.2f}s" # noqa
+            )
+        except Exception as e:
+            logging.error(f"Device status worker error: {e}")
+        time.sleep(STATUS_FOLD_INTERVAL)
+
+
+def start_status_worker():
+    """Start the background summary worker once per process"""
+    global _status_worker
+    if _status_worker is None or not _status_worker.is_alive():
+        _status_worker = threading.Thread(
+            target=_run_status_worker, daemon=True
+        )
+        _status_worker.start()
+    return _status_worker
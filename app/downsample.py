@@ -0,0 +1,79 @@
+import numpy as np
+
+
+def lttb_indices(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets: indexes of the points to keep.
+
+    Keeps the first and last point and, for each of `threshold - 2` equal
+    buckets in between, the point forming the largest triangle with the
+    previously kept point and the average of the next bucket.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0] = 0
+    keep[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Average of the next bucket (the last point for the final bucket)
+        nlo, nhi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[nlo:nhi].mean()
+        avg_y = y[nlo:nhi].mean()
+
+        area = np.abs(
+            (x[a] - avg_x) * (y[lo:hi] - y[a])
+            - (x[a] - x[lo:hi]) * (avg_y - y[a])
+        )
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+def minmax_envelope(x, y, buckets):
+    """Per-bucket (first x, min y, max y) over equal index buckets"""
+    n = len(x)
+    if n == 0:
+        empty = np.empty(0)
+        return empty, empty, empty
+    starts = np.unique(np.linspace(0, n, min(buckets, n), endpoint=False).astype(np.int64)) # noqa
+    return (
+        np.asarray(x)[starts],
+        np.minimum.reduceat(y, starts),
+        np.maximum.reduceat(y, starts),
+    )
+
+
+def downsample_series(times_ms, values, points):
+    """
+    Reduce one series to about `points` samples for plotting.
+
+    `times_ms` are epoch milliseconds. NaN values (field absent from the
+    record) are dropped first. Returns LTTB-selected points plus a min/max
+    envelope over the same number of buckets, so spikes that LTTB skips
+    still show up.
+    """
+    times_ms = np.asarray(times_ms, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    present = ~np.isnan(values)
+    times_ms, values = times_ms[present], values[present]
+
+    keep = lttb_indices(times_ms, values, points)
+    env_t, env_min, env_max = minmax_envelope(times_ms, values, points)
+    return {
+        "raw_points": int(times_ms.size),
+        "t": times_ms[keep].tolist(),
+        "v": values[keep].tolist(),
+        "envelope": {
+            "t": env_t.tolist(),
+            "min": env_min.tolist(),
+            "max": env_max.tolist(),
+        },
+    }
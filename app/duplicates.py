@@ -1,17 +1,153 @@
+from datetime import datetime, timedelta
+
+import numpy as np
 import pandas as pd
 
+_EPOCH = datetime(1970, 1, 1)
+
+
+class DuplicateScanner:
+    """
+    Single-pass duplicate detection over devicetime-sorted record batches.
+
+    Duplicates are equal neighbours, so only the run still open at the end
+    of a batch is carried over and memory stays bounded by the batch size.
+    `feed` returns the (deviceid, devicetime) groups closed by each batch.
+    """
+
+    def __init__(self):
+        self.records = 0
+        self.groups = 0
+        self._open = None  # (device code, epoch ms, count, device ids)
+
+    def _format(self, codes, times, counts, device_ids):
+        self.groups += len(counts)
+        labels = pd.to_datetime(times, unit="ms").strftime("%Y-%m-%d %H:%M:%S") # noqa
+        return [
+            {
+                "deviceid": format_deviceid(device_ids[code]) if code >= 0 else None, # noqa
+                "devicetime": label,
+                "count": int(count),
+            }
+            for code, label, count in zip(codes, labels, counts)
+        ]
+
+    def feed(self, columns):
+        present = ~np.isnat(columns.devicetime)
+        times = columns.devicetime[present].astype(np.int64)
+        codes = columns.device_codes[present]
+        self.records += times.size
+        if not times.size:
+            return []
+
+        change = np.empty(times.size, dtype=bool)
+        change[0] = True
+        change[1:] = (times[1:] != times[:-1]) | (codes[1:] != codes[:-1])
+        starts = np.flatnonzero(change)
+        counts = np.diff(np.append(starts, times.size))
+        run_codes, run_times = codes[starts], times[starts]
+
+        closed = []
+        if self._open is not None:
+            code, time, count, device_ids = self._open
+            if (code, time) == (run_codes[0], run_times[0]):
+                counts[0] += count
+            elif count > 1:
+                closed = self._format([code], [time], [count], device_ids)
+
+        # The last run may continue into the next batch
+        self._open = (run_codes[-1], run_times[-1], counts[-1], columns.device_ids) # noqa
+        repeated = np.flatnonzero(counts[:-1] > 1)
+        return closed + self._format(
+            run_codes[repeated], run_times[repeated], counts[repeated],
+            columns.device_ids,
+        )
+
+    def finish(self):
+        if self._open is None:
+            return []
+        code, time, count, device_ids = self._open
+        self._open = None
+        if count < 2:
+            return []
+        return self._format([code], [time], [count], device_ids)
+
+    def summary(self):
+        return {"records": self.records, "count": self.groups}
+
+
+def find_duplicates(columns):
+    """(deviceid, devicetime) groups seen more than once in sorted columns"""
+    scanner = DuplicateScanner()
+    return scanner.feed(columns) + scanner.finish()
+
+
+def format_deviceid(deviceid):
+    """UUID string for a Binary deviceid, str() for anything else"""
+    try:
+        return str(deviceid.as_uuid())
+    except Exception:
+        return str(deviceid)
+
+
+def encode_duplicates_cursor(devicetime):
+    return str((devicetime - _EPOCH) // timedelta(milliseconds=1))
+
+
+def decode_duplicates_cursor(cursor):
+    try:
+        return _EPOCH + timedelta(milliseconds=int(cursor))
+    except (TypeError, ValueError):
+        raise ValueError("Invalid duplicates cursor")
+
+
+def build_duplicates_pipeline(query, page_size, cursor=None):
+    """
+    Aggregation returning (deviceid, devicetime) groups seen more than once.
+
+    Groups come back in devicetime order; `cursor` resumes strictly after
+    a previous page's last devicetime. One extra group is requested so the
+    caller can tell whether another page exists.
+    """
+    match = query
+    if cursor:
+        after = decode_duplicates_cursor(cursor)
+        match = {"$and": [query, {"devicetime": {"$gt": after}}]}
+
+    return [
+        {"$match": match},
+        {
+            "$group": {
+                "_id": {"deviceid": "$deviceid", "devicetime": "$devicetime"},
+                "count": {"$sum": 1},
+            }
+        },
+        {"$match": {"count": {"$gt": 1}}},
+        {"$sort": {"_id.devicetime": 1}},
+        {"$limit": page_size + 1},
+    ]
 
-def find_duplicates(data):
-    if not data:
-        return []
 
-    df = pd.DataFrame(data)
-    df["devicetime"] = pd.to_datetime(df["devicetime"], errors="coerce")
+def format_duplicates_page(groups, page_size):
+    """API page from the groups returned by build_duplicates_pipeline"""
+    has_more = len(groups) > page_size
+    groups = groups[:page_size]
 
-    duplicate_df = df[df.duplicated(subset=["deviceid", "devicetime"], keep=False)] # noqa
+    duplicates = []
+    for group in groups:
+        duplicates.append({
+            "deviceid": format_deviceid(group["_id"]["deviceid"]),
+            "devicetime": group["_id"]["devicetime"].strftime("%Y-%m-%d %H:%M:%S"), # noqa
+            "count": group["count"],
+        })
 
-    # Convert to dict with count of each duplicate
-    grouped = duplicate_df.groupby(["deviceid", "devicetime"]).size().reset_index(name="count") # noqa
-    grouped["devicetime"] = grouped["devicetime"].dt.strftime("%Y-%m-%d %H:%M:%S") # noqa
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_duplicates_cursor(groups[-1]["_id"]["devicetime"]) # noqa
 
-    return grouped.to_dict(orient="records")
+    return {
+        "count": len(duplicates),
+        "duplicates": duplicates,
+        "has_more": has_more,
+        "next_cursor": next_cursor,
+    }
@@ -0,0 +1,534 @@
+"""
+Daily email reports: data fetch, chart/CSV generation and delivery.
+
+The scheduled run is a staged pipeline. Each device flows through fetch
+and prepare (bounded thread pool on the sync client), render (the shared
+chart renderer processes, so matplotlib runs in parallel across cores)
+and send (async SMTP), with an independent limit per stage. Rendered
+messages go through the durable outbox (app/outbox.py) before delivery.
+"""
+import asyncio
+import io
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from itertools import groupby
+from operator import itemgetter
+
+import schedule
+
+from .chart_cache import chart_cache, records_fingerprint
+from .chart_renderer import chart_renderer
+from .config import (
+    DB_NAME,
+    COLLECTION_NAME,
+    EMAIL_ADDRESS,
+    DEVICE_EMAIL_MAP,
+    SCHEDULE_TIME,
+    CHART_DPI,
+    EMAIL_FETCH_CONCURRENCY,
+    EMAIL_FETCH_CHUNK_SIZE,
+    MONGO_BATCH_SIZE,
+)
+from .csv_export import write_csv
+from .db import get_mongo_client
+from .fetch_data import RECORD_PROJECTION, device_id_to_binary, deviceid_to_str
+from .outbox import DEAD, get_outbox, report_key
+from .rollups import read_hourly_rows
+from .smtp_pool import SMTPSessionPool
+
+
+def email_report_window(now=None):
+    """(start, end) of the 24 hours covered by a report"""
+    end_time = now or datetime.utcnow()
+    return end_time - timedelta(hours=24), end_time
+
+
+def iter_device_records(device_ids, window=None, chunk_size=EMAIL_FETCH_CHUNK_SIZE): # noqa
+    """
+    Yield (device_id, records) for every device that has data in `window`.
+
+    Devices are fetched `chunk_size` at a time with one `$in` query,
+    projected to the report's fields and sorted by (deviceid, devicetime),
+    so each device's records arrive contiguously and are handed on as
+    soon as the cursor moves past them.
+    """
+    collection = get_mongo_client()[DB_NAME][COLLECTION_NAME]
+    start_time, end_time = window or email_report_window()
+
+    # Report back under the ids as configured, whatever their spelling
+    configured = {}
+    for device_id in device_ids:
+        try:
+            binary = device_id_to_binary(device_id)
+        except ValueError:
+            logging.error(f"Invalid device id {device_id!r}, skipping")
+            continue
+        configured[deviceid_to_str(binary)] = (device_id, binary)
+    targets = list(configured.values())
+
+    for i in range(0, len(targets), chunk_size):
+        chunk = targets[i:i + chunk_size]
+        query = {
+            "deviceid": {"$in": [binary for _, binary in chunk]},
+            "devicetime": {"$gte": start_time, "$lte": end_time},
+        }
+        cursor = (
+            collection.find(query, RECORD_PROJECTION)
+            .sort([("deviceid", 1), ("devicetime", 1)])
+            .batch_size(MONGO_BATCH_SIZE)
+        )
+        for deviceid, docs in groupby(cursor, key=itemgetter("deviceid")):
+            records = list(docs)
+            device_id = configured[deviceid_to_str(deviceid)][0]
+            logging.info(
+                f"Fetched {len(records)} records for device {device_id}"
+            )
+            yield device_id, records
+
+
+async def stream_device_records(device_ids, window, executor):
+    """
+    Async view of iter_device_records.
+
+    Chunks are fetched in parallel on `executor` and each device is yielded
+    the moment its records are complete.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    device_ids = list(device_ids)
+    chunks = [
+        device_ids[i:i + EMAIL_FETCH_CHUNK_SIZE]
+        for i in range(0, len(device_ids), EMAIL_FETCH_CHUNK_SIZE)
+    ]
+
+    def produce(chunk):
+        try:
+            for item in iter_device_records(chunk, window):
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+        except Exception as e:
+            logging.error(f"Error fetching data for devices {chunk}: {e}")
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, None)
+
+    for chunk in chunks:
+        loop.run_in_executor(executor, produce, chunk)
+
+    remaining = len(chunks)
+    while remaining:
+        item = await queue.get()
+        if item is None:
+            remaining -= 1
+        else:
+            yield item
+
+
+def battery_status_from_rows(rows):
+    """Battery status from the latest reading in hourly rollup rows"""
+    readings = [row["last"] for row in rows if row.get("last")]
+    if not readings:
+        return {"status": "No data", "voltage": "N/A", "power_on": "N/A"}
+    latest = max(readings, key=lambda reading: reading["t"])
+    return battery_status(latest.get("bvt") or 0, latest.get("bpon") or 0)
+
+
+def battery_status(voltage, power_on):
+    """Status, label and colour for a battery reading"""
+    # Determine battery status based on voltage
+    if voltage >= 3.7:
+        status = "Good"
+        status_color = "green"
+    elif voltage >= 3.4:
+        status = "Low"
+        status_color = "orange"
+    elif voltage > 0:
+        status = "Critical"
+        status_color = "red"
+    else:
+        status = "Unknown"
+        status_color = "gray"
+
+    return {
+        "status": status,
+        "voltage": f"{voltage:.2f}V" if voltage > 0 else "N/A",
+        "power_on": "Yes" if power_on else "No",
+        "status_color": status_color,
+    }
+
+
+def email_chart_spec(rows, device_id, battery_info):
+    """Hourly consumption and battery series for the report chart"""
+    if not rows:
+        return None
+
+    def value(v):
+        return float(v) if v is not None else float("nan")
+
+    return {
+        "kind": "email_report",
+        "device_id": device_id,
+        "labels": [row["bucket"].strftime("%H:%M") for row in rows],
+        "consumption": [value(row.get("csm")) for row in rows],
+        "voltage": [value(row.get("bvt_mean")) for row in rows],
+        "battery": battery_info,
+        "dpi": CHART_DPI,
+    }
+
+
+async def render_email_chart(spec, cache_key):
+    """PNG for a report chart, reusing a cached render if any"""
+    png = chart_cache.get(cache_key)
+    if png is None:
+        png = await chart_renderer.render(spec)
+        chart_cache.put(cache_key, png)
+    return png
+
+
+def generate_csv_for_email(records, device_id):
+    """Generate CSV data for email attachment"""
+    try:
+        if not records:
+            return None
+        csv_buffer = io.StringIO()
+        write_csv(records, device_id, csv_buffer)
+        csv_buffer.seek(0)
+        return csv_buffer
+
+    except Exception as e:
+        logging.error(f"Error generating CSV: {e}")
+        return None
+
+
+def build_report_message(
+    to_email, device_id, chart_buf, csv_buf=None, battery_info=None
+):  # noqa
+    """Compose the report email with chart and CSV attachments"""
+    msg = EmailMessage()
+    msg["Subject"] = (
+        f"Daily Report for Device {device_id} - {datetime.now().strftime('%Y-%m-%d')}"  # noqa
+    )
+    msg["From"] = EMAIL_ADDRESS
+    msg["To"] = to_email
+
+    logging.info(f"📧 Email headers set for {device_id}")
+
+    # Enhanced email content with battery status
+    battery_section = ""
+    if battery_info:
+        battery_section = f"""
+
+    BATTERY STATUS:
+    - Status: {battery_info['status']}
+    - Voltage: {battery_info['voltage']}
+    - Power On: {battery_info['power_on']}
+    """
+
+    email_content = f"""
+    Daily Device Report - {datetime.now().strftime('%Y-%m-%d')}
+
+    Device ID: {device_id}
+    Report Period: Last 24 hours
+    Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+    {battery_section}
+
+    Please find attached:
+    - Hourly consumption and battery voltage chart (PNG)
+    - Raw data export including battery info (CSV)
+
+    This is an automated report sent every 24 hours.
+
+    Best regards,
+    Aquesa Data Monitor System
+    """
+
+    msg.set_content(email_content)
+    logging.info(f"📧 Email content set for {device_id}")
+
+    # Attach chart image
+    if chart_buf:
+        try:
+            chart_data = chart_buf.read()
+            chart_filename = (
+                f"chart_{device_id}_{datetime.now().strftime('%Y%m%d')}.png"  # noqa
+            )
+            msg.add_attachment(
+                chart_data,
+                maintype="image",
+                subtype="png",
+                filename=chart_filename,  # noqa
+            )
+            chart_buf.seek(0)
+            logging.info(
+                f"📊 Chart attached for {device_id} ({len(chart_data)} bytes)"  # noqa
+            )
+        except Exception as e:
+            logging.error(f"❌ Failed to attach chart for {device_id}: {e}")
+
+    # Attach CSV if provided
+    if csv_buf:
+        try:
+            csv_data = csv_buf.getvalue()  # Use getvalue() for StringIO
+            csv_filename = (
+                f"data_{device_id}_{datetime.now().strftime('%Y%m%d')}.csv"
+            )
+            msg.add_attachment(
+                csv_data.encode("utf-8"),
+                maintype="text",
+                subtype="csv",
+                filename=csv_filename,
+            )
+            csv_buf.seek(0)
+            logging.info(
+                f"📄 CSV attached for {device_id} ({len(csv_data)} chars)"
+            )  # noqa
+        except Exception as e:
+            logging.error(f"❌ Failed to attach CSV for {device_id}: {e}")
+
+    return msg
+
+
+def prepare_report(records, device_id, window):
+    """
+    Gather everything a device's report needs besides the rendered chart.
+
+    The chart series and battery reading come from the hourly rollups;
+    the raw records only feed the CSV attachment. Returns (chart cache
+    key, chart spec, CSV text, battery info).
+    """
+    rows = read_hourly_rows(device_id_to_binary(device_id), *window)
+    battery_info = battery_status_from_rows(rows)
+
+    earliest = min(
+        (str(r.get("devicetime")) for r in records if r.get("devicetime")),
+        default="",
+    )
+    chart_key = ("email", device_id, earliest, "hour", CHART_DPI) + records_fingerprint( # noqa
+        records
+    )
+    csv_buf = generate_csv_for_email(records, device_id)
+    return (
+        chart_key,
+        email_chart_spec(rows, device_id, battery_info),
+        csv_buf.getvalue() if csv_buf else None,
+        battery_info,
+    )
+
+
+class _StageTimer:
+    """Accumulates per-stage busy time and item counts for a run"""
+
+    def __init__(self, *stages):
+        self.stats = {
+            stage: {"items": 0, "busy_s": 0.0, "max_s": 0.0}
+            for stage in stages
+        }
+
+    def record(self, stage, elapsed):
+        entry = self.stats[stage]
+        entry["items"] += 1
+        entry["busy_s"] += elapsed
+        entry["max_s"] = max(entry["max_s"], elapsed)
+
+    def summary(self):
+        return {
+            stage: {
+                "items": entry["items"],
+                "busy_s": round(entry["busy_s"], 2),
+                "avg_s": round(entry["busy_s"] / entry["items"], 3)
+                if entry["items"]
+                else 0.0,
+                "max_s": round(entry["max_s"], 3),
+            }
+            for stage, entry in self.stats.items()
+        }
+
+
+async def deliver_outbox(outbox=None, timer=None):
+    """
+    Send every due outbox message over pooled SMTP sessions.
+
+    Failures stay in the outbox with an exponential backoff, so the next
+    flush (or the next process after a crash) picks them up.
+    """
+    outbox = outbox or get_outbox()
+    result = {"sent": [], "retrying": [], "dead": []}
+
+    async def deliver(pool, item):
+        started = time.perf_counter()
+        try:
+            await pool.send_message(item["message"])
+            outbox.mark_sent(item["key"])
+            result["sent"].append(item["device_id"])
+            logging.info(
+                f"✅ Email sent successfully to {item['to_email']} for device {item['device_id']}"  # noqa
+            )
+        except Exception as e:
+            status = outbox.mark_failed(item["key"], e)
+            result["dead" if status == DEAD else "retrying"].append(item["key"]) # noqa
+            logging.error(
+                f"❌ Failed to send email to {item['to_email']} for device {item['device_id']} (attempt {item['attempts'] + 1}): {e}"  # noqa
+            )
+        finally:
+            if timer:
+                timer.record("send", time.perf_counter() - started)
+
+    due = outbox.claim_due()
+    if not due:
+        return result
+
+    async with SMTPSessionPool() as pool:
+        while due:
+            await asyncio.gather(*[deliver(pool, item) for item in due])
+            due = outbox.claim_due()
+        result["smtp"] = pool.stats()
+    return result
+
+
+async def run_email_pipeline(device_email_map=None, report_date=None, force=False): # noqa
+    """
+    Fetch, render and queue all reports concurrently, then deliver them.
+
+    Reports already in the outbox for `report_date` are not rendered again;
+    `force` queues a fresh copy (used by the manual test endpoint).
+    """
+    device_email_map = device_email_map or DEVICE_EMAIL_MAP
+    report_date = report_date or datetime.utcnow().date()
+    window = email_report_window()
+    outbox = get_outbox()
+    loop = asyncio.get_running_loop()
+    timer = _StageTimer("fetch", "prepare", "render", "send")
+    outcome = {"queued": [], "resumed": [], "failed": [], "skipped": []}
+    run_started = time.perf_counter()
+
+    fetch_pool = ThreadPoolExecutor(max_workers=EMAIL_FETCH_CONCURRENCY)
+
+    async def timed(stage, awaitable):
+        started = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            timer.record(stage, time.perf_counter() - started)
+
+    keys = {}
+    for device_id in device_email_map:
+        key = report_key(device_id, report_date)
+        if force:
+            key = f"{key}:manual:{time.time_ns()}"
+        if outbox.status_of(key) is not None:
+            outcome["resumed"].append(device_id)
+        else:
+            keys[device_id] = key
+
+    async def process_device(device_id, email, records):
+        try:
+            chart_key, spec, csv_text, battery_info = await timed(
+                "prepare",
+                loop.run_in_executor(
+                    fetch_pool, prepare_report, records, device_id, window
+                ),
+            )
+            chart_png = None
+            if spec is not None:
+                # Rendering runs in the shared chart renderer processes
+                chart_png = await timed(
+                    "render", render_email_chart(spec, chart_key)
+                )
+            if not chart_png:
+                logging.warning(f"⚠️ No chart generated for {device_id}")
+                outcome["skipped"].append(device_id)
+                return
+
+            msg = build_report_message(
+                email,
+                device_id,
+                io.BytesIO(chart_png),
+                io.StringIO(csv_text) if csv_text else None,
+                battery_info,
+            )
+            outbox.enqueue(keys[device_id], device_id, email, msg)
+            logging.info(
+                f"📥 Report queued for {device_id} - Battery: {battery_info['status']} ({battery_info['voltage']})"  # noqa
+            )
+            outcome["queued"].append(device_id)
+
+        except Exception as e:
+            logging.error(f"❌ Error processing device {device_id}: {e}")
+            outcome["failed"].append(device_id)
+
+    # Fetched devices start preparing while later ones are still streaming
+    tasks = []
+    fetch_started = time.perf_counter()
+    try:
+        async for device_id, records in stream_device_records(
+            keys, window, fetch_pool
+        ):
+            timer.record("fetch", time.perf_counter() - fetch_started)
+            fetch_started = time.perf_counter()
+            email = device_email_map.get(device_id)
+            if email is None or device_id not in keys or not records:
+                continue
+            tasks.append(
+                asyncio.create_task(process_device(device_id, email, records))
+            )
+        await asyncio.gather(*tasks)
+    finally:
+        fetch_pool.shutdown(wait=False)
+
+    seen = set(outcome["queued"]) | set(outcome["failed"]) | set(outcome["skipped"]) # noqa
+    for device_id in keys:
+        if device_id not in seen:
+            logging.warning(f"⚠️ No data found for {device_id}")
+            outcome["skipped"].append(device_id)
+
+    delivery = await deliver_outbox(outbox, timer)
+
+    summary = {
+        "devices": len(device_email_map),
+        "queued": len(outcome["queued"]),
+        "resumed": outcome["resumed"],
+        "sent": len(delivery["sent"]),
+        "delivered": delivery["sent"],
+        "retrying": delivery["retrying"],
+        "dead": delivery["dead"],
+        "failed": outcome["failed"],
+        "skipped": outcome["skipped"],
+        "elapsed_s": round(time.perf_counter() - run_started, 2),
+        "stages": timer.summary(),
+    }
+    logging.info(f"📬 Email run finished: {summary}")
+    return summary
+
+
+def process_and_send_emails():
+    """Process and send emails for all configured devices"""
+    logging.info(f"⏰ Running scheduled email at {datetime.now()}")
+    return asyncio.run(run_email_pipeline())
+
+
+def flush_outbox():
+    """Retry outbox messages whose backoff has elapsed"""
+    outbox = get_outbox()
+    next_due = outbox.next_due_at()
+    if next_due is None or next_due > time.time():
+        return None
+    return asyncio.run(deliver_outbox(outbox))
+
+
+def run_email_scheduler():
+    """Background thread function to run the email scheduler"""
+    # Schedule daily reports
+    schedule.every().day.at(SCHEDULE_TIME).do(process_and_send_emails)
+    # Retries, and anything left pending by a previous process
+    schedule.every().minute.do(flush_outbox)
+
+    logging.info(
+        f"📅 Email scheduler started - reports will be sent daily at {SCHEDULE_TIME}"  # noqa
+    )
+    logging.info(f"📋 Configured devices: {list(DEVICE_EMAIL_MAP.keys())}")
+
+    flush_outbox()
+    while True:
+        schedule.run_pending()
+        time.sleep(60)  # Check every minute
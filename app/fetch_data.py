@@ -1,65 +1,614 @@
+"""
+Async data access for the API.
 
-from fastapi import FastAPI
-from pymongo import MongoClient
-from bson import Binary, UuidRepresentation
-from datetime import datetime
+Every endpoint reads MongoDB through this module, on one pooled
+asyncio-native client, so queries never occupy a worker thread. UUID to
+Binary conversion and the device/time-range query builder live here and
+are shared by the sync background jobs as well.
+"""
+from pymongo import AsyncMongoClient
+from pymongo.errors import ExecutionTimeout
+from bson import Binary, ObjectId, UuidRepresentation
+from datetime import datetime, timedelta
+import asyncio
+import base64
+import json
+import logging
+import time
 import uuid
-from .config import MONGO_URI, DB_NAME, COLLECTION_NAME
+import numpy as np
+from .config import (
+    MONGO_URI,
+    DB_NAME,
+    COLLECTION_NAME,
+    MONGO_MAX_POOL_SIZE,
+    MONGO_MIN_POOL_SIZE,
+    MONGO_BATCH_SIZE,
+    MAX_RECORDS_LIMIT,
+    FETCH_SLICE_HOURS,
+    FETCH_PARALLELISM,
+    AQS_ROLLUP_HOURLY,
+    AQS_ROLLUP_DAILY,
+)
+from .columnar import ColumnDecoder, VALUE_FIELDS, columns_projection
+from .duplicates import (
+    build_duplicates_pipeline,
+    decode_duplicates_cursor,
+    format_duplicates_page,
+)
+from .rollups import (
+    ROLLUP_FIELDS,
+    SETTLED_ID,
+    plan_daily_read,
+    plan_hourly_read,
+    raw_hourly_pipeline,
+    settled_through_from,
+    sum_by_day,
+)
+from .responses import dumps
 
-app = FastAPI()
+# Raw data is reported every 5 minutes; used to estimate page totals
+REPORT_INTERVAL_MINUTES = 5
+COUNT_TIME_BUDGET_MS = 2000
 
+_EPOCH = datetime(1970, 1, 1)
 
-def serialize_mongo_doc(doc):
-    # Convert Binary UUID and datetime to string
-    if "deviceid" in doc:
-        try:
-            doc["deviceid"] = str(doc["deviceid"].as_uuid())
-        except Exception:
-            doc["deviceid"] = str(doc["deviceid"])
+RECORD_PROJECTION = {
+    "_id": 0,
+    "deviceid": 1,
+    "devicetime": 1,
+    "data.evt.etm": 1,
+    "data.evt.csm": 1,
+    "data.binfo.bvt": 1,
+    "data.binfo.bpon": 1
+}
 
-    if "devicetime" in doc:
-        doc["devicetime"] = doc["devicetime"].isoformat()
+CHART_BUCKETS = ("hour", "day")
 
-    return doc
+# Global async MongoDB client for connection pooling
+_async_client = None
 
 
-def get_data_from_mongodb(device_id: str, start_date: str, end_date: str):
+def get_async_client():
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncMongoClient(
+            MONGO_URI,
+            uuidRepresentation="standard",
+            maxPoolSize=MONGO_MAX_POOL_SIZE,
+            minPoolSize=MONGO_MIN_POOL_SIZE,
+            maxIdleTimeMS=30000,
+            serverSelectionTimeoutMS=5000,
+            connectTimeoutMS=10000,
+            socketTimeoutMS=20000,
+        )
+    return _async_client
+
+
+async def close_async_client():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
+
+
+def raw_collection():
+    return get_async_client()[DB_NAME][COLLECTION_NAME]
+
+
+# ----------------------------------------------------------------------------
+# Shared conversions and query builders
+# ----------------------------------------------------------------------------
+def device_id_to_binary(device_id: str):
+    """Device UUID string to the Binary stored in `deviceid`"""
+    return Binary.from_uuid(uuid.UUID(device_id), UuidRepresentation.STANDARD) # noqa
+
+
+def deviceid_to_str(deviceid):
     try:
-        client = MongoClient(MONGO_URI, uuidRepresentation="standard")
-        db = client[DB_NAME]
-        collection = db[COLLECTION_NAME]
+        if isinstance(deviceid, Binary):
+            return str(deviceid.as_uuid())
+        elif isinstance(deviceid, uuid.UUID):
+            return str(deviceid)
+        else:
+            return str(uuid.UUID(deviceid))  # in case it's a string UUID
+    except Exception:
+        return str(deviceid)
 
-        device_id_uuid = uuid.UUID(device_id)
-        device_id_binary = Binary.from_uuid(device_id_uuid, UuidRepresentation.STANDARD) # noqa
 
-        start = datetime.strptime(start_date, "%Y-%m-%d %H:%M:%S")
-        end = datetime.strptime(end_date, "%Y-%m-%d %H:%M:%S")
+def parse_datetime(value: str):
+    return datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
 
-        query = {
-            "deviceid": device_id_binary,
-            "devicetime": {"$gte": start, "$lte": end}
-        }
 
-        projection = {
-            "_id": 0,
-            "deviceid": 1,
-            "devicetime": 1,
-            "data.evt.etm": 1,
-            "data.evt.csm": 1,
-            "data.binfo.bvt": 1,
-            "data.binfo.bpon": 1
-        }
+def build_range_query(device_id: str, start_date: str, end_date: str):
+    """Query for one device's records in [start, end]; raises ValueError"""
+    start = parse_datetime(start_date)
+    end = parse_datetime(end_date)
+
+    query = {
+        "deviceid": device_id_to_binary(device_id),
+        "devicetime": {"$gte": start, "$lte": end}
+    }
+    return query, start, end
+
 
-        results = list(collection.find(query, projection))
-        serialized_results = [serialize_mongo_doc(doc) for doc in results]
+def slice_query(query, slice_span=None):
+    """
+    Split a build_range_query query into consecutive time slices.
+
+    Slices are half-open except the last, which keeps the inclusive end,
+    so together they match exactly the records `query` matches.
+    """
+    if slice_span is None:
+        slice_span = timedelta(hours=FETCH_SLICE_HOURS)
+    if slice_span <= timedelta(0):
+        raise ValueError("slice span must be positive")
+    start = query["devicetime"]["$gte"]
+    end = query["devicetime"]["$lte"]
+    slices = []
+    while start + slice_span <= end:
+        slices.append({**query, "devicetime": {"$gte": start, "$lt": start + slice_span}}) # noqa
+        start += slice_span
+    slices.append({**query, "devicetime": {"$gte": start, "$lte": end}})
+    return slices
+
+
+async def gather_slices(fetch, slices, parallelism=None):
+    """
+    `await fetch(slice)` for every slice, at most `parallelism` at a time
+    on the shared connection pool; results come back in slice order.
+    """
+    semaphore = asyncio.Semaphore(parallelism or FETCH_PARALLELISM)
+
+    async def fetch_one(query):
+        async with semaphore:
+            return await fetch(query)
+
+    return await asyncio.gather(*[fetch_one(query) for query in slices])
+
+
+# ----------------------------------------------------------------------------
+# Raw records
+# ----------------------------------------------------------------------------
+async def _find_records(query):
+    cursor = (
+        raw_collection()
+        .find(query, RECORD_PROJECTION)
+        .sort("devicetime", 1)
+        .batch_size(MONGO_BATCH_SIZE)
+    )
+    return await cursor.to_list()
+
+
+async def get_data_from_mongodb(device_id: str, start_date: str, end_date: str): # noqa
+    try:
+        query, start, end = build_range_query(device_id, start_date, end_date) # noqa
+
+        # Records stay as decoded; the response layer encodes them
+        slices = await gather_slices(_find_records, slice_query(query))
+        records = [doc for part in slices for doc in part]
 
         return {
-            "count": len(serialized_results),
+            "count": len(records),
             "start_time": start.isoformat(),
             "end_time": end.isoformat(),
-            "records": serialized_results
+            "records": records
         }
 
     except Exception as e:
-        print(f"Error: {e}")
+        logging.error(f"Data fetch error: {e}")
         return {"error": str(e)}
+
+
+def open_data_cursor(device_id: str, start_date: str, end_date: str):
+    """
+    Open a batched cursor over the range on the pooled client.
+
+    Inputs are validated here (raising ValueError) so a bad request can be
+    rejected before any part of a streamed response is sent.
+    """
+    query, _, _ = build_range_query(device_id, start_date, end_date)
+    return (
+        raw_collection()
+        .find(query, RECORD_PROJECTION)
+        .sort("devicetime", 1)
+        .batch_size(MONGO_BATCH_SIZE)
+    )
+
+
+async def iter_ndjson(cursor):
+    """Yield one JSON line per record, flushed once per cursor batch"""
+    buffer = []
+    try:
+        async for doc in cursor:
+            buffer.append(dumps(doc))
+            if len(buffer) >= MONGO_BATCH_SIZE:
+                yield b"\n".join(buffer) + b"\n"
+                buffer = []
+        if buffer:
+            yield b"\n".join(buffer) + b"\n"
+    except Exception as e:
+        # Headers are already sent, so report the failure in-band
+        logging.error(f"NDJSON stream error: {e}")
+        yield dumps({"error": str(e)}) + b"\n"
+    finally:
+        await cursor.close()
+
+
+def encode_page_token(devicetime, object_id):
+    """Opaque continuation token for a (devicetime, _id) position"""
+    millis = (devicetime - _EPOCH) // timedelta(milliseconds=1)
+    raw = json.dumps({"t": millis, "i": str(object_id)}).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_page_token(token):
+    """Inverse of encode_page_token; raises ValueError on a bad token"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        raw = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        devicetime = _EPOCH + timedelta(milliseconds=int(raw["t"]))
+        return devicetime, ObjectId(raw["i"])
+    except Exception:
+        raise ValueError("Invalid page cursor")
+
+
+async def _estimate_total(collection, query, start, end):
+    """Exact count within a time budget, otherwise a cadence-based estimate"""
+    try:
+        return await collection.count_documents(
+            query, maxTimeMS=COUNT_TIME_BUDGET_MS
+        ), False
+    except ExecutionTimeout:
+        slots = (end - start) // timedelta(minutes=REPORT_INTERVAL_MINUTES)
+        return int(slots) + 1, True
+
+
+async def get_data_page(
+    device_id: str,
+    start_date: str,
+    end_date: str,
+    page_size: int = 100,
+    cursor: str = None,
+    direction: str = "next",
+):
+    """
+    Keyset-paginated read ordered by (devicetime, _id).
+
+    `cursor` is a token from a previous page; `direction` "next" reads the
+    page after it, "prev" the page before it. Without a cursor, "next"
+    returns the first page and "prev" the last one. Never uses skip.
+    """
+    if direction not in ("next", "prev"):
+        raise ValueError("direction must be 'next' or 'prev'")
+    if page_size < 1:
+        raise ValueError("page_size must be positive")
+
+    collection = raw_collection()
+    range_query, start, end = build_range_query(
+        device_id, start_date, end_date
+    )
+
+    forward = direction == "next"
+    query = range_query
+    if cursor:
+        cursor_time, cursor_id = decode_page_token(cursor)
+        op = "$gt" if forward else "$lt"
+        query = {
+            "$and": [
+                range_query,
+                {"$or": [
+                    {"devicetime": {op: cursor_time}},
+                    {"devicetime": cursor_time, "_id": {op: cursor_id}},
+                ]},
+            ]
+        }
+
+    order = 1 if forward else -1
+    projection = dict(RECORD_PROJECTION, _id=1)
+    # Read one extra document to learn whether another page exists
+    docs = await (
+        collection.find(query, projection)
+        .sort([("devicetime", order), ("_id", order)])
+        .limit(page_size + 1)
+        .to_list()
+    )
+    has_more = len(docs) > page_size
+    docs = docs[:page_size]
+    if not forward:
+        docs.reverse()
+
+    has_next = has_more if forward else bool(cursor)
+    has_prev = bool(cursor) if forward else has_more
+
+    next_cursor = prev_cursor = None
+    if docs:
+        if has_next:
+            next_cursor = encode_page_token(
+                docs[-1]["devicetime"], docs[-1]["_id"]
+            )
+        if has_prev:
+            prev_cursor = encode_page_token(
+                docs[0]["devicetime"], docs[0]["_id"]
+            )
+
+    for doc in docs:
+        doc.pop("_id", None)
+
+    page = {
+        "count": len(docs),
+        "page_size": page_size,
+        "start_time": start.isoformat(),
+        "end_time": end.isoformat(),
+        "next_cursor": next_cursor,
+        "prev_cursor": prev_cursor,
+        "records": docs,
+    }
+
+    # Totals are only needed once per range; later pages skip the count
+    if not cursor:
+        total, is_estimate = await _estimate_total(
+            collection, range_query, start, end
+        )
+        page["total_estimate"] = total
+        page["total_is_estimate"] = is_estimate
+
+    return page
+
+
+# ----------------------------------------------------------------------------
+# Charts
+# ----------------------------------------------------------------------------
+async def _settled_through():
+    meta = get_async_client()[DB_NAME][f"{AQS_ROLLUP_HOURLY}_meta"]
+    return settled_through_from(await meta.find_one({"_id": SETTLED_ID}))
+
+
+async def get_hourly_rows(deviceid, start, end, settled_through):
+    """Hourly rows for [start, end]: rollup rows plus raw-aggregated edges"""
+    db = get_async_client()[DB_NAME]
+    rollup_query, raw_queries = plan_hourly_read(
+        deviceid, start, end, settled_through
+    )
+    rows = []
+    if rollup_query is not None:
+        rows.extend(
+            await db[AQS_ROLLUP_HOURLY].find(rollup_query, ROLLUP_FIELDS).to_list() # noqa
+        )
+    for query in raw_queries:
+        cursor = await raw_collection().aggregate(raw_hourly_pipeline(query))
+        rows.extend(await cursor.to_list())
+    rows.sort(key=lambda row: row["bucket"])
+    return rows
+
+
+async def get_consumption_buckets(
+    device_id: str, start_date: str, end_date: str, bucket="hour"
+):
+    """
+    `csm` totals per time bucket as (bucket_start, csm_total) tuples.
+
+    Whole buckets come from the hourly/daily rollups (a 30-day hourly
+    chart reads 720 small rows); only partial buckets at the range edges
+    and the unsettled tail are aggregated from raw documents.
+    """
+    if bucket not in CHART_BUCKETS:
+        raise ValueError(f"bucket must be one of {', '.join(CHART_BUCKETS)}")
+
+    query, start, end = build_range_query(device_id, start_date, end_date)
+    deviceid = query["deviceid"]
+    through = await _settled_through()
+
+    if bucket == "hour":
+        rows = await get_hourly_rows(deviceid, start, end, through)
+        return [(row["bucket"], row["csm"]) for row in rows]
+
+    daily_query, hourly_ranges = plan_daily_read(deviceid, start, end, through) # noqa
+    totals = {}
+    if daily_query is not None:
+        daily = get_async_client()[DB_NAME][AQS_ROLLUP_DAILY]
+        async for row in daily.find(daily_query, {"_id": 0, "bucket": 1, "csm": 1}): # noqa
+            totals[row["bucket"]] = row["csm"]
+    for range_start, range_end in hourly_ranges:
+        rows = await get_hourly_rows(deviceid, range_start, range_end, through) # noqa
+        for day, csm in sum_by_day(rows).items():
+            totals[day] = totals.get(day, 0) + csm
+    return sorted(totals.items())
+
+
+async def get_range_fingerprint(device_id: str, start_date: str, end_date: str): # noqa
+    """
+    (count, latest devicetime) for the range; changes whenever data does.
+
+    Only touches `devicetime`, so it can be answered from the
+    (deviceid, devicetime) index without reading documents.
+    """
+    query, _, _ = build_range_query(device_id, start_date, end_date)
+    pipeline = [
+        {"$match": query},
+        {
+            "$group": {
+                "_id": None,
+                "count": {"$sum": 1},
+                "latest": {"$max": "$devicetime"},
+            }
+        },
+    ]
+    cursor = await raw_collection().aggregate(pipeline)
+    async for doc in cursor:
+        return (doc["count"], doc["latest"].isoformat())
+    return (0, "")
+
+
+async def read_columns(query, fields=VALUE_FIELDS, deviceid=False, dtypes=None): # noqa
+    """
+    Records matching `query` as RecordColumns, in devicetime order.
+
+    Batches are fetched as raw BSON, one cursor per time slice, and decoded
+    straight into numpy arrays (see app/columnar.py) as they arrive, so
+    neither per-record dicts nor a range's worth of raw BSON are held.
+    """
+    projection = columns_projection(fields, deviceid)
+    decoder = ColumnDecoder(dtypes)
+
+    async def decoded_chunks(part):
+        cursor = (
+            raw_collection()
+            .find_raw_batches(part, projection)
+            .sort("devicetime", 1)
+            .batch_size(MONGO_BATCH_SIZE)
+        )
+        return [decoder.decode_batch(batch) async for batch in cursor]
+
+    for chunks in await gather_slices(decoded_chunks, slice_query(query)):
+        for chunk in chunks:
+            decoder.add_chunk(chunk)
+    return decoder.columns()
+
+
+async def get_series_columns(device_id: str, start_date: str, end_date: str): # noqa
+    """
+    `csm` and `bvt` for the range as numpy columns.
+
+    Returns (epoch ms int64, csm float64, bvt float64) with NaN where a
+    record lacks the field; float64 so values serialize as stored.
+    """
+    query, _, _ = build_range_query(device_id, start_date, end_date)
+    columns = await read_columns(
+        query, ("csm", "bvt"), dtypes={"csm": np.float64, "bvt": np.float64}
+    )
+    return columns.devicetime.astype(np.int64), columns.csm, columns.bvt
+
+
+# ----------------------------------------------------------------------------
+# Missing intervals and duplicates
+# ----------------------------------------------------------------------------
+async def get_devicetimes(query):
+    """Sorted `devicetime` values only, as a datetime64[ms] array"""
+    columns = await read_columns(query, ())
+    return columns.devicetime
+
+
+async def iter_column_batches(query, fields=(), deviceid=False):
+    """
+    RecordColumns for one raw cursor batch at a time, in devicetime order.
+
+    Batches hold at most MAX_RECORDS_LIMIT records, which bounds the
+    memory of a streaming scan however long the range is.
+    """
+    decoder = ColumnDecoder()
+    cursor = (
+        raw_collection()
+        .find_raw_batches(query, columns_projection(fields, deviceid))
+        .sort("devicetime", 1)
+        .batch_size(MAX_RECORDS_LIMIT)
+    )
+    try:
+        async for batch in cursor:
+            decoder.add_batch(batch)
+            yield decoder.columns()
+    finally:
+        await cursor.close()
+
+
+async def iter_scan_ndjson(query, scanner, deviceid=False):
+    """
+    Stream a GapScanner/DuplicateScanner over the range as NDJSON.
+
+    One line per finding, flushed after every batch, then a closing
+    {"summary": ...} line so clients can tell a complete scan apart.
+    """
+    try:
+        async for columns in iter_column_batches(query, deviceid=deviceid):
+            found = scanner.feed(columns)
+            if found:
+                yield b"".join(dumps(item) + b"\n" for item in found)
+        lines = [dumps(item) + b"\n" for item in scanner.finish()]
+        lines.append(dumps({"summary": scanner.summary()}) + b"\n")
+        yield b"".join(lines)
+    except Exception as e:
+        # Headers are already sent, so report the failure in-band
+        logging.error(f"NDJSON scan error: {e}")
+        yield dumps({"error": str(e)}) + b"\n"
+
+
+async def get_occupied_slots(query, interval_minutes=5):
+    """
+    Slot ids (epoch milliseconds // interval) that hold at least one record.
+
+    Bucketing happens in MongoDB, so one small number per occupied slot
+    crosses the wire instead of one document per record.
+    """
+    interval_ms = interval_minutes * 60 * 1000
+
+    async def slots_in(part):
+        pipeline = [
+            {"$match": part},
+            {
+                "$group": {
+                    "_id": {
+                        "$floor": {
+                            "$divide": [{"$toLong": "$devicetime"}, interval_ms] # noqa
+                        }
+                    }
+                }
+            },
+            {"$sort": {"_id": 1}},
+        ]
+        cursor = await raw_collection().aggregate(pipeline)
+        return [doc["_id"] async for doc in cursor]
+
+    slices = await gather_slices(slots_in, slice_query(query))
+    # A slot straddling a slice boundary shows up in both slices
+    return np.unique(np.array([slot for part in slices for slot in part], dtype=np.int64)) # noqa
+
+
+async def get_duplicates_page(
+    query, page_size=500, cursor=None, time_budget_ms=None
+):
+    """
+    One page of duplicate groups, computed entirely by MongoDB.
+
+    Duplicates share a devicetime, so a group never spans two time slices.
+    Slices are scanned in waves of FETCH_PARALLELISM, stopping once the
+    page is full. `time_budget_ms` bounds the whole scan: each slice's
+    aggregation gets what is left of it as maxTimeMS, and once it is spent
+    ExecutionTimeout is raised without starting more slices.
+    """
+    deadline = time.monotonic() + time_budget_ms / 1000 if time_budget_ms else None # noqa
+
+    async def groups_in(part):
+        options = {"allowDiskUse": True}
+        if deadline is not None:
+            remaining_ms = int((deadline - time.monotonic()) * 1000)
+            if remaining_ms <= 0:
+                raise ExecutionTimeout("Duplicate scan exceeded its time budget") # noqa
+            options["maxTimeMS"] = remaining_ms
+        pipeline = build_duplicates_pipeline(part, page_size, cursor)
+        return await (await raw_collection().aggregate(pipeline, **options)).to_list() # noqa
+
+    if cursor:
+        # Slices wholly before the resume point cannot contribute
+        bounds = dict(query["devicetime"])
+        bounds["$gte"] = max(bounds["$gte"], decode_duplicates_cursor(cursor))
+        query = {**query, "devicetime": bounds}
+    slices = slice_query(query)
+
+    groups = []
+    for first in range(0, len(slices), FETCH_PARALLELISM):
+        wave = slices[first:first + FETCH_PARALLELISM]
+        for part in await gather_slices(groups_in, wave):
+            groups.extend(part)
+        if len(groups) > page_size:
+            break
+    return format_duplicates_page(groups, page_size)
+
+
+# ----------------------------------------------------------------------------
+# Device lookups
+# ----------------------------------------------------------------------------
+async def get_latest_record(query, projection=None):
+    """Most recent raw document matching `query`, or None"""
+    return await raw_collection().find_one(
+        query, projection, sort=[("devicetime", -1)]
+    )
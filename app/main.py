@@ -1,82 +1,89 @@
-import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
-import uuid
-import io
 import json
 import logging
+import re
 
 # from functools import lru_cache
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
 import time
 import schedule
 import threading
 
 from fastapi import FastAPI, Request, Query, Response, HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
+from fastapi.responses import HTMLResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.encoders import jsonable_encoder
 
 from pydantic import BaseModel
 from datetime import datetime, timedelta
-from pymongo import MongoClient
-from bson import Binary, UuidRepresentation
-import matplotlib
-
-import smtplib
-from email.message import EmailMessage
-
-from .fetch_data import get_data_from_mongodb
-from .duplicates import find_duplicates
-from .missings import find_missing_intervals
+from pymongo.errors import ExecutionTimeout
+
+from .db import get_mongo_client
+from .fetch_data import (
+    get_data_from_mongodb,
+    get_data_page,
+    get_consumption_buckets,
+    get_range_fingerprint,
+    get_series_columns,
+    get_devicetimes,
+    get_occupied_slots,
+    get_duplicates_page,
+    get_latest_record,
+    build_range_query,
+    device_id_to_binary,
+    close_async_client,
+    open_data_cursor,
+    iter_ndjson,
+    iter_scan_ndjson,
+    parse_datetime,
+)
+from .chart_cache import (
+    chart_cache,
+    is_closed_range,
+    records_fingerprint,
+    make_etag,
+    etag_matches,
+)
+from .device_status import (
+    format_status_row,
+    read_fleet_status,
+    sort_status_rows,
+    start_status_worker,
+    summary_is_ready,
+)
+from .columnar import columns_from_documents
+from .csv_export import DEFAULT_COLUMNS, iter_csv, parse_columns
+from .email_reports import run_email_pipeline, run_email_scheduler
+from .chart_renderer import CHART_FORMATS, chart_renderer
+from .downsample import downsample_series
+from .responses import FastJSONResponse, dumps, gzipped_json_response
+from .result_cache import get_result_cache, result_key
+from .rollups import start_rollup_worker
+from .swr_cache import StaleWhileRevalidateCache
+from .duplicates import DuplicateScanner
+from .missings import (
+    GapScanner,
+    find_missing_runs,
+    find_missing_intervals_from_slots,
+)
 
 # from pytz import timezone
 from .config import (
-    MONGO_URI,
     DB_NAME,
     COLLECTION_NAME,
-    MONGO_MAX_POOL_SIZE,
-    MONGO_MIN_POOL_SIZE,
-    THREAD_POOL_WORKERS,
     # MAX_RECORDS_LIMIT,
-    EMAIL_ADDRESS,
-    EMAIL_PASSWORD,
-    SMTP_SERVER,
-    SMTP_PORT,
     DEVICE_EMAIL_MAP,
     SCHEDULE_TIME,
-    CHART_DPI,
+    DUPLICATES_TIME_BUDGET_MS,
+    MONITOR_INTERVAL,
 )
 
-matplotlib.use("Agg")  # Use non-interactive backend for better performance
-
-# Global MongoDB client for connection pooling
-_mongo_client = None
-_thread_pool = ThreadPoolExecutor(max_workers=THREAD_POOL_WORKERS)
-
-# Simple cache for device status (cache for 5 minutes since we're fetching ALL devices) # noqa
-_device_status_cache = {"data": None, "timestamp": 0}
+# Device status is served stale for up to this long while a refresh runs
 CACHE_DURATION = 300  # 5 minutes in seconds (longer cache for all devices)
 
 
-def get_mongo_client():
-    global _mongo_client
-    if _mongo_client is None:
-        _mongo_client = MongoClient(
-            MONGO_URI,
-            uuidRepresentation="standard",
-            maxPoolSize=MONGO_MAX_POOL_SIZE,
-            minPoolSize=MONGO_MIN_POOL_SIZE,
-            maxIdleTimeMS=30000,
-            serverSelectionTimeoutMS=5000,
-            connectTimeoutMS=10000,
-            socketTimeoutMS=20000,
-        )
-    return _mongo_client
-
-
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
 
 # Static and Templates
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -91,6 +98,20 @@ async def startup_event():
     """Initialize the email scheduler when the app starts"""
     global _scheduler_thread
 
+    # Spawn chart workers up front so they are warm for the first request
+    chart_renderer.start()
+
+    # Keep the per-device status summary and the rollups up to date
+    start_status_worker()
+    start_rollup_worker()
+
+    # Warm the fleet status cache and keep it fresh ahead of readers every
+    # MONITOR_INTERVAL. Ticks are skipped until the summary is ready: the
+    # fallback is a full-collection scan, which readers already trigger at
+    # most once per TTL
+    _device_status_cache.refresh()
+    _device_status_cache.start_auto_refresh(MONITOR_INTERVAL, when=summary_is_ready) # noqa
+
     if DEVICE_EMAIL_MAP:  # Only start if devices are configured
         _scheduler_thread = threading.Thread(
             target=run_email_scheduler, daemon=True
@@ -109,6 +130,8 @@ async def startup_event():
 async def shutdown_event():
     """Cleanup when the app shuts down"""
     logging.info("🛑 Application shutting down...")
+    chart_renderer.shutdown()
+    await close_async_client()
 
 
 # Routes for UI Pages
@@ -163,56 +186,302 @@ async def data_table_page(request: Request):
     return templates.TemplateResponse("data_table.html", {"request": request})
 
 
+def _settled_result_key(endpoint, device_id, start, end, **params):
+    """Result-cache key when [start, end] has settled, else None"""
+    try:
+        settled = is_closed_range(parse_datetime(end))
+    except ValueError:
+        return None
+    if not settled:
+        return None
+    return result_key(endpoint, device_id, start, end, **params)
+
+
+async def _cached_result(request, key):
+    """Stored response for a settled range, or None"""
+    if not key:
+        return None
+    accept_encoding = request.headers.get("accept-encoding")
+
+    def load():
+        body = get_result_cache().get(key)
+        if body is None:
+            return None
+        return gzipped_json_response(body, accept_encoding)
+
+    # SQLite reads and gunzip for gzip-less clients stay off the event loop
+    return await asyncio.get_running_loop().run_in_executor(None, load)
+
+
+async def _store_result(request, key, content):
+    """Cache `content` under `key` and answer with the stored body"""
+    accept_encoding = request.headers.get("accept-encoding")
+
+    def store():
+        body = get_result_cache().put(key, dumps(content))
+        return gzipped_json_response(body, accept_encoding)
+
+    return await asyncio.get_running_loop().run_in_executor(None, store)
+
+
 @app.get("/api/get-data")
-async def fetch_data(device_id: str, start_date: str, end_date: str):
-    data = get_data_from_mongodb(device_id, start_date, end_date)
+async def fetch_data(
+    request: Request,
+    device_id: str,
+    start_date: str,
+    end_date: str,
+    format: str = "json",
+):
+    if format == "ndjson":
+        # Stream records as they come off the cursor instead of buffering
+        try:
+            cursor = open_data_cursor(device_id, start_date, end_date)
+        except ValueError as e:
+            return FastJSONResponse(status_code=400, content={"error": str(e)})
+        return StreamingResponse(
+            iter_ndjson(cursor), media_type="application/x-ndjson"
+        )
+    if format != "json":
+        return FastJSONResponse(
+            status_code=400, content={"error": f"Unsupported format: {format}"}
+        )
+
+    # Settled ranges never change, so they are answered from disk
+    key = _settled_result_key("get-data", device_id, start_date, end_date)
+    cached = await _cached_result(request, key)
+    if cached is not None:
+        return cached
+
+    data = await get_data_from_mongodb(device_id, start_date, end_date)
     if isinstance(data, dict) and "error" in data:
-        return JSONResponse(status_code=400, content={"error": data["error"]})
-    return JSONResponse(content=data)
+        return FastJSONResponse(
+            status_code=400, content={"error": data["error"]}
+        )
+    if key:
+        return await _store_result(request, key, data)
+    return FastJSONResponse(content=data)
+
+
+@app.get("/api/get-data-page")
+async def fetch_data_page(
+    device_id: str,
+    start_date: str,
+    end_date: str,
+    page_size: int = Query(100, ge=1, le=1000),
+    cursor: str = None,
+    direction: str = "next",
+):
+    try:
+        page = await get_data_page(
+            device_id, start_date, end_date, page_size, cursor, direction
+        )
+        return FastJSONResponse(content=page)
 
+    except ValueError as e:
+        return FastJSONResponse(status_code=400, content={"error": str(e)})
+    except Exception as e:
+        logging.error(f"Data page API error: {e}")
+        return FastJSONResponse(status_code=500, content={"error": str(e)})
+
+
+@app.get("/api/export.csv")
+async def export_csv(
+    request: Request,
+    device_id: str,
+    start_date: str,
+    end_date: str,
+    columns: str = ",".join(DEFAULT_COLUMNS),
+    gzip: bool = False,
+):
+    """
+    Stream the range as CSV straight off the cursor (no MAX_RECORDS_LIMIT).
 
-def _generate_chart_sync(records, start_date, end_date):
-    """Synchronous chart generation for thread pool execution"""
+    With gzip=true the body is compressed on the fly: sent as
+    Content-Encoding when the client accepts gzip, else as a .csv.gz file.
+    """
     try:
-        df = pd.DataFrame(records)
-        if df.empty:
-            return None
+        selected = parse_columns(columns)
+        cursor = open_data_cursor(device_id, start_date, end_date)
+    except ValueError as e:
+        return FastJSONResponse(status_code=400, content={"error": str(e)})
+
+    filename = re.sub(r"[^\w.-]+", "_", f"{device_id}_{start_date}_{end_date}") + ".csv" # noqa
+    media_type = "text/csv; charset=utf-8"
+    headers = {}
+    if gzip and "gzip" in request.headers.get("accept-encoding", ""):
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+    elif gzip:
+        media_type = "application/gzip"
+        filename += ".gz"
+    headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+
+    return StreamingResponse(
+        iter_csv(cursor, device_id, selected, gzip=gzip),
+        media_type=media_type,
+        headers=headers,
+    )
 
-        df["devicetime"] = pd.to_datetime(df["devicetime"], errors="coerce")
-        df = df.dropna(subset=["devicetime"])
-        df["hour"] = df["devicetime"].dt.floor("h")
-        df["csm"] = df["data"].apply(
-            lambda x: (
-                x.get("evt", {}).get("csm", 0) if isinstance(x, dict) else 0
-            )  # noqa
-        )
 
-        hourly = df.groupby("hour")["csm"].sum().reset_index()
+WEB_CHART_DPI = 150
 
-        # Use smaller figure size and lower DPI for faster rendering
-        fig, ax = plt.subplots(figsize=(8, 4))
-        ax.bar(
-            hourly["hour"].dt.strftime("%H:%M"), hourly["csm"], color="skyblue"
-        )  # noqa
 
-        ax.set_title(
-            f"Hourly Consumption from {start_date} to {end_date}", fontsize=11
-        )  # noqa
-        ax.set_xlabel("Hour")
-        ax.set_ylabel("Total CSM")
-        ax.tick_params(axis="x", rotation=45)
-
-        buf = io.BytesIO()
-        plt.tight_layout()
-        plt.savefig(buf, format="png", dpi=150, bbox_inches="tight")  # Lower DPI # noqa
-        buf.seek(0)
-        plt.close(fig)  # Important: close figure to free memory
-        return buf
+def _consumption_spec(labels, values, title, xlabel="Hour", fmt="png", thumbnail=False): # noqa
+    """Compact chart spec for the renderer processes"""
+    return {
+        "kind": "consumption",
+        "labels": list(labels),
+        "values": [float(v) for v in values],
+        "title": title,
+        "xlabel": xlabel,
+        "dpi": WEB_CHART_DPI,
+        "format": fmt,
+        "thumbnail": thumbnail,
+    }
+
+
+def _records_chart_spec(records, start_date, end_date):
+    """Reduce raw records to hourly totals before they leave this process"""
+    try:
+        columns = columns_from_documents(records)
+        present = ~np.isnat(columns.devicetime)
+        if not present.any():
+            return None
+
+        hours, slot = np.unique(
+            columns.devicetime[present].astype("datetime64[h]"),
+            return_inverse=True,
+        )
+        csm = np.nan_to_num(columns.csm[present].astype(np.float64))
+        totals = np.bincount(slot.ravel(), weights=csm, minlength=hours.size)
+
+        return _consumption_spec(
+            pd.DatetimeIndex(hours).strftime("%H:%M"),
+            totals,
+            f"Hourly Consumption from {start_date} to {end_date}",
+        )
     except Exception as e:
         logging.error(f"Chart generation error: {e}")
         return None
 
 
+def _bucketed_chart_spec(buckets, start_date, end_date, bucket, fmt="png", thumbnail=False): # noqa
+    """Chart spec for already-aggregated (bucket_start, total) pairs"""
+    if bucket == "day":
+        label_format = "%Y-%m-%d"
+    elif buckets[-1][0] - buckets[0][0] < timedelta(days=1):
+        label_format = "%H:%M"
+    else:
+        # Hour labels alone would collide across days
+        label_format = "%m-%d %H:%M"
+
+    labels = [start.strftime(label_format) for start, _ in buckets]
+    values = [total for _, total in buckets]
+    period = "Daily" if bucket == "day" else "Hourly"
+    return _consumption_spec(
+        labels,
+        values,
+        f"{period} Consumption from {start_date} to {end_date}",
+        xlabel=bucket.capitalize(),
+        fmt=fmt,
+        thumbnail=thumbnail,
+    )
+
+
+def _chart_response(image, etag, fmt="png"):
+    return Response(
+        content=image,
+        media_type=CHART_FORMATS[fmt],
+        # Always revalidate; unchanged charts come back as a bodiless 304
+        headers={"ETag": etag, "Cache-Control": "no-cache"},
+    )
+
+
+async def _cached_bucketed_chart(
+    device_id, start, end, bucket, if_none_match, fmt="png", thumbnail=False
+):
+    """
+    Resolve a chart request against the render cache.
+
+    Returns (etag, image); image is None when the client's copy is current,
+    and etag is None when the range holds no data.
+    """
+    end_dt = datetime.strptime(end, "%Y-%m-%d %H:%M:%S")
+    range_key = ("chart", device_id, start, end, bucket, WEB_CHART_DPI)
+
+    # Closed ranges keep their fingerprint, so revalidation skips MongoDB
+    closed = is_closed_range(end_dt)
+    fingerprint = chart_cache.fingerprint_for(range_key) if closed else None
+    if fingerprint is None:
+        fingerprint = await get_range_fingerprint(device_id, start, end)
+        if closed:
+            chart_cache.remember_fingerprint(range_key, fingerprint)
+    if fingerprint[0] == 0:
+        return None, None
+
+    key = range_key + fingerprint + (fmt, thumbnail)
+    etag = make_etag(key)
+    if etag_matches(if_none_match, etag):
+        return etag, None
+
+    image = chart_cache.get(key)
+    if image is None:
+        buckets = await get_consumption_buckets(device_id, start, end, bucket)
+        if not buckets:
+            return None, None
+
+        # Rendering is CPU-bound, it runs in the renderer processes
+        image = await chart_renderer.render(
+            _bucketed_chart_spec(buckets, start, end, bucket, fmt, thumbnail)
+        )
+        chart_cache.put(key, image)
+    return etag, image
+
+
+@app.get("/api/chart")
+async def get_chart(
+    request: Request,
+    device_id: str = Query(...),
+    start: str = Query(...),
+    end: str = Query(...),
+    bucket: str = "hour",
+    format: str = "png",
+    thumbnail: bool = False,
+):
+    if format not in CHART_FORMATS:
+        return FastJSONResponse(
+            status_code=400,
+            content={"error": f"format must be one of {list(CHART_FORMATS)}"},
+        )
+    try:
+        etag, image = await _cached_bucketed_chart(
+            device_id,
+            start,
+            end,
+            bucket,
+            request.headers.get("if-none-match"),
+            fmt=format,
+            thumbnail=thumbnail,
+        )
+    except ValueError as e:
+        return FastJSONResponse(status_code=400, content={"error": str(e)})
+    except Exception as e:
+        logging.error(f"Chart API error: {e}")
+        return Response(
+            status_code=500,
+            content="Internal server error",
+            media_type="text/plain",
+        )
+
+    if etag is None:
+        return Response(
+            status_code=404, content="No data to plot", media_type="text/plain"
+        )
+    if image is None:
+        return Response(status_code=304, headers={"ETag": etag})
+    return _chart_response(image, etag, format)
+
+
 @app.post("/api/render-chart")
 async def render_chart(request: Request):
     try:
@@ -226,18 +495,31 @@ async def render_chart(request: Request):
         if not records:
             return Response(content="No data to plot", media_type="text/plain")
 
-        # Run chart generation in thread pool to avoid blocking
-        loop = asyncio.get_event_loop()
-        buf = await loop.run_in_executor(
-            _thread_pool, _generate_chart_sync, records, start_date, end_date
+        device_id = str(records[0].get("deviceid", ""))
+        key = (
+            ("render", device_id, start_date, end_date, "hour", WEB_CHART_DPI)
+            + records_fingerprint(records)
         )
+        etag = make_etag(key)
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers={"ETag": etag})
 
-        if buf is None:
-            return Response(
-                content="Error generating chart", media_type="text/plain"
-            )  # noqa
+        png = chart_cache.get(key)
+        if png is None:
+            # Only hourly totals are shipped to the renderer processes
+            loop = asyncio.get_event_loop()
+            spec = await loop.run_in_executor(
+                None, _records_chart_spec, records, start_date, end_date
+            )
+
+            if spec is None:
+                return Response(
+                    content="Error generating chart", media_type="text/plain"
+                )  # noqa
+            png = await chart_renderer.render(spec)
+            chart_cache.put(key, png)
 
-        return StreamingResponse(buf, media_type="image/png")
+        return _chart_response(png, etag)
 
     except Exception as e:
         logging.error(f"Chart API error: {e}")
@@ -246,246 +528,227 @@ async def render_chart(request: Request):
         )  # noqa
 
 
-def safe_deviceid_to_str(deviceid):
-    try:
-        if isinstance(deviceid, Binary):
-            return str(deviceid.as_uuid())
-        elif isinstance(deviceid, uuid.UUID):
-            return str(deviceid)
-        else:
-            return str(uuid.UUID(deviceid))  # in case it's a string UUID
-    except Exception:
-        return str(deviceid)
+@app.get("/api/chart-cache-stats")
+async def get_chart_cache_stats():
+    return FastJSONResponse(
+        content={**chart_cache.stats(), "renderer": chart_renderer.stats()}
+    )
 
 
-def _find_duplicates_sync(device_id, start, end):
-    """Synchronous duplicate finding for thread pool execution"""
+@app.get("/api/series")
+async def get_series(
+    device_id: str = Query(...),
+    start: str = Query(...),
+    end: str = Query(...),
+    points: int = Query(1000, ge=3, le=10000),
+):
+    """csm and bvt downsampled to `points` (LTTB plus a min/max envelope)"""
     try:
-        client = get_mongo_client()
-        db = client[DB_NAME]
-        collection = db[COLLECTION_NAME]
-
-        start_dt = datetime.strptime(start, "%Y-%m-%d %H:%M:%S")
-        end_dt = datetime.strptime(end, "%Y-%m-%d %H:%M:%S")
-
-        device_uuid = uuid.UUID(device_id)
-        binary_uuid = Binary.from_uuid(device_uuid, UuidRepresentation.STANDARD)  # noqa
+        times, csm, bvt = await get_series_columns(device_id, start, end)
+    except ValueError as e:
+        return FastJSONResponse(status_code=400, content={"error": str(e)})
+    except Exception as e:
+        logging.error(f"Series API error: {e}")
+        return FastJSONResponse(status_code=500, content={"error": str(e)})
 
-        query = {
-            "deviceid": binary_uuid,
-            "devicetime": {"$gte": start_dt, "$lte": end_dt},
+    return FastJSONResponse(
+        content={
+            "device_id": device_id,
+            "start": start,
+            "end": end,
+            "raw_points": int(times.size),
+            "series": {
+                "csm": downsample_series(times, csm, points),
+                "bvt": downsample_series(times, bvt, points),
+            },
         }
-
-        projection = {"_id": 0, "deviceid": 1, "devicetime": 1}
-        # Use limit to prevent excessive memory usage
-        cursor = list(collection.find(query, projection).limit(10000))
-
-        # Format results
-        for doc in cursor:
-            doc["deviceid"] = safe_deviceid_to_str(doc["deviceid"])
-            doc["devicetime"] = doc["devicetime"].isoformat()
-
-        duplicates = find_duplicates(cursor)
-        return {"count": len(duplicates), "duplicates": duplicates}
-
-    except Exception as e:
-        raise e
+    )
 
 
 # API: Find Duplicates
 @app.get("/api/find-duplicates")
 async def get_duplicate_data(
-    device_id: str = Query(...), start: str = Query(...), end: str = Query(...)
+    request: Request,
+    device_id: str = Query(...),
+    start: str = Query(...),
+    end: str = Query(...),
+    page_size: int = Query(500, ge=1, le=5000),
+    cursor: str = None,
+    format: str = "json",
 ):
     try:
-        # Run in thread pool to avoid blocking
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(
-            _thread_pool, _find_duplicates_sync, device_id, start, end
-        )
-        return JSONResponse(content=result)
+        query, _, _ = build_range_query(device_id, start, end)
+        if format == "ndjson":
+            # Whole range in one pass, emitted as groups are found
+            return StreamingResponse(
+                iter_scan_ndjson(query, DuplicateScanner(), deviceid=True),
+                media_type="application/x-ndjson",
+            )
+        if format != "json":
+            raise ValueError(f"Unsupported format: {format}")
 
+        key = _settled_result_key(
+            "find-duplicates", device_id, start, end,
+            page_size=page_size, cursor=cursor or "",
+        )
+        cached = await _cached_result(request, key)
+        if cached is not None:
+            return cached
+
+        # Grouping runs inside MongoDB, so any range size works
+        result = await get_duplicates_page(
+            query,
+            page_size=page_size,
+            cursor=cursor,
+            time_budget_ms=DUPLICATES_TIME_BUDGET_MS,
+        )
+        if key:
+            return await _store_result(request, key, result)
+        return FastJSONResponse(content=result)
+
+    except ValueError as e:
+        return FastJSONResponse(status_code=400, content={"error": str(e)})
+    except ExecutionTimeout:
+        return FastJSONResponse(
+            status_code=504,
+            content={
+                "error": "Duplicate scan exceeded its time budget; try a shorter range" # noqa
+            },
+        )
     except Exception as e:
         logging.error(f"Duplicates API error: {e}")
-        return JSONResponse(status_code=500, content={"error": str(e)})
+        return FastJSONResponse(status_code=500, content={"error": str(e)})
 
 
 # Missing data
 @app.get("/api/missing-intervals")
 async def missing_intervals(
-    device_id: str = Query(...), start: str = Query(...), end: str = Query(...)
+    request: Request,
+    device_id: str = Query(...),
+    start: str = Query(...),
+    end: str = Query(...),
+    interval_minutes: int = Query(5, ge=1, le=1440),
+    tolerance: int = Query(0, ge=0),
+    server_side: bool = False,
+    format: str = "json",
 ):
     # 1) Parse inputs
     try:
-        start_dt = datetime.strptime(start, "%Y-%m-%d %H:%M:%S")
-        end_dt = datetime.strptime(end, "%Y-%m-%d %H:%M:%S")
-        dev_uuid = uuid.UUID(device_id)
-        bin_dev = Binary.from_uuid(dev_uuid, UuidRepresentation.STANDARD)
+        query, _, _ = build_range_query(device_id, start, end)
     except Exception as e:
         raise HTTPException(400, f"Invalid inputs: {e}")
 
-    # 2) Query MongoDB on devicetime
-    client = MongoClient(MONGO_URI, uuidRepresentation="standard")
-    col = client[DB_NAME][COLLECTION_NAME]
-    records = list(
-        col.find(
-            {
-                "deviceid": bin_dev,
-                "devicetime": {"$gte": start_dt, "$lte": end_dt},
-            }  # noqa
+    if format == "ndjson":
+        # Constant-memory scan; intervals are emitted as they are closed
+        return StreamingResponse(
+            iter_scan_ndjson(query, GapScanner(interval_minutes, tolerance)),
+            media_type="application/x-ndjson",
         )
-    )
+    if format != "json":
+        raise HTTPException(400, f"Unsupported format: {format}")
 
-    # print(f"📦 Retrieved {len(records)} records (using devicetime)")
+    # Both scan modes give the same answer, so they share an entry
+    key = _settled_result_key(
+        "missing-intervals", device_id, start, end,
+        interval_minutes=interval_minutes, tolerance=tolerance,
+    )
+    cached = await _cached_result(request, key)
+    if cached is not None:
+        return cached
+
+    # 2) Scan devicetime (or server-side slot occupancy) and find gaps
+    if server_side:
+        slots = await get_occupied_slots(query, interval_minutes)
+        missing = (
+            find_missing_intervals_from_slots(slots, interval_minutes, tolerance) # noqa
+            if slots.size
+            else None
+        )
+    else:
+        times = await get_devicetimes(query)
+        missing = (
+            find_missing_runs(times, interval_minutes, tolerance)
+            if times.size
+            else None
+        )
 
-    if not records:
-        return {
+    if missing is None:
+        result = {
             "device_id": device_id,
             "start": start,
             "end": end,
             "count": 0,
             "message": "No records found",
         }
+    else:
+        result = {
+            "device_id": device_id,
+            "start": start,
+            "end": end,
+            "interval_minutes": interval_minutes,
+            "count": len(missing),
+            "missing_slots": sum(run["missing_slots"] for run in missing),
+            "missing_intervals": missing,
+        }
 
-    # 3) Detect missing intervals
-    missing = find_missing_intervals(records)
-
-    return {
-        "device_id": device_id,
-        "start": start,
-        "end": end,
-        "count": len(missing),
-        "missing_intervals": missing,
-    }
-
+    if key:
+        return await _store_result(request, key, result)
+    return result
 
-def _get_all_device_status_sync():
-    """Fast device status check using single aggregation query with caching"""
-    global _device_status_cache
-
-    # Check cache first
-    current_time = time.time()
-    if (
-        _device_status_cache["data"] is not None
-        and current_time - _device_status_cache["timestamp"] < CACHE_DURATION
-    ):
-        logging.info("Returning cached device status data")
-        return _device_status_cache["data"]
 
-    try:
-        logging.info("Fetching ALL device status data from database...")
-        client = get_mongo_client()
-        db = client[DB_NAME]
-        collection = db[COLLECTION_NAME]
+def _aggregate_all_device_status(now):
+    """Full-collection status scan, used until the summary has been built"""
+    collection = get_mongo_client()[DB_NAME][COLLECTION_NAME]
 
-        now = datetime.utcnow()
-        one_hour_ago = now - timedelta(hours=1)
-
-        # First, get total count of unique devices for logging
-        total_devices = len(collection.distinct("data.devId"))
-        logging.info(f"Found {total_devices} unique devices in database")
-
-        # Get ALL devices from the database - no limits, fetch everything
-        all_devices_pipeline = [
-            {
-                "$group": {
-                    "_id": "$data.devId",
-                    "latest_time": {"$max": "$devicetime"},
-                    "first_seen": {"$min": "$devicetime"},
-                    "record_count": {"$sum": 1},
-                }
-            },
-            {
-                "$project": {
-                    "device_id": {"$toString": "$_id"},
-                    "latest_time": 1,
-                    "first_seen": 1,
-                    "record_count": 1,
-                    "status": {
-                        "$cond": {
-                            "if": {"$gte": ["$latest_time", one_hour_ago]},
-                            "then": "Active",
-                            "else": "Inactive",
-                        }
-                    },
-                    "hours_since_last_seen": {
-                        "$divide": [
-                            {"$subtract": [now, "$latest_time"]},
-                            3600000,  # Convert milliseconds to hours
-                        ]
-                    },
-                }
-            },
-            {
-                "$sort": {
-                    "status": 1,
-                    "latest_time": -1,
-                }  # Active first, then by latest activity
-            },
-            # NO LIMIT - fetch ALL devices in the database
-        ]
-
-        # Execute the aggregation to get all devices
-        results = list(collection.aggregate(all_devices_pipeline))
-
-        # Format the results with more detailed information
-        formatted_results = []
-        for result in results:
-            latest_time = result["latest_time"]
-            hours_since_last = result.get("hours_since_last_seen", 0)
-
-            device_data = {
-                "device_id": result["device_id"],
-                "status": result["status"],
-                "latest_time": latest_time.strftime("%Y-%m-%d %H:%M:%S"),
-                "hours_since_last": round(hours_since_last, 1),
-                "record_count": result["record_count"],
-                "first_seen": (
-                    result["first_seen"].strftime("%Y-%m-%d %H:%M:%S")
-                    if result.get("first_seen")
-                    else "Unknown"
-                ),
+    all_devices_pipeline = [
+        {
+            "$group": {
+                "_id": "$data.devId",
+                "latest_time": {"$max": "$devicetime"},
+                "first_seen": {"$min": "$devicetime"},
+                "record_count": {"$sum": 1},
             }
+        },
+        {"$match": {"_id": {"$ne": None}}},
+    ]
+
+    rows = [
+        format_status_row(
+            str(result["_id"]),
+            result["latest_time"],
+            result.get("first_seen"),
+            result["record_count"],
+            now,
+        )
+        for result in collection.aggregate(all_devices_pipeline)
+    ]
+    return sort_status_rows(rows)
 
-            # Set inactive start/end times
-            if result["status"] == "Inactive":
-                device_data["inactive_start"] = latest_time.strftime(
-                    "%Y-%m-%d %H:%M"
-                )  # noqa
-                device_data["inactive_end"] = "Ongoing"
-
-                # Calculate how long it's been inactive
-                if hours_since_last < 24:
-                    device_data["inactive_duration"] = (
-                        f"{round(hours_since_last, 1)} hours"
-                    )
-                else:
-                    days = round(hours_since_last / 24, 1)
-                    device_data["inactive_duration"] = f"{days} days"
-            else:
-                device_data["inactive_start"] = "-"
-                device_data["inactive_end"] = "-"
-                device_data["inactive_duration"] = "-"
 
-            formatted_results.append(device_data)
+def _get_all_device_status_sync():
+    """Device status for the whole fleet, read from the status summary"""
+    logging.info("Fetching ALL device status data...")
+    now = datetime.utcnow()
+    if summary_is_ready():
+        formatted_results = read_fleet_status(now)
+    else:
+        logging.info("Status summary not built yet, scanning ALL device data...") # noqa
+        formatted_results = _aggregate_all_device_status(now)
 
-        # Cache the results
-        _device_status_cache["data"] = formatted_results
-        _device_status_cache["timestamp"] = current_time
+    active_count = len(
+        [d for d in formatted_results if d["status"] == "Active"]
+    )  # noqa
+    inactive_count = len(formatted_results) - active_count
 
-        active_count = len(
-            [d for d in formatted_results if d["status"] == "Active"]
-        )  # noqa
-        inactive_count = len(formatted_results) - active_count
+    logging.info(
+        f"Successfully fetched ALL {len(formatted_results)} devices: {active_count} active, {inactive_count} inactive"  # noqa
+    )
+    return formatted_results
 
-        logging.info(
-            f"Successfully fetched ALL {len(formatted_results)} devices: {active_count} active, {inactive_count} inactive"  # noqa
-        )
-        return formatted_results
 
-    except Exception as e:
-        logging.error(f"Device status error: {e}")
-        return []
+_device_status_cache = StaleWhileRevalidateCache(
+    _get_all_device_status_sync, ttl=CACHE_DURATION, name="Device status cache" # noqa
+)
 
 
 # API to get active/inactive status and intervals
@@ -494,11 +757,8 @@ async def get_all_device_status():
     try:
         start_time = time.time()
 
-        # Run in thread pool to avoid blocking
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(
-            _thread_pool, _get_all_device_status_sync
-        )  # noqa
+        # Served from cache; only a cold start waits for the shared load
+        result = await _device_status_cache.get_async()
 
         end_time = time.time()
         execution_time = end_time - start_time
@@ -507,386 +767,29 @@ async def get_all_device_status():
             f"Device status API completed in {execution_time:.2f} seconds"
         )  # noqa
 
-        return JSONResponse(content=jsonable_encoder(result))
+        return FastJSONResponse(content=result)
 
     except Exception as e:
         logging.error(f"All device status API error: {e}")
-        return JSONResponse(content=[])
+        return FastJSONResponse(content=[])
 
 
 @app.post("/api/clear-device-status-cache")
 async def clear_device_status_cache():
     """Clear the device status cache to force fresh data"""
-    global _device_status_cache
-    _device_status_cache = {"data": None, "timestamp": 0}
-    return JSONResponse(content={"message": "Cache cleared successfully"})
-
-
-# ============================================================================
-# EMAIL SCHEDULING FUNCTIONS (Integrated from main.py)
-# ============================================================================
-matplotlib.use("Agg")  # Use non-interactive backend
-
-
-def fetch_data_for_email(device_id):
-    """Fetch last 24 hours of data for email reports"""
-    try:
-        client = get_mongo_client()
-        db = client[DB_NAME]
-        collection = db[COLLECTION_NAME]
-
-        # Calculate time range (last 24 hours)
-        end_time = datetime.utcnow()
-        start_time = end_time - timedelta(hours=24)
-
-        # Convert device_id to binary UUID for querying
-        device_uuid = uuid.UUID(device_id)
-        device_id_binary = Binary.from_uuid(
-            device_uuid, UuidRepresentation.STANDARD
-        )  # noqa
-
-        # Query for the device data
-        query = {
-            "deviceid": device_id_binary,
-            "devicetime": {"$gte": start_time, "$lte": end_time},
-        }
-
-        # Fetch records
-        cursor = collection.find(query).sort("devicetime", 1)
-        records = list(cursor)
-
-        logging.info(f"Fetched {len(records)} records for device {device_id}")
-        return records
-
-    except Exception as e:
-        logging.error(f"Error fetching data for device {device_id}: {e}")
-        return []
-
-
-def get_battery_status_for_email(records):
-    """Extract battery status information from records"""
-    if not records:
-        return {"status": "No data", "voltage": "N/A", "power_on": "N/A"}
-
-    # Get the latest battery info
-    latest_record = max(
-        records, key=lambda x: x.get("devicetime", datetime.min)
-    )  # noqa
-    binfo = latest_record.get("data", {}).get("binfo", {})
-
-    voltage = binfo.get("bvt", 0)
-    power_on = binfo.get("bpon", 0)
-
-    # Determine battery status based on voltage
-    if voltage >= 3.7:
-        status = "Good"
-        status_color = "green"
-    elif voltage >= 3.4:
-        status = "Low"
-        status_color = "orange"
-    elif voltage > 0:
-        status = "Critical"
-        status_color = "red"
-    else:
-        status = "Unknown"
-        status_color = "gray"
-
-    return {
-        "status": status,
-        "voltage": f"{voltage:.2f}V" if voltage > 0 else "N/A",
-        "power_on": "Yes" if power_on else "No",
-        "status_color": status_color,
-    }
-
-
-def generate_chart_for_email(records, device_id):
-    """Generate chart for email reports"""
-    try:
-        df = pd.DataFrame(records)
-        if df.empty:
-            return None
-
-        df["devicetime"] = pd.to_datetime(df["devicetime"], errors="coerce")
-        df = df.dropna(subset=["devicetime"])
-        df["hour"] = df["devicetime"].dt.floor("h")
-        df["csm"] = df["data"].apply(
-            lambda x: (
-                x.get("evt", {}).get("csm", 0) if isinstance(x, dict) else 0
-            )  # noqa
-        )
+    _device_status_cache.invalidate()
+    _device_status_cache.refresh()
+    return FastJSONResponse(content={"message": "Cache cleared successfully"})
 
-        hourly = df.groupby("hour")["csm"].sum().reset_index()
 
-        # Create figure with subplots for consumption and battery info
-        fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(10, 6))
+@app.get("/api/device-status-cache-stats")
+async def get_device_status_cache_stats():
+    return FastJSONResponse(content=_device_status_cache.stats())
 
-        # Consumption chart
-        ax1.bar(
-            hourly["hour"].dt.strftime("%H:%M"), hourly["csm"], color="skyblue"
-        )  # noqa
-        ax1.set_title(f"Hourly Consumption - {device_id}", fontsize=11)
-        ax1.set_xlabel("Hour")
-        ax1.set_ylabel("Total CSM")
-        ax1.tick_params(axis="x", rotation=45)
-
-        # Battery status chart
-        battery_info = get_battery_status_for_email(records)
-        df["bvt"] = df["data"].apply(
-            lambda x: (
-                x.get("binfo", {}).get("bvt", 0) if isinstance(x, dict) else 0
-            )  # noqa
-        )
-
-        # Plot battery voltage over time (hourly average)
-        battery_hourly = df.groupby("hour")["bvt"].mean().reset_index()
-        if not battery_hourly.empty:
-            ax2.plot(
-                battery_hourly["hour"].dt.strftime("%H:%M"),
-                battery_hourly["bvt"],
-                color="green",
-                marker="o",
-                linewidth=2,
-            )
-            ax2.set_title(
-                f"Battery Voltage Over Time - {device_id}", fontsize=11
-            )  # noqa
-            ax2.set_xlabel("Hour")
-            ax2.set_ylabel("Voltage (V)")
-            ax2.tick_params(axis="x", rotation=45)
-            ax2.grid(True, alpha=0.3)
-
-            # Add battery status text
-            ax2.text(
-                0.02,
-                0.98,
-                f"Current Status: {battery_info['status']} ({battery_info['voltage']})",  # noqa
-                transform=ax2.transAxes,
-                verticalalignment="top",
-                bbox=dict(
-                    boxstyle="round",
-                    facecolor=battery_info["status_color"],
-                    alpha=0.3,  # noqa
-                ),
-            )
-
-        buf = io.BytesIO()
-        plt.tight_layout()
-        plt.savefig(buf, format="png", dpi=CHART_DPI, bbox_inches="tight")
-        buf.seek(0)
-        plt.close(fig)  # Close the figure to free memory
-        return buf
 
-    except Exception as e:
-        logging.error(f"Error generating chart: {e}")
-        return None
-
-
-def generate_csv_for_email(records):
-    """Generate CSV data for email attachment"""
-    try:
-        if not records:
-            return None
-
-        # Convert to DataFrame and format for CSV
-        # df = pd.DataFrame(records)
-
-        # Select and rename columns for CSV
-        csv_data = []
-        for record in records:
-            row = {
-                "devicetime": record.get("devicetime", ""),
-                "device_id": record.get("deviceid", ""),
-                "etm": record.get("data", {}).get("evt", {}).get("etm", ""),
-                "csm": record.get("data", {}).get("evt", {}).get("csm", ""),
-                "battery_voltage": record.get("data", {})
-                .get("binfo", {})
-                .get("bvt", ""),
-                "battery_power": record.get("data", {})
-                .get("binfo", {})
-                .get("bpon", ""),
-            }
-            csv_data.append(row)
-
-        # Convert to CSV
-        df_csv = pd.DataFrame(csv_data)
-        csv_buffer = io.StringIO()
-        df_csv.to_csv(csv_buffer, index=False)
-        csv_buffer.seek(0)
-
-        return csv_buffer
-
-    except Exception as e:
-        logging.error(f"Error generating CSV: {e}")
-        return None
-
-
-def send_email_report(
-    to_email, device_id, chart_buf, csv_buf=None, battery_info=None
-):  # noqa
-    """Send email report with chart and data"""
-    try:
-        logging.info(f"📧 Preparing email for {device_id} to {to_email}")
-
-        msg = EmailMessage()
-        msg["Subject"] = (
-            f"Daily Report for Device {device_id} - {datetime.now().strftime('%Y-%m-%d')}"  # noqa
-        )
-        msg["From"] = EMAIL_ADDRESS
-        msg["To"] = to_email
-
-        logging.info(f"📧 Email headers set for {device_id}")
-
-        # Enhanced email content with battery status
-        battery_section = ""
-        if battery_info:
-            battery_section = f"""
-
-        BATTERY STATUS:
-        - Status: {battery_info['status']}
-        - Voltage: {battery_info['voltage']}
-        - Power On: {battery_info['power_on']}
-        """
-
-        email_content = f"""
-        Daily Device Report - {datetime.now().strftime('%Y-%m-%d')}
-
-        Device ID: {device_id}
-        Report Period: Last 24 hours
-        Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-        {battery_section}
-
-        Please find attached:
-        - Hourly consumption and battery voltage chart (PNG)
-        - Raw data export including battery info (CSV)
-
-        This is an automated report sent every 24 hours.
-
-        Best regards,
-        Aquesa Data Monitor System
-        """
-
-        msg.set_content(email_content)
-        logging.info(f"📧 Email content set for {device_id}")
-
-        # Attach chart image
-        if chart_buf:
-            try:
-                chart_data = chart_buf.read()
-                chart_filename = (
-                    f"chart_{device_id}_{datetime.now().strftime('%Y%m%d')}.png"  # noqa
-                )
-                msg.add_attachment(
-                    chart_data,
-                    maintype="image",
-                    subtype="png",
-                    filename=chart_filename,  # noqa
-                )
-                chart_buf.seek(0)
-                logging.info(
-                    f"📊 Chart attached for {device_id} ({len(chart_data)} bytes)"  # noqa
-                )
-            except Exception as e:
-                logging.error(f"❌ Failed to attach chart for {device_id}: {e}")
-
-        # Attach CSV if provided
-        if csv_buf:
-            try:
-                csv_data = csv_buf.getvalue()  # Use getvalue() for StringIO
-                csv_filename = (
-                    f"data_{device_id}_{datetime.now().strftime('%Y%m%d')}.csv"
-                )
-                msg.add_attachment(
-                    csv_data.encode("utf-8"),
-                    maintype="text",
-                    subtype="csv",
-                    filename=csv_filename,
-                )
-                csv_buf.seek(0)
-                logging.info(
-                    f"📄 CSV attached for {device_id} ({len(csv_data)} chars)"
-                )  # noqa
-            except Exception as e:
-                logging.error(f"❌ Failed to attach CSV for {device_id}: {e}")
-
-        # Send email
-        logging.info(f"📤 Connecting to SMTP server for {device_id}")
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as smtp:
-            smtp.starttls()
-            logging.info(f"🔐 SMTP TLS started for {device_id}")
-            smtp.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
-            logging.info(f"🔑 SMTP login successful for {device_id}")
-            smtp.send_message(msg)
-            logging.info(f"📨 Email message sent for {device_id}")
-
-        logging.info(
-            f"✅ Email sent successfully to {to_email} for device {device_id}"
-        )  # noqa
-        return True
-
-    except Exception as e:
-        logging.error(
-            f"❌ Failed to send email to {to_email} for device {device_id}: {e}"
-        )
-        logging.error(f"❌ Error type: {type(e).__name__}")
-        import traceback
-
-        logging.error(f"❌ Full traceback: {traceback.format_exc()}")
-        return False
-
-
-def process_and_send_emails():
-    """Process and send emails for all configured devices"""
-    logging.info(f"⏰ Running scheduled email at {datetime.now()}")
-
-    for device_id, email in DEVICE_EMAIL_MAP.items():
-        try:
-            logging.info(f"📧 Processing device: {device_id}")
-
-            # Fetch data
-            records = fetch_data_for_email(device_id)
-            if not records:
-                logging.warning(f"⚠️ No data found for {device_id}")
-                continue
-
-            # Generate chart
-            chart = generate_chart_for_email(records, device_id)
-            if not chart:
-                logging.warning(f"⚠️ No chart generated for {device_id}")
-                continue
-
-            # Generate CSV
-            csv_data = generate_csv_for_email(records)
-
-            # Get battery info
-            battery_info = get_battery_status_for_email(records)
-
-            # Send email
-            if send_email_report(
-                email, device_id, chart, csv_data, battery_info
-            ):  # noqa
-                logging.info(
-                    f"✅ Report sent for {device_id} - Battery: {battery_info['status']} ({battery_info['voltage']})"  # noqa
-                )
-            else:
-                logging.error(f"❌ Failed to send report for {device_id}")
-
-        except Exception as e:
-            logging.error(f"❌ Error processing device {device_id}: {e}")
-
-
-def run_email_scheduler():
-    """Background thread function to run the email scheduler"""
-    # Schedule daily reports
-    schedule.every().day.at(SCHEDULE_TIME).do(process_and_send_emails)
-
-    logging.info(
-        f"📅 Email scheduler started - reports will be sent daily at {SCHEDULE_TIME}"  # noqa
-    )
-    logging.info(f"📋 Configured devices: {list(DEVICE_EMAIL_MAP.keys())}")
-
-    while True:
-        schedule.run_pending()
-        time.sleep(60)  # Check every minute
+@app.get("/api/result-cache-stats")
+async def get_result_cache_stats():
+    return FastJSONResponse(content=get_result_cache().stats())
 
 
 # ============================================================================
@@ -907,7 +810,7 @@ async def get_email_scheduler_status():
     if jobs:
         next_run = min(job.next_run for job in jobs).isoformat()
 
-    return JSONResponse(
+    return FastJSONResponse(
         content={
             "scheduler_running": is_running,
             "next_scheduled_run": next_run,
@@ -923,13 +826,17 @@ async def send_test_email(device_id: str = None):
     """Manually trigger email sending for testing"""
     try:
         if not device_id:
-            # Send to all devices
-            loop = asyncio.get_event_loop()
-            await loop.run_in_executor(_thread_pool, process_and_send_emails)
-            return JSONResponse(
+            # Same pipeline as the schedule, but not deduplicated against
+            # today's outbox entries, so a test always sends
+            summary = await run_email_pipeline(force=True)
+            return FastJSONResponse(
                 content={
-                    "message": "Test emails sent to all configured devices",
-                    "devices_processed": len(DEVICE_EMAIL_MAP),
+                    "message": f"Test emails sent to {summary['sent']} of {summary['devices']} configured devices", # noqa
+                    "devices_processed": summary["devices"],
+                    "sent": summary["sent"],
+                    "skipped": summary["skipped"],
+                    "failed": summary["failed"],
+                    "summary": summary,
                 }
             )
         else:
@@ -941,27 +848,11 @@ async def send_test_email(device_id: str = None):
                 )
 
             email = DEVICE_EMAIL_MAP[device_id]
-
-            def send_single_test_email():
-                records = fetch_data_for_email(device_id)
-                if not records:
-                    return False
-
-                chart = generate_chart_for_email(records, device_id)
-                csv_data = generate_csv_for_email(records)
-                battery_info = get_battery_status_for_email(records)
-
-                return send_email_report(
-                    email, device_id, chart, csv_data, battery_info
-                )
-
-            loop = asyncio.get_event_loop()
-            success = await loop.run_in_executor(
-                _thread_pool, send_single_test_email
-            )  # noqa
+            summary = await run_email_pipeline({device_id: email}, force=True)
+            success = device_id in summary["delivered"]
 
             if success:
-                return JSONResponse(
+                return FastJSONResponse(
                     content={
                         "message": f"Test email sent successfully to {email}",
                         "device_id": device_id,
@@ -990,19 +881,12 @@ class DeviceStatusResponse(BaseModel):
     inactive_since: datetime | None = None
 
 
-def _check_single_device_status_sync(device_id: str):
-    """Synchronous single device status check"""
+async def _check_single_device_status(device_id: str):
+    """Single device status check"""
     try:
-        client = get_mongo_client()
-        db = client[DB_NAME]
-        collection = db[COLLECTION_NAME]
-
         # Convert device_id to proper format for querying
         try:
-            device_uuid = uuid.UUID(device_id)
-            device_id_binary = Binary.from_uuid(
-                device_uuid, UuidRepresentation.STANDARD
-            )
+            device_id_binary = device_id_to_binary(device_id)
         except ValueError:
             # If not a valid UUID, try searching by data.devId string field
             device_id_binary = None
@@ -1019,7 +903,7 @@ def _check_single_device_status_sync(device_id: str):
 
         latest = None
         for query in query_options:
-            latest = collection.find_one(query, sort=[("devicetime", -1)])
+            latest = await get_latest_record(query, {"devicetime": 1})
             if latest:
                 break
 
@@ -1060,11 +944,7 @@ def _check_single_device_status_sync(device_id: str):
 @app.get("/api/device-status", response_model=DeviceStatusResponse)
 async def check_device_status(device_id: str):
     try:
-        # Run in thread pool to avoid blocking
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(
-            _thread_pool, _check_single_device_status_sync, device_id
-        )
+        result = await _check_single_device_status(device_id)
 
         if result is None:
             raise HTTPException(
@@ -1081,23 +961,15 @@ async def check_device_status(device_id: str):
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
 
-def _get_battery_status_sync(device_id):
-    """Synchronous battery status check for thread pool execution"""
+async def _get_battery_status(device_id):
+    """Battery status from the device's most recent record"""
     try:
-        client = get_mongo_client()
-        db = client[DB_NAME]
-        collection = db[COLLECTION_NAME]
-
-        device_id_uuid = uuid.UUID(device_id)
-        device_id_binary = Binary.from_uuid(
-            device_id_uuid, UuidRepresentation.STANDARD
-        )  # noqa
+        device_id_binary = device_id_to_binary(device_id)
 
         # Get the most recent record with battery info
-        latest = collection.find_one(
+        latest = await get_latest_record(
             {"deviceid": device_id_binary},
             {"data.binfo.bvt": 1, "data.binfo.bpon": 1, "devicetime": 1},
-            sort=[("devicetime", -1)],
         )
 
         if not latest:
@@ -1131,8 +1003,10 @@ def _get_battery_status_sync(device_id):
             "last_update": last_update.isoformat() if last_update else None,
         }
 
+    except ValueError:
+        raise
     except Exception as e:
-        logging.error(f"Battery status sync error: {e}")
+        logging.error(f"Battery status error: {e}")
         return None
 
 
@@ -1140,18 +1014,14 @@ def _get_battery_status_sync(device_id):
 async def get_battery_status(device_id: str = Query(...)):
     """Get battery status for a specific device"""
     try:
-        # Run in thread pool to avoid blocking
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(
-            _thread_pool, _get_battery_status_sync, device_id
-        )
+        result = await _get_battery_status(device_id)
 
         if result is None:
             raise HTTPException(
                 status_code=404, detail="No data found for device"
             )  # noqa
 
-        return JSONResponse(content=result)
+        return FastJSONResponse(content=result)
 
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid device ID format")
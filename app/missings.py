@@ -1,46 +1,117 @@
-from datetime import timedelta
+import numpy as np
 import pandas as pd
 
+_NS_PER_MINUTE = 60 * 10**9
 
-def floor_to_5min(dt):
-    return dt - timedelta(
-        minutes=dt.minute % 5,
-        seconds=dt.second,
-        microseconds=dt.microsecond
-    )
 
+def to_slot_ids(times, interval_minutes=5):
+    """Integer slot number since the epoch for each timestamp"""
+    ns = np.asarray(times, dtype="datetime64[ns]").astype(np.int64)
+    return ns // (interval_minutes * _NS_PER_MINUTE)
 
-def find_missing_intervals(data, interval_minutes=5):
-    # Build DataFrame from raw Mongo documents
-    df = pd.DataFrame(data)
 
-    # Parse 'devicetime' (assumed stored as ISODate)
-    df["devicetime"] = pd.to_datetime(df["devicetime"])
+def _unique_sorted(slot_ids):
+    # Mongo hands us sorted data, so skip the sort when we can
+    slots = np.asarray(slot_ids, dtype=np.int64)
+    if slots.size and np.all(slots[1:] >= slots[:-1]):
+        keep = np.empty(slots.size, dtype=bool)
+        keep[0] = True
+        np.not_equal(slots[1:], slots[:-1], out=keep[1:])
+        return slots[keep]
+    return np.unique(slots)
 
-    # Floor every timestamp to nearest 5‑minute mark
-    df["ts_floor"] = df["devicetime"].apply(floor_to_5min)
 
-    # Sort
-    df = df.sort_values("ts_floor").reset_index(drop=True)
+def find_gap_runs(slot_ids, tolerance_slots=0):
+    """
+    Merge missing slots into runs with a single diff.
 
-    # Debug: print what you're actually working with
-    # print("⏱️ Floored devicetimes:")
-    # print(df["ts_floor"].to_list())
+    Returns (first_missing_slot, missing_slot_count) arrays. Runs of at
+    most `tolerance_slots` missing slots are ignored.
+    """
+    slots = _unique_sorted(slot_ids)
+    if slots.size < 2:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
 
-    # Build the full expected timeline
-    start = df["ts_floor"].min()
-    end = df["ts_floor"].max()
-    expected = pd.date_range(start=start, end=end, freq=f"{interval_minutes}min") # noqa
+    steps = np.diff(slots)
+    is_gap = steps > tolerance_slots + 1
+    return slots[:-1][is_gap] + 1, steps[is_gap] - 1
 
-    found = set(df["ts_floor"])
-    missing = []
-    for t in expected:
-        if t not in found:
-            missing.append({
-                "missing_interval_start": t.strftime("%Y-%m-%d %H:%M:%S"),
-                "missing_interval_end":   (t + timedelta(minutes=interval_minutes)).strftime("%Y-%m-%d %H:%M:%S") # noqa
-            })
 
-    # print("🛑 Missing intervals:")
-    # print(missing)
-    return missing
+def format_gap_runs(first_slots, counts, interval_minutes=5):
+    """Turn gap runs into the API's interval dicts"""
+    step_ns = interval_minutes * _NS_PER_MINUTE
+    starts = pd.to_datetime(first_slots * step_ns).strftime("%Y-%m-%d %H:%M:%S") # noqa
+    ends = pd.to_datetime((first_slots + counts) * step_ns).strftime("%Y-%m-%d %H:%M:%S") # noqa
+    return [
+        {
+            "missing_interval_start": start,
+            "missing_interval_end": end,
+            "missing_slots": int(count),
+        }
+        for start, end, count in zip(starts, ends, counts)
+    ]
+
+
+def find_missing_runs(times, interval_minutes=5, tolerance_slots=0):
+    """Missing interval runs for an array of datetime64 timestamps"""
+    slot_ids = to_slot_ids(times, interval_minutes)
+    first_slots, counts = find_gap_runs(slot_ids, tolerance_slots)
+    return format_gap_runs(first_slots, counts, interval_minutes)
+
+
+def find_missing_intervals_from_slots(
+    slot_ids, interval_minutes=5, tolerance_slots=0
+):
+    """Missing interval runs for already-bucketed slot ids"""
+    first_slots, counts = find_gap_runs(slot_ids, tolerance_slots)
+    return format_gap_runs(first_slots, counts, interval_minutes)
+
+
+class GapScanner:
+    """
+    Single-pass gap detection over devicetime-sorted record batches.
+
+    Only the last occupied slot is carried between batches, so memory is
+    bounded by the batch size whatever the range length. `feed` returns
+    the runs closed by each batch in the API's interval format.
+    """
+
+    def __init__(self, interval_minutes=5, tolerance_slots=0):
+        self.interval_minutes = interval_minutes
+        self.tolerance_slots = tolerance_slots
+        self.records = 0
+        self.runs = 0
+        self.missing_slots = 0
+        self._last_slot = None
+
+    def feed(self, columns):
+        times = columns.devicetime[~np.isnat(columns.devicetime)]
+        self.records += times.size
+        if not times.size:
+            return []
+        slot_ids = to_slot_ids(times, self.interval_minutes)
+        if self._last_slot is not None:
+            slot_ids = np.concatenate(([self._last_slot], slot_ids))
+        self._last_slot = slot_ids[-1]
+
+        first_slots, counts = find_gap_runs(slot_ids, self.tolerance_slots)
+        self.runs += counts.size
+        self.missing_slots += int(counts.sum())
+        return format_gap_runs(first_slots, counts, self.interval_minutes)
+
+    def finish(self):
+        return []
+
+    def summary(self):
+        return {
+            "records": self.records,
+            "interval_minutes": self.interval_minutes,
+            "count": self.runs,
+            "missing_slots": self.missing_slots,
+        }
+
+
+def find_missing_intervals(columns, interval_minutes=5, tolerance_slots=0):
+    """Missing interval runs for decoded RecordColumns"""
+    return GapScanner(interval_minutes, tolerance_slots).feed(columns)
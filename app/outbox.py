@@ -0,0 +1,178 @@
+"""
+Durable on-disk outbox for email reports (SQLite).
+
+Rendered messages are stored before delivery under an idempotent key
+(device:report-date), so a crash or SMTP outage mid-run resumes by sending
+what is pending instead of re-rendering. Failed sends are retried with
+exponential backoff until EMAIL_MAX_ATTEMPTS, then parked as "dead".
+"""
+import sqlite3
+import threading
+import time
+from email import policy
+from email.parser import BytesParser
+
+from .config import (
+    EMAIL_OUTBOX_PATH,
+    EMAIL_RETRY_BASE_SECONDS,
+    EMAIL_RETRY_MAX_SECONDS,
+    EMAIL_MAX_ATTEMPTS,
+)
+
+PENDING = "pending"
+SENT = "sent"
+DEAD = "dead"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    key TEXT PRIMARY KEY,
+    device_id TEXT NOT NULL,
+    to_email TEXT NOT NULL,
+    message BLOB NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    sent_at REAL
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at);
+"""
+
+
+def report_key(device_id, report_date):
+    """Idempotency key for one device's report on one day"""
+    return f"{device_id}:{report_date.isoformat()}"
+
+
+def backoff_seconds(attempts):
+    """Delay before the next try after `attempts` failures"""
+    delay = EMAIL_RETRY_BASE_SECONDS * (2 ** max(0, attempts - 1))
+    return min(delay, EMAIL_RETRY_MAX_SECONDS)
+
+
+class EmailOutbox:
+    """SQLite-backed queue of rendered email messages"""
+
+    def __init__(self, path=EMAIL_OUTBOX_PATH, max_attempts=EMAIL_MAX_ATTEMPTS): # noqa
+        self.path = path
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def status_of(self, key):
+        """Current status for a key, or None if never enqueued"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status FROM outbox WHERE key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def enqueue(self, key, device_id, to_email, msg, now=None):
+        """Store a message for delivery; a key already present is kept as is"""
+        now = now or time.time()
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT OR IGNORE INTO outbox "
+                "(key, device_id, to_email, message, next_attempt_at, created_at) " # noqa
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, device_id, to_email, msg.as_bytes(), now, now),
+            )
+            self._conn.commit()
+        return cur.rowcount == 1
+
+    def claim_due(self, now=None, limit=100, lease_seconds=300):
+        """
+        Take pending messages whose retry time has passed.
+
+        Claimed rows are pushed out by `lease_seconds` so concurrent senders
+        skip them; if the process dies mid-send the lease simply expires.
+        """
+        now = now or time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, device_id, to_email, message, attempts FROM outbox " # noqa
+                "WHERE status = ? AND next_attempt_at <= ? "
+                "ORDER BY next_attempt_at LIMIT ?",
+                (PENDING, now, limit),
+            ).fetchall()
+            self._conn.executemany(
+                "UPDATE outbox SET next_attempt_at = ? WHERE key = ?",
+                [(now + lease_seconds, row[0]) for row in rows],
+            )
+            self._conn.commit()
+        return [
+            {
+                "key": key,
+                "device_id": device_id,
+                "to_email": to_email,
+                "message": BytesParser(policy=policy.SMTP).parsebytes(raw),
+                "attempts": attempts,
+            }
+            for key, device_id, to_email, raw, attempts in rows
+        ]
+
+    def next_due_at(self):
+        """Earliest retry time among pending messages, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(next_attempt_at) FROM outbox WHERE status = ?",
+                (PENDING,),
+            ).fetchone()
+        return row[0]
+
+    def mark_sent(self, key, now=None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE outbox SET status = ?, sent_at = ?, last_error = NULL "
+                "WHERE key = ?",
+                (SENT, now or time.time(), key),
+            )
+            self._conn.commit()
+
+    def mark_failed(self, key, error, now=None):
+        """Record a failed attempt and schedule the retry (or give up)"""
+        now = now or time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT attempts FROM outbox WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            attempts = row[0] + 1
+            status = DEAD if attempts >= self.max_attempts else PENDING
+            self._conn.execute(
+                "UPDATE outbox SET attempts = ?, status = ?, last_error = ?, "
+                "next_attempt_at = ? WHERE key = ?",
+                (attempts, status, str(error)[:500],
+                 now + backoff_seconds(attempts), key),
+            )
+            self._conn.commit()
+        return status
+
+    def stats(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) FROM outbox GROUP BY status"
+            ).fetchall()
+        counts = {PENDING: 0, SENT: 0, DEAD: 0}
+        counts.update(dict(rows))
+        return counts
+
+
+# Global outbox, opened on first use
+_outbox = None
+
+
+def get_outbox():
+    global _outbox
+    if _outbox is None:
+        _outbox = EmailOutbox()
+    return _outbox
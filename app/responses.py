@@ -0,0 +1,181 @@
+"""
+Fast JSON responses with gzip/brotli negotiation.
+
+Bodies are encoded with orjson, which handles datetime, UUID and numpy
+values natively, so records go out as read from MongoDB: only `deviceid`
+(a bson Binary) needs the `default` hook. Bodies larger than
+RESPONSE_COMPRESS_MIN_BYTES are then compressed for the client's
+Accept-Encoding: brotli (from requirements.txt) or gzip.
+
+Encoding a bulky payload and compressing a large body take tens to
+hundreds of milliseconds, so both are done in the threadpool when sending
+instead of on the event loop.
+"""
+import gzip
+from datetime import date, datetime
+from functools import lru_cache
+
+import orjson
+from bson import Binary, ObjectId
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response
+
+from .config import (
+    RESPONSE_COMPRESS_MIN_BYTES,
+    RESPONSE_OFFLOAD_MIN_BYTES,
+    RESPONSE_GZIP_LEVEL,
+    RESPONSE_BROTLI_QUALITY,
+)
+
+try:
+    import brotli
+except ImportError:  # not installed; gzip only
+    brotli = None
+
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+# Payloads holding a list at least this long (at the top level or as a
+# top-level value) are encoded in the threadpool; 1000 records is ~100 KB
+OFFLOAD_MIN_ITEMS = 1000
+
+# Placeholder body until a deferred payload has been encoded
+_DEFERRED = object()
+
+
+@lru_cache(maxsize=4096)
+def _binary_to_str(value):
+    try:
+        return str(value.as_uuid())
+    except ValueError:
+        return str(value)
+
+
+def _default(value):
+    """Types orjson doesn't know: bson ids and datetime subclasses"""
+    if isinstance(value, Binary):
+        return _binary_to_str(value)
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date)):  # e.g. pandas Timestamp
+        return value.isoformat()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(content):
+    """Serialize `content` to JSON bytes"""
+    return orjson.dumps(content, default=_default, option=ORJSON_OPTIONS)
+
+
+def available_encodings():
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def _accepted_codings(accept_encoding):
+    """Accept-Encoding header -> {coding: q}"""
+    accepted = {}
+    for item in (accept_encoding or "").split(","):
+        coding, _, params = item.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+def negotiate_encoding(accept_encoding):
+    """
+    Best supported content coding for an Accept-Encoding header, or None.
+
+    Codings with q=0 are refused; on equal q brotli wins over gzip.
+    """
+    accepted = _accepted_codings(accept_encoding)
+    best, best_q = None, 0.0
+    for coding in available_encodings():
+        q = accepted.get(coding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=RESPONSE_BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL)
+    return body
+
+
+def is_bulky(content):
+    """True when encoding `content` is worth a trip to the threadpool"""
+    if isinstance(content, dict):
+        return any(
+            isinstance(value, list) and len(value) >= OFFLOAD_MIN_ITEMS
+            for value in content.values()
+        )
+    return isinstance(content, list) and len(content) >= OFFLOAD_MIN_ITEMS
+
+
+class FastJSONResponse(Response):
+    """orjson-encoded JSON, compressed per request when it pays off"""
+
+    media_type = "application/json"
+
+    def __init__(self, content=None, *args, **kwargs):
+        # Bulky payloads are encoded when sent, off the event loop
+        self._content = _DEFERRED
+        if is_bulky(content):
+            self._content, content = content, _DEFERRED
+        super().__init__(content, *args, **kwargs)
+
+    def render(self, content):
+        if content is _DEFERRED:
+            return b""
+        return dumps(content)
+
+    def _finish_body(self, encoding):
+        """Encode a deferred payload and compress the body for `encoding`"""
+        if self._content is not _DEFERRED:
+            self.body, self._content = dumps(self._content), _DEFERRED
+        if encoding is not None and len(self.body) >= RESPONSE_COMPRESS_MIN_BYTES: # noqa
+            self.body = compress(self.body, encoding)
+            self.headers["content-encoding"] = encoding
+        self.headers["content-length"] = str(len(self.body))
+
+    async def __call__(self, scope, receive, send):
+        encoding = None
+        if "content-encoding" not in self.headers:
+            headers = dict(scope.get("headers") or [])
+            encoding = negotiate_encoding(
+                headers.get(b"accept-encoding", b"").decode("latin-1")
+            )
+            self.headers["vary"] = "Accept-Encoding"
+        if self._content is not _DEFERRED or len(self.body) >= RESPONSE_OFFLOAD_MIN_BYTES: # noqa
+            await run_in_threadpool(self._finish_body, encoding)
+        else:
+            self._finish_body(encoding)
+        await super().__call__(scope, receive, send)
+
+
+def gzipped_json_response(body, accept_encoding, status_code=200):
+    """
+    Response for an already gzip-compressed JSON body.
+
+    Sent as is when the client accepts gzip, decompressed otherwise.
+    """
+    accepted = _accepted_codings(accept_encoding)
+    headers = {"vary": "Accept-Encoding"}
+    if accepted.get("gzip", accepted.get("*", 0.0)) > 0:
+        headers["content-encoding"] = "gzip"
+    else:
+        body = gzip.decompress(body)
+    return Response(
+        content=body,
+        status_code=status_code,
+        media_type="application/json",
+        headers=headers,
+    )
@@ -0,0 +1,163 @@
+"""
+Persistent on-disk cache of API results for closed ranges (SQLite).
+
+Once a range ends before the ingest settle window its records no longer
+change, so the JSON for get-data, find-duplicates and missing-intervals
+is stored gzip-compressed under (endpoint, device, range, params) and
+served from disk on later requests, across restarts. Total size is capped
+at RESULT_CACHE_MAX_BYTES by evicting the least recently used entries.
+
+Reads don't write: hit times are kept in memory and flushed to `used_at`
+in one statement every TOUCH_FLUSH_SECONDS (or TOUCH_BATCH hits, or
+before an eviction), so LRU order is only that coarse. Calls block on
+SQLite and gzip; async code runs them in an executor.
+"""
+import gzip
+import sqlite3
+import threading
+import time
+
+from .config import RESULT_CACHE_PATH, RESULT_CACHE_MAX_BYTES, RESPONSE_GZIP_LEVEL # noqa
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    body BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_used ON results (used_at);
+"""
+TOUCH_FLUSH_SECONDS = 60
+TOUCH_BATCH = 256
+
+
+def result_key(endpoint, device_id, start, end, **params):
+    """Cache key for one endpoint's result over [start, end]"""
+    extra = "&".join(f"{name}={params[name]}" for name in sorted(params))
+    return f"{endpoint}|{device_id}|{start}|{end}|{extra}"
+
+
+class ResultCache:
+    """SQLite-backed LRU of gzip-compressed JSON bodies bounded by bytes"""
+
+    def __init__(self, path=RESULT_CACHE_PATH, max_bytes=RESULT_CACHE_MAX_BYTES): # noqa
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+        self._size = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM results"
+        ).fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._touched = {}  # key -> last hit time, not yet in used_at
+        self._flushed_at = time.time()
+
+    def close(self):
+        with self._lock:
+            self._flush_touches()
+            self._conn.commit()
+            self._conn.close()
+
+    def _flush_touches(self, now=None):
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE results SET used_at = ? WHERE key = ?",
+                [(used_at, key) for key, used_at in self._touched.items()],
+            )
+            self._touched.clear()
+        self._flushed_at = now or time.time()
+
+    def get(self, key, now=None):
+        """Compressed body for `key`, or None"""
+        now = now or time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._touched[key] = now
+            if len(self._touched) >= TOUCH_BATCH or now - self._flushed_at >= TOUCH_FLUSH_SECONDS: # noqa
+                self._flush_touches(now)
+                self._conn.commit()
+        return row[0]
+
+    def put(self, key, body, now=None):
+        """Compress and store a JSON body; returns the compressed bytes"""
+        compressed = gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL)
+        if len(compressed) > self.max_bytes:
+            return compressed
+        now = now or time.time()
+        with self._lock:
+            # Eviction below must see the latest hit times
+            self._flush_touches(now)
+            previous = self._conn.execute(
+                "SELECT size FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results "
+                "(key, body, size, created_at, used_at) VALUES (?, ?, ?, ?, ?)", # noqa
+                (key, compressed, len(compressed), now, now),
+            )
+            self._size += len(compressed) - (previous[0] if previous else 0)
+            self._evict()
+            self._conn.commit()
+        return compressed
+
+    def _evict(self):
+        while self._size > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT key, size FROM results ORDER BY used_at LIMIT 32"
+            ).fetchall()
+            if not rows:
+                self._size = 0
+                return
+            for key, size in rows:
+                if self._size <= self.max_bytes:
+                    break
+                self._conn.execute("DELETE FROM results WHERE key = ?", (key,)) # noqa
+                self._size -= size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM results")
+            self._conn.commit()
+            self._touched.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute(
+                "SELECT COUNT(*) FROM results"
+            ).fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0, # noqa
+            }
+
+
+# Global cache, opened on first use
+_result_cache = None
+
+
+def get_result_cache():
+    global _result_cache
+    if _result_cache is None:
+        _result_cache = ResultCache()
+    return _result_cache
@@ -0,0 +1,393 @@
+"""
+Per-device hourly and daily rollups maintained incrementally from raw data.
+
+Each rollup row holds, for one device and bucket: the csm sum, bvt
+min/mean/max, the share of records with battery power on, the record and
+duplicate counts, and the last battery reading. A background job rebuilds
+whole buckets with `$merge`, so every pass is idempotent:
+
+* only hours older than INGEST_SETTLE_SECONDS are rolled up, so a row
+  never misses a late ingest;
+* hours before the stored `settled_through` watermark are final and are
+  never recomputed;
+* days touched by a pass are re-derived from their hourly rows.
+
+Readers use rollup rows for buckets that lie fully inside the requested
+range and before `settled_through`, and aggregate raw data only for the
+partial buckets at the edges and the unsettled tail. Rollup-served hours
+therefore never change, and anything that can still change is read from
+the raw collection (which is what the chart cache fingerprints).
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING
+
+from .config import (
+    DB_NAME,
+    COLLECTION_NAME,
+    AQS_ROLLUP_HOURLY,
+    AQS_ROLLUP_DAILY,
+    INGEST_SETTLE_SECONDS,
+    ROLLUP_INTERVAL,
+    ROLLUP_CHUNK_HOURS,
+)
+from .db import get_mongo_client
+
+SETTLED_ID = "settled_through"
+BUCKET_UNITS = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+
+_rollup_worker = None
+
+
+def _collections():
+    db = get_mongo_client()[DB_NAME]
+    return (
+        db[COLLECTION_NAME],
+        db[AQS_ROLLUP_HOURLY],
+        db[AQS_ROLLUP_DAILY],
+        db[f"{AQS_ROLLUP_HOURLY}_meta"],
+    )
+
+
+def floor_to(dt, bucket):
+    """Start of the hour/day bucket containing `dt`"""
+    if bucket == "day":
+        return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    return dt.replace(minute=0, second=0, microsecond=0)
+
+
+def ceil_to(dt, bucket):
+    """Start of the first bucket beginning at or after `dt`"""
+    floor = floor_to(dt, bucket)
+    return floor if floor == dt else floor + BUCKET_UNITS[bucket]
+
+
+# ----------------------------------------------------------------------------
+# Pipelines
+# ----------------------------------------------------------------------------
+def _is_set(field):
+    return {"$cond": [{"$eq": [{"$ifNull": [field, None]}, None]}, 0, 1]}
+
+
+# Sums that combine across buckets; shared by the hourly and daily stages
+_COMBINE = {
+    "count": {"$sum": "$count"},
+    "duplicates": {"$sum": "$duplicates"},
+    "csm": {"$sum": "$csm"},
+    "bvt_min": {"$min": "$bvt_min"},
+    "bvt_max": {"$max": "$bvt_max"},
+    "bvt_sum": {"$sum": "$bvt_sum"},
+    "bvt_n": {"$sum": "$bvt_n"},
+    "bpon_on": {"$sum": "$bpon_on"},
+    "bpon_n": {"$sum": "$bpon_n"},
+    # Documents compare field by field, so this is the latest reading
+    "last": {"$max": "$last"},
+}
+
+
+def _finish_stages(into):
+    """Derived fields, then upsert whole buckets into `into`"""
+    def ratio(num, den):
+        return {"$cond": [{"$gt": [den, 0]}, {"$divide": [num, den]}, None]}
+
+    return [
+        {
+            "$project": {
+                "_id": 0,
+                "deviceid": "$_id.deviceid",
+                "bucket": "$_id.bucket",
+                "count": 1,
+                "duplicates": 1,
+                "csm": 1,
+                "bvt_min": 1,
+                "bvt_max": 1,
+                "bvt_sum": 1,
+                "bvt_n": 1,
+                "bvt_mean": ratio("$bvt_sum", "$bvt_n"),
+                "bpon_on": 1,
+                "bpon_n": 1,
+                "bpon_ratio": ratio("$bpon_on", "$bpon_n"),
+                "last": 1,
+                "updated_at": "$$NOW",
+            }
+        },
+        {
+            "$merge": {
+                "into": into,
+                "on": ["deviceid", "bucket"],
+                "whenMatched": "replace",
+                "whenNotMatched": "insert",
+            }
+        },
+    ]
+
+
+def hourly_rollup_pipeline(start, end, into=AQS_ROLLUP_HOURLY):
+    """Rebuild the hourly rows for raw data in [start, end)"""
+    bvt = "$data.binfo.bvt"
+    bpon = "$data.binfo.bpon"
+    return [
+        {
+            "$match": {
+                "devicetime": {"$gte": start, "$lt": end},
+                "deviceid": {"$ne": None},
+            }
+        },
+        # One row per (device, timestamp) so copies can be counted
+        {
+            "$group": {
+                "_id": {"deviceid": "$deviceid", "t": "$devicetime"},
+                "count": {"$sum": 1},
+                "csm": {"$sum": {"$ifNull": ["$data.evt.csm", 0]}},
+                "bvt_min": {"$min": bvt},
+                "bvt_max": {"$max": bvt},
+                "bvt_sum": {"$sum": bvt},
+                "bvt_n": {"$sum": _is_set(bvt)},
+                "bpon_on": {"$sum": {"$cond": [{"$in": [bpon, [True, 1]]}, 1, 0]}}, # noqa
+                "bpon_n": {"$sum": _is_set(bpon)},
+                "bvt": {"$last": bvt},
+                "bpon": {"$last": bpon},
+            }
+        },
+        {
+            "$group": {
+                "_id": {
+                    "deviceid": "$_id.deviceid",
+                    "bucket": {"$dateTrunc": {"date": "$_id.t", "unit": "hour"}}, # noqa
+                },
+                **_COMBINE,
+                "duplicates": {"$sum": {"$subtract": ["$count", 1]}},
+                "last": {"$max": {"t": "$_id.t", "bvt": "$bvt", "bpon": "$bpon"}}, # noqa
+            }
+        },
+        *_finish_stages(into),
+    ]
+
+
+def daily_rollup_pipeline(start, end, into=AQS_ROLLUP_DAILY):
+    """Rebuild the daily rows from hourly rows in [start, end)"""
+    return [
+        {"$match": {"bucket": {"$gte": start, "$lt": end}}},
+        {
+            "$group": {
+                "_id": {
+                    "deviceid": "$deviceid",
+                    "bucket": {"$dateTrunc": {"date": "$bucket", "unit": "day"}}, # noqa
+                },
+                **_COMBINE,
+            }
+        },
+        *_finish_stages(into),
+    ]
+
+
+def raw_hourly_pipeline(query):
+    """Hourly rows straight from raw data, shaped like rollup rows"""
+    return [
+        {"$match": query},
+        {
+            "$group": {
+                "_id": {"$dateTrunc": {"date": "$devicetime", "unit": "hour"}}, # noqa
+                "csm": {"$sum": {"$ifNull": ["$data.evt.csm", 0]}},
+                "bvt_mean": {"$avg": "$data.binfo.bvt"},
+                "last": {
+                    "$max": {
+                        "t": "$devicetime",
+                        "bvt": "$data.binfo.bvt",
+                        "bpon": "$data.binfo.bpon",
+                    }
+                },
+            }
+        },
+        {"$project": {"_id": 0, "bucket": "$_id", "csm": 1, "bvt_mean": 1, "last": 1}}, # noqa
+    ]
+
+
+# ----------------------------------------------------------------------------
+# Read planning (shared by the async API and the sync email pipeline)
+# ----------------------------------------------------------------------------
+ROLLUP_FIELDS = {"_id": 0, "bucket": 1, "csm": 1, "bvt_mean": 1, "last": 1}
+
+
+def plan_hourly_read(deviceid, start, end, settled_through):
+    """
+    Split [start, end] into rollup-served hours and raw-served edges.
+
+    Returns (rollup_query or None, [raw_query, ...]). Hours never overlap
+    between the two, so their rows can simply be concatenated.
+    """
+    covered_from = ceil_to(start, "hour")
+    # `end` is inclusive to the second, as in build_range_query
+    covered_to = floor_to(end + timedelta(seconds=1), "hour")
+    # Before the first rollup pass everything is served from raw data
+    covered_to = min(covered_to, settled_through or covered_from)
+
+    if covered_from >= covered_to:
+        return None, [
+            {"deviceid": deviceid, "devicetime": {"$gte": start, "$lte": end}}
+        ]
+
+    rollup_query = {
+        "deviceid": deviceid,
+        "bucket": {"$gte": covered_from, "$lt": covered_to},
+    }
+    raw_queries = []
+    if start < covered_from:
+        raw_queries.append(
+            {"deviceid": deviceid, "devicetime": {"$gte": start, "$lt": covered_from}} # noqa
+        )
+    if covered_to <= end:
+        raw_queries.append(
+            {"deviceid": deviceid, "devicetime": {"$gte": covered_to, "$lte": end}} # noqa
+        )
+    return rollup_query, raw_queries
+
+
+def plan_daily_read(deviceid, start, end, settled_through):
+    """
+    Like plan_hourly_read for day buckets.
+
+    Returns (daily_rollup_query or None, [(start, end), ...] sub-ranges to
+    be served hourly and summed per day).
+    """
+    covered_from = ceil_to(start, "day")
+    covered_to = floor_to(end + timedelta(seconds=1), "day")
+    covered_to = min(covered_to, floor_to(settled_through or covered_from, "day")) # noqa
+
+    if covered_from >= covered_to:
+        return None, [(start, end)]
+
+    daily_query = {
+        "deviceid": deviceid,
+        "bucket": {"$gte": covered_from, "$lt": covered_to},
+    }
+    edges = []
+    if start < covered_from:
+        edges.append((start, covered_from - timedelta(microseconds=1)))
+    if covered_to <= end:
+        edges.append((covered_to, end))
+    return daily_query, edges
+
+
+def sum_by_day(hourly_rows):
+    """(day, csm) totals for hourly rows"""
+    totals = {}
+    for row in hourly_rows:
+        day = floor_to(row["bucket"], "day")
+        totals[day] = totals.get(day, 0) + row["csm"]
+    return totals
+
+
+def settled_through_from(meta_doc):
+    return meta_doc["value"] if meta_doc else None
+
+
+# ----------------------------------------------------------------------------
+# Sync reads (email pipeline)
+# ----------------------------------------------------------------------------
+def read_hourly_rows(deviceid, start, end):
+    """Hourly rows for one device, from rollups plus raw edges"""
+    raw, hourly, _, meta = _collections()
+    through = settled_through_from(meta.find_one({"_id": SETTLED_ID}))
+    rollup_query, raw_queries = plan_hourly_read(deviceid, start, end, through) # noqa
+
+    rows = []
+    if rollup_query is not None:
+        rows.extend(hourly.find(rollup_query, ROLLUP_FIELDS))
+    for query in raw_queries:
+        rows.extend(raw.aggregate(raw_hourly_pipeline(query)))
+    rows.sort(key=lambda row: row["bucket"])
+    return rows
+
+
+# ----------------------------------------------------------------------------
+# Background job
+# ----------------------------------------------------------------------------
+def ensure_rollup_indexes():
+    """$merge on (deviceid, bucket) needs a unique index on both"""
+    _, hourly, daily, _ = _collections()
+    for collection in (hourly, daily):
+        collection.create_index(
+            [("deviceid", ASCENDING), ("bucket", ASCENDING)], unique=True
+        )
+
+
+def _earliest_devicetime(raw):
+    first = raw.find_one({}, {"devicetime": 1}, sort=[("devicetime", 1)])
+    return first["devicetime"] if first else None
+
+
+def roll_up_new_records(now=None):
+    """
+    Bring the hourly and daily rollups up to date with settled raw data.
+
+    Returns the number of hours rolled up.
+    """
+    raw, hourly, _, meta = _collections()
+    now = now or datetime.utcnow()
+    settled_limit = floor_to(now - timedelta(seconds=INGEST_SETTLE_SECONDS), "hour") # noqa
+    chunk = timedelta(hours=ROLLUP_CHUNK_HOURS)
+
+    mark = meta.find_one({"_id": SETTLED_ID})
+    if mark:
+        settled_through = mark["value"]
+    else:
+        earliest = _earliest_devicetime(raw)
+        settled_through = floor_to(earliest, "hour") if earliest else settled_limit # noqa
+
+    first_hour = start = settled_through
+    while start < settled_limit:
+        chunk_end = min(start + chunk, settled_limit)
+        list(raw.aggregate(hourly_rollup_pipeline(start, chunk_end), allowDiskUse=True)) # noqa
+        # Advance the watermark after each chunk so a restart resumes here
+        settled_through = chunk_end
+        meta.update_one(
+            {"_id": SETTLED_ID},
+            {"$set": {"value": settled_through, "updated_at": datetime.utcnow()}}, # noqa
+            upsert=True,
+        )
+        start = chunk_end
+
+    if first_hour < settled_limit:
+        first_day = floor_to(first_hour, "day")
+        list(hourly.aggregate(daily_rollup_pipeline(first_day, settled_limit), allowDiskUse=True)) # noqa
+    elif not mark:
+        # Empty collection: start the watermark here for the next pass
+        meta.update_one(
+            {"_id": SETTLED_ID},
+            {"$set": {"value": settled_through, "updated_at": datetime.utcnow()}}, # noqa
+            upsert=True,
+        )
+    return max(0, int((settled_limit - first_hour) / timedelta(hours=1)))
+
+
+def _run_rollup_worker():
+    logging.info(f"🧮 Rollup worker started (every {ROLLUP_INTERVAL}s)")
+    try:
+        ensure_rollup_indexes()
+    except Exception as e:
+        logging.error(f"Rollup index creation failed: {e}")
+    while True:
+        try:
+            started = time.time()
+            hours = roll_up_new_records()
+            logging.info(
+                f"🧮 Rollups updated ({hours} hours rolled up) in {time.time() - started:.2f}s" # noqa
+            )
+        except Exception as e:
+            logging.error(f"Rollup worker error: {e}")
+        time.sleep(ROLLUP_INTERVAL)
+
+
+def start_rollup_worker():
+    """Start the background rollup worker once per process"""
+    global _rollup_worker
+    if _rollup_worker is None or not _rollup_worker.is_alive():
+        _rollup_worker = threading.Thread(
+            target=_run_rollup_worker, daemon=True
+        )
+        _rollup_worker.start()
+    return _rollup_worker
@@ -0,0 +1,143 @@
+"""
+Pooled, reusable SMTP sessions on top of aiosmtplib.
+
+Each session connects, upgrades with STARTTLS and logs in once, then sends
+many messages. A session is recycled after SMTP_SESSION_MAX_MESSAGES sends
+and transparently reconnected when the server drops it.
+"""
+import asyncio
+import logging
+
+import aiosmtplib
+
+from .config import (
+    EMAIL_ADDRESS,
+    EMAIL_PASSWORD,
+    SMTP_SERVER,
+    SMTP_PORT,
+    SMTP_STARTTLS,
+    SMTP_TIMEOUT,
+    EMAIL_SEND_CONCURRENCY,
+    SMTP_SESSION_MAX_MESSAGES,
+)
+
+# Errors after which the connection itself is suspect and must be rebuilt
+_CONNECTION_ERRORS = (
+    aiosmtplib.SMTPServerDisconnected,
+    aiosmtplib.SMTPConnectError,
+    aiosmtplib.SMTPTimeoutError,
+    ConnectionError,
+    OSError,
+)
+
+
+class _Session:
+    """One authenticated SMTP connection and its message counter"""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.smtp = None
+        self.sent = 0
+
+    @property
+    def is_connected(self):
+        return self.smtp is not None and self.smtp.is_connected
+
+    async def connect(self):
+        pool = self.pool
+        self.smtp = aiosmtplib.SMTP(
+            hostname=pool.hostname,
+            port=pool.port,
+            timeout=pool.timeout,
+            start_tls=pool.start_tls,
+        )
+        await self.smtp.connect()
+        if pool.username and pool.password:
+            await self.smtp.login(pool.username, pool.password)
+        self.sent = 0
+        pool.connects += 1
+        logging.info(f"🔐 SMTP session opened to {pool.hostname}:{pool.port}")
+
+    async def close(self):
+        if self.smtp is None:
+            return
+        try:
+            if self.smtp.is_connected:
+                await self.smtp.quit()
+        except Exception:
+            self.smtp.close()
+        self.smtp = None
+
+    async def send(self, msg):
+        if self.sent >= self.pool.max_messages:
+            await self.close()
+        if not self.is_connected:
+            await self.connect()
+        await self.smtp.send_message(msg)
+        self.sent += 1
+
+
+class SMTPSessionPool:
+    """Fixed-size pool of SMTP sessions shared by concurrent senders"""
+
+    def __init__(
+        self,
+        hostname=SMTP_SERVER,
+        port=SMTP_PORT,
+        username=EMAIL_ADDRESS,
+        password=EMAIL_PASSWORD,
+        start_tls=SMTP_STARTTLS,
+        size=EMAIL_SEND_CONCURRENCY,
+        max_messages=SMTP_SESSION_MAX_MESSAGES,
+        timeout=SMTP_TIMEOUT,
+    ):
+        self.hostname = hostname
+        self.port = port
+        self.username = username
+        self.password = password
+        self.start_tls = start_tls
+        self.max_messages = max_messages
+        self.timeout = timeout
+        self.connects = 0
+        self.messages_sent = 0
+        self._sessions = [_Session(self) for _ in range(max(1, size))]
+        self._idle = asyncio.Queue()
+        for session in self._sessions:
+            self._idle.put_nowait(session)
+
+    async def send_message(self, msg):
+        """
+        Send on an idle session; a dropped connection is rebuilt and the
+        message retried once before the error is raised to the caller.
+        """
+        session = await self._idle.get()
+        try:
+            try:
+                await session.send(msg)
+            except _CONNECTION_ERRORS as e:
+                logging.warning(f"⚠️ SMTP session lost ({e}); reconnecting")
+                await session.close()
+                await session.send(msg)
+            self.messages_sent += 1
+        except Exception:
+            await session.close()
+            raise
+        finally:
+            self._idle.put_nowait(session)
+
+    async def close(self):
+        for session in self._sessions:
+            await session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def stats(self):
+        return {
+            "sessions": len(self._sessions),
+            "connects": self.connects,
+            "messages_sent": self.messages_sent,
+        }
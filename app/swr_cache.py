@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+
+class StaleWhileRevalidateCache:
+    """
+    Single-value cache that serves stale data while one refresh runs.
+
+    Concurrent misses share a single in-flight load (single-flight), so an
+    expired entry costs one loader call no matter how many requests see
+    it. Only a cold cache makes callers wait.
+    """
+
+    def __init__(self, loader, ttl, name="cache"):
+        self._loader = loader
+        self.ttl = ttl
+        self.name = name
+        self._lock = threading.Lock()
+        self._value = None
+        self._loaded_at = None
+        self._inflight = None
+        self._auto_refresh = None
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.failures = 0
+
+    def _refresh_locked(self):
+        if self._inflight is None:
+            future = Future()
+            self._inflight = future
+            threading.Thread(
+                target=self._run_refresh, args=(future,), daemon=True
+            ).start()
+        return self._inflight
+
+    def _run_refresh(self, future):
+        started = time.time()
+        try:
+            value = self._loader()
+        except Exception as e:
+            logging.error(f"{self.name} refresh failed: {e}")
+            with self._lock:
+                self._inflight = None
+                self.failures += 1
+            future.set_exception(e)
+            return
+
+        with self._lock:
+            self._value = value
+            self._loaded_at = time.time()
+            self._inflight = None
+            self.refreshes += 1
+        logging.info(f"{self.name} refreshed in {time.time() - started:.2f}s")
+        future.set_result(value)
+
+    def _lookup(self):
+        """(value, None) when servable now, else (None, in-flight future)"""
+        with self._lock:
+            if self._loaded_at is None:
+                self.misses += 1
+                return None, self._refresh_locked()
+            if time.time() - self._loaded_at >= self.ttl:
+                self.stale_hits += 1
+                self._refresh_locked()
+            else:
+                self.hits += 1
+            return self._value, None
+
+    def get(self):
+        value, pending = self._lookup()
+        return value if pending is None else pending.result()
+
+    async def get_async(self):
+        value, pending = self._lookup()
+        if pending is None:
+            return value
+        # Await the shared load without holding a worker thread
+        return await asyncio.wrap_future(pending)
+
+    def refresh(self):
+        """Start a refresh (or join the running one); returns its future"""
+        with self._lock:
+            return self._refresh_locked()
+
+    def invalidate(self):
+        """Drop the cached value so the next read waits for fresh data"""
+        with self._lock:
+            self._value = None
+            self._loaded_at = None
+
+    def start_auto_refresh(self, interval, when=None):
+        """
+        Refresh proactively every `interval` seconds in the background.
+
+        `when`, if given, is checked before each refresh; the tick is
+        skipped while it returns False (reads still refresh on expiry).
+        """
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    if when is not None and not when():
+                        continue
+                    self.refresh().result()
+                except Exception:
+                    pass  # Already logged; keep serving the last good value
+
+        if self._auto_refresh is None:
+            self._auto_refresh = threading.Thread(target=run, daemon=True)
+            self._auto_refresh.start()
+
+    def stats(self):
+        with self._lock:
+            age = (
+                round(time.time() - self._loaded_at, 1)
+                if self._loaded_at is not None
+                else None
+            )
+            return {
+                "age_seconds": age,
+                "refreshing": self._inflight is not None,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "refreshes": self.refreshes,
+                "failures": self.failures,
+            }
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Benchmark chart rendering: pyplot per chart vs reusable Figure templates.
+
+Each variant runs in its own fresh process so peak RSS is comparable. The
+legacy variant is the previous path (plt.subplots, categorical labels,
+tight_layout, savefig with bbox_inches="tight"); the template variants call
+app.chart_renderer.render_chart exactly as a renderer worker does.
+
+    python -m benchmarks.bench_chart_render --charts 50 --points 288
+"""
+import argparse
+import io
+import multiprocessing
+import resource
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+
+def make_specs(charts, points, seed=11):
+    """Email-style specs: hourly labels, consumption and battery voltage"""
+    rng = np.random.default_rng(seed)
+    start = datetime(2024, 1, 1)
+    labels = [
+        (start + timedelta(hours=i)).strftime("%H:%M") for i in range(points)
+    ]
+    battery = {
+        "status": "Good",
+        "voltage": "3.70V",
+        "power_on": "Yes",
+        "status_color": "green",
+    }
+    return [
+        {
+            "kind": "email_report",
+            "device_id": f"device-{n}",
+            "labels": labels,
+            "consumption": rng.gamma(2.0, 5.0, points).round(2).tolist(),
+            "voltage": (3.7 - rng.random(points) * 0.2).round(3).tolist(),
+            "battery": battery,
+            "dpi": 200,
+        }
+        for n in range(charts)
+    ]
+
+
+def legacy_render(spec):
+    """The pre-template pyplot path, kept here for comparison"""
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    device_id = spec["device_id"]
+    battery = spec["battery"]
+    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(10, 6))
+    ax1.bar(spec["labels"], spec["consumption"], color="skyblue")
+    ax1.set_title(f"Hourly Consumption - {device_id}", fontsize=11)
+    ax1.set_xlabel("Hour")
+    ax1.set_ylabel("Total CSM")
+    ax1.tick_params(axis="x", rotation=45)
+    ax2.plot(
+        spec["labels"], spec["voltage"], color="green", marker="o", linewidth=2
+    )
+    ax2.set_title(f"Battery Voltage Over Time - {device_id}", fontsize=11)
+    ax2.set_xlabel("Hour")
+    ax2.set_ylabel("Voltage (V)")
+    ax2.tick_params(axis="x", rotation=45)
+    ax2.grid(True, alpha=0.3)
+    ax2.text(
+        0.02,
+        0.98,
+        f"Current Status: {battery['status']} ({battery['voltage']})",
+        transform=ax2.transAxes,
+        verticalalignment="top",
+        bbox=dict(boxstyle="round", facecolor=battery["status_color"], alpha=0.3), # noqa
+    )
+    buf = io.BytesIO()
+    plt.tight_layout()
+    plt.savefig(buf, format="png", dpi=spec["dpi"], bbox_inches="tight")
+    plt.close(fig)
+    return buf.getvalue()
+
+
+def run_variant(variant, charts, points, queue):
+    """Child process: render every spec, report latencies and peak RSS"""
+    import logging
+
+    # The legacy path logs a categorical-units notice per chart
+    logging.getLogger("matplotlib").setLevel(logging.WARNING)
+    specs = make_specs(charts, points)
+
+    if variant == "pyplot":
+        render = legacy_render
+    else:
+        from app.chart_renderer import render_chart
+
+        fmt, _, thumb = variant.partition("-")
+        for spec in specs:
+            spec["format"] = fmt
+            spec["thumbnail"] = thumb == "thumb"
+        render = render_chart
+
+    render(specs[0])  # imports, font cache, template build
+    latencies = []
+    size = 0
+    for spec in specs:
+        started = time.perf_counter()
+        size = len(render(spec))
+        latencies.append(time.perf_counter() - started)
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak //= 1024  # bytes on macOS, KiB elsewhere
+    queue.put((latencies, peak, size))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--charts", type=int, default=50)
+    parser.add_argument("--points", type=int, default=24)
+    parser.add_argument(
+        "--variants",
+        default="pyplot,png,webp,svg,png-thumb",
+        help="comma-separated: pyplot and/or template png|webp|svg[-thumb]",
+    )
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")
+    print(
+        f"{args.charts} email charts x {args.points} hourly points (dpi 200)\n"
+    )
+    print(f"{'variant':<12}{'median ms':>11}{'p95 ms':>9}{'peak RSS MiB':>14}{'bytes':>10}") # noqa
+    for variant in args.variants.split(","):
+        queue = ctx.Queue()
+        proc = ctx.Process(
+            target=run_variant, args=(variant, args.charts, args.points, queue)
+        )
+        proc.start()
+        latencies, peak_kib, size = queue.get()
+        proc.join()
+
+        latencies.sort()
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(
+            f"{variant:<12}"
+            f"{statistics.median(latencies) * 1000:>11.1f}"
+            f"{p95 * 1000:>9.1f}"
+            f"{peak_kib / 1024:>14.1f}"
+            f"{size:>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Benchmark record decoding: dicts plus DataFrame vs columnar raw BSON.
+
+Both variants start from the same raw BSON batches a find_raw_batches
+cursor would return (RECORD_PROJECTION shape, MONGO_BATCH_SIZE records
+each). The legacy variant decodes them to dicts, builds a DataFrame and
+pulls the nested fields out with .apply, as the analysis paths used to;
+the columnar variant is app.columnar. Each runs in a fresh process and
+reports decode time and peak RSS above the batches themselves.
+
+    python -m benchmarks.bench_columnar --days 365 --devices 4
+"""
+import argparse
+import multiprocessing
+import resource
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime
+
+import bson
+
+from benchmarks.synthetic import make_device_docs
+
+
+def _peak_kib():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def make_batches(devices, days, batch_size=1000):
+    """Raw batches of projected records, built without keeping the dicts"""
+    batches, pending = [], []
+    for n in range(devices):
+        device_id = str(uuid.UUID(int=n + 1))
+        for doc in make_device_docs(device_id, datetime(2024, 1, 1), days, seed=n): # noqa
+            del doc["data"]["devId"]  # not in RECORD_PROJECTION
+            pending.append(bson.encode(doc))
+            if len(pending) >= batch_size:
+                batches.append(b"".join(pending))
+                pending = []
+    if pending:
+        batches.append(b"".join(pending))
+    return batches
+
+
+def legacy_decode(batches):
+    """The pre-columnar path: list of dicts, DataFrame, object columns"""
+    import pandas as pd
+
+    records = []
+    for batch in batches:
+        records.extend(bson.decode_all(batch))
+    df = pd.DataFrame(records)
+    df["devicetime"] = pd.to_datetime(df["devicetime"], errors="coerce")
+    df["etm"] = df["data"].apply(lambda x: x.get("evt", {}).get("etm", 0))
+    df["csm"] = df["data"].apply(lambda x: x.get("evt", {}).get("csm", 0))
+    df["bvt"] = df["data"].apply(lambda x: x.get("binfo", {}).get("bvt"))
+    df["bpon"] = df["data"].apply(lambda x: x.get("binfo", {}).get("bpon"))
+    return df
+
+
+def columnar_decode(batches):
+    from app.columnar import columns_from_batches
+
+    return columns_from_batches(batches)
+
+
+def run_variant(variant, devices, days, repeat, queue):
+    """Child process: decode the batches `repeat` times, report timings"""
+    decode = legacy_decode if variant == "legacy" else columnar_decode
+    batches = make_batches(devices, days)
+    baseline = _peak_kib()
+
+    timings = []
+    rows = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = decode(batches)
+        timings.append(time.perf_counter() - started)
+        rows = len(result)
+        del result
+    queue.put((timings, _peak_kib() - baseline, rows))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--devices", type=int, default=4)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")
+    print(f"{args.devices} devices x {args.days} days at 5-minute cadence\n")
+    print(f"{'variant':<10}{'rows':>10}{'median s':>10}{'peak MiB':>10}")
+    for variant in ("legacy", "columnar"):
+        queue = ctx.Queue()
+        proc = ctx.Process(
+            target=run_variant,
+            args=(variant, args.devices, args.days, args.repeat, queue),
+        )
+        proc.start()
+        timings, peak_kib, rows = queue.get()
+        proc.join()
+        print(
+            f"{variant:<10}{rows:>10}"
+            f"{statistics.median(timings):>10.2f}"
+            f"{peak_kib / 1024:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Concurrency benchmark for the data-access layer.
+
+Runs the same keyset page query (the last 100 records of a device) at
+increasing concurrency, once through the async client used by the API
+and once the previous way: sync pymongo on a THREAD_POOL_WORKERS pool.
+Needs a mongod (--mongo-uri, local by default); synthetic data is seeded
+into the benchmarks.scratch database.
+
+    python -m benchmarks.bench_concurrency --concurrency 1 10 50 100
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.scratch import (
+    add_mongo_arguments,
+    clear_collection,
+    scratch_collection,
+    use_scratch_database,
+)
+
+use_scratch_database()
+
+from app import fetch_data  # noqa: E402
+from app.config import COLLECTION_NAME, THREAD_POOL_WORKERS  # noqa: E402
+from benchmarks.synthetic import seed_collection  # noqa: E402
+
+
+def summarize(label, concurrency, latencies, elapsed):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(
+        f"{label:<6} c={concurrency:<4} {len(latencies) / elapsed:8.1f} req/s  " # noqa
+        f"p50={statistics.median(latencies) * 1000:7.1f} ms  "
+        f"p95={p95 * 1000:7.1f} ms"
+    )
+
+
+async def run_async(device_id, start, end, concurrency, total):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            await fetch_data.get_data_page(
+                device_id, start, end, 100, None, "prev"
+            )
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[one() for _ in range(total)])
+    summarize("async", concurrency, latencies, time.perf_counter() - started)
+
+
+async def run_thread_pool(collection, device_id, start, end, concurrency, total): # noqa
+    pool = ThreadPoolExecutor(max_workers=THREAD_POOL_WORKERS)
+    query, _, _ = fetch_data.build_range_query(device_id, start, end)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    def query_page():
+        return list(
+            collection.find(query, fetch_data.RECORD_PROJECTION)
+            .sort("devicetime", -1)
+            .limit(101)
+        )
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            await asyncio.get_running_loop().run_in_executor(pool, query_page)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[one() for _ in range(total)])
+    summarize("pool", concurrency, latencies, time.perf_counter() - started)
+    pool.shutdown()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50, 100]) # noqa
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--days", type=int, default=30)
+    add_mongo_arguments(parser)
+    args = parser.parse_args()
+
+    collection = scratch_collection(args.mongo_uri, COLLECTION_NAME)
+    clear_collection(collection, args.yes)
+    (device_id,) = seed_collection(collection, devices=1, days=args.days)
+    first = collection.find_one(sort=[("devicetime", 1)])["devicetime"]
+    last = collection.find_one(sort=[("devicetime", -1)])["devicetime"]
+    start = first.strftime("%Y-%m-%d %H:%M:%S")
+    end = last.strftime("%Y-%m-%d %H:%M:%S")
+
+    try:
+        for concurrency in args.concurrency:
+            await run_thread_pool(
+                collection, device_id, start, end, concurrency, args.requests
+            )
+            await run_async(device_id, start, end, concurrency, args.requests)
+    finally:
+        await fetch_data.close_async_client()
+        collection.drop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
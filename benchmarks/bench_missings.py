@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark missing-interval detection.
+
+Compares the numpy slot engine in app.missings against the previous
+per-row implementation on synthetic 5-minute data with random outages.
+
+    python -m benchmarks.bench_missings --rows 2000000
+"""
+import argparse
+import time
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from app.missings import find_missing_runs
+
+
+def make_timestamps(rows, outage_ratio=0.02, seed=7):
+    """Sorted datetime64 timestamps at a 5-minute cadence with jitter and outages""" # noqa
+    rng = np.random.default_rng(seed)
+    start = np.datetime64("2024-01-01T00:00:00", "ns")
+    slots = np.arange(int(rows / (1 - outage_ratio)), dtype=np.int64)
+
+    # Knock out whole runs of slots to simulate device outages
+    keep = np.ones(slots.size, dtype=bool)
+    outages = rng.integers(0, slots.size, size=max(1, slots.size // 500))
+    lengths = rng.integers(1, 12, size=outages.size)
+    for first, length in zip(outages, lengths):
+        keep[first:first + length] = False
+    slots = slots[keep][:rows]
+
+    jitter = rng.integers(0, 60, size=slots.size) * 10**9
+    return start + (slots * 300 * 10**9 + jitter).astype("timedelta64[ns]")
+
+
+def legacy_find_missing_intervals(times, interval_minutes=5):
+    """The pre-vectorization algorithm, kept here for comparison"""
+    def floor_to_5min(dt):
+        return dt - timedelta(
+            minutes=dt.minute % 5,
+            seconds=dt.second,
+            microseconds=dt.microsecond
+        )
+
+    df = pd.DataFrame({"devicetime": pd.to_datetime(times)})
+    df["ts_floor"] = df["devicetime"].apply(floor_to_5min)
+    df = df.sort_values("ts_floor").reset_index(drop=True)
+    expected = pd.date_range(
+        start=df["ts_floor"].min(),
+        end=df["ts_floor"].max(),
+        freq=f"{interval_minutes}min",
+    )
+    found = set(df["ts_floor"])
+    missing = []
+    for t in expected:
+        if t not in found:
+            missing.append({
+                "missing_interval_start": t.strftime("%Y-%m-%d %H:%M:%S"),
+                "missing_interval_end": (t + timedelta(minutes=interval_minutes)).strftime("%Y-%m-%d %H:%M:%S") # noqa
+            })
+    return missing
+
+
+def best_of(fn, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--legacy-rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    times = make_timestamps(args.rows)
+    elapsed, runs = best_of(lambda: find_missing_runs(times), args.repeat)
+    slots = sum(run["missing_slots"] for run in runs)
+    print(
+        f"vectorized  rows={args.rows:>10,}  {elapsed * 1000:9.1f} ms  "
+        f"runs={len(runs):,}  missing_slots={slots:,}"
+    )
+
+    sample = times[:args.legacy_rows]
+    new_elapsed, new_runs = best_of(lambda: find_missing_runs(sample), args.repeat) # noqa
+    old_elapsed, old_rows = best_of(
+        lambda: legacy_find_missing_intervals(sample), 1
+    )
+    new_slots = sum(run["missing_slots"] for run in new_runs)
+    assert new_slots == len(old_rows), "engines disagree on missing slots"
+    print(
+        f"legacy      rows={args.legacy_rows:>10,}  {old_elapsed * 1000:9.1f} ms  " # noqa
+        f"entries={len(old_rows):,}"
+    )
+    print(
+        f"vectorized  rows={args.legacy_rows:>10,}  {new_elapsed * 1000:9.1f} ms  " # noqa
+        f"runs={len(new_runs):,}  speedup={old_elapsed / new_elapsed:,.0f}x"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Benchmark /api/get-data response encoding on large record sets.
+
+The legacy variant rewrites each record (serialize_mongo_doc) and renders
+with the stdlib-json JSONResponse; the new one renders the records as
+decoded with app.responses.dumps. Compression is timed separately per
+content coding (br only when the brotli package is installed).
+
+    python -m benchmarks.bench_responses --records 100000
+"""
+import argparse
+import statistics
+import time
+import uuid
+from datetime import datetime
+
+from fastapi.responses import JSONResponse
+
+from app.responses import available_encodings, compress, dumps
+from benchmarks.synthetic import make_device_docs
+
+
+def make_payload(records):
+    """A get-data style payload of RECORD_PROJECTION-shaped documents"""
+    docs = []
+    for doc in make_device_docs(str(uuid.uuid4()), datetime(2024, 1, 1), days=records // 288 + 1): # noqa
+        del doc["data"]["devId"]
+        docs.append(doc)
+        if len(docs) == records:
+            break
+    return {
+        "count": len(docs),
+        "start_time": docs[0]["devicetime"].isoformat(),
+        "end_time": docs[-1]["devicetime"].isoformat(),
+        "records": docs,
+    }
+
+
+def legacy_render(payload):
+    """Previous path: per-record rewrite, then stdlib json"""
+    records = []
+    for doc in payload["records"]:
+        doc = dict(doc)
+        doc["deviceid"] = str(doc["deviceid"].as_uuid())
+        doc["devicetime"] = doc["devicetime"].isoformat()
+        records.append(doc)
+    return JSONResponse(content={**payload, "records": records}).body
+
+
+def timed(fn, arg, repeat):
+    timings, result = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(arg)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--records", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    payload = make_payload(args.records)
+    print(f"{payload['count']} records\n")
+
+    legacy_s, legacy_body = timed(legacy_render, payload, args.repeat)
+    fast_s, fast_body = timed(dumps, payload, args.repeat)
+
+    print(f"{'serializer':<16}{'ms':>9}{'bytes':>12}")
+    print(f"{'stdlib json':<16}{legacy_s * 1000:>9.1f}{len(legacy_body):>12}")
+    print(f"{'orjson':<16}{fast_s * 1000:>9.1f}{len(fast_body):>12}")
+
+    print(f"\n{'encoding':<16}{'ms':>9}{'bytes':>12}{'ratio':>8}")
+    print(f"{'identity':<16}{0:>9.1f}{len(fast_body):>12}{1:>8.1f}")
+    for encoding in available_encodings():
+        seconds, body = timed(
+            lambda b: compress(b, encoding), fast_body, args.repeat
+        )
+        print(
+            f"{encoding:<16}{seconds * 1000:>9.1f}{len(body):>12}"
+            f"{len(fast_body) / len(body):>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Benchmark time-sliced parallel fetches over a long single-device range.
+
+Seeds one device with `--days` of 5-minute data into a scratch database,
+then times the full-range raw fetch (get_data_from_mongodb), the
+missing-interval scan (get_devicetimes) and the duplicate scan for each
+slice size and parallelism. "serial" is one slice covering the whole
+range, i.e. the previous single-cursor behaviour. Needs a mongod
+(--mongo-uri, local by default); data goes to the benchmarks.scratch
+database.
+
+    python -m benchmarks.bench_sliced_fetch --days 365 --parallelism 2 4 8
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from benchmarks.scratch import (
+    add_mongo_arguments,
+    clear_collection,
+    scratch_collection,
+    use_scratch_database,
+)
+
+use_scratch_database()
+
+from app import fetch_data  # noqa: E402
+from app.config import COLLECTION_NAME  # noqa: E402
+from benchmarks.synthetic import seed_collection  # noqa: E402
+
+
+async def timed(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await fn()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+async def run(label, device_id, start, end, repeat, baseline=None):
+    query, _, _ = fetch_data.build_range_query(device_id, start, end)
+    results = {
+        "get-data": await timed(
+            lambda: fetch_data.get_data_from_mongodb(device_id, start, end),
+            repeat,
+        ),
+        "devicetimes": await timed(
+            lambda: fetch_data.get_devicetimes(query), repeat
+        ),
+        "duplicates": await timed(
+            lambda: fetch_data.get_duplicates_page(query, page_size=500),
+            repeat,
+        ),
+    }
+    cells = []
+    for name, seconds in results.items():
+        speedup = baseline[name] / seconds if baseline else 1.0
+        cells.append(f"{seconds * 1000:>9.0f} ms x{speedup:<4.1f}")
+    print(f"{label:<16}" + "".join(f"{cell:>20}" for cell in cells))
+    return results
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--slice-hours", type=float, nargs="+", default=[168, 720]) # noqa
+    parser.add_argument("--parallelism", type=int, nargs="+", default=[2, 4, 8]) # noqa
+    parser.add_argument("--repeat", type=int, default=3)
+    add_mongo_arguments(parser)
+    args = parser.parse_args()
+
+    collection = scratch_collection(args.mongo_uri, COLLECTION_NAME)
+    clear_collection(collection, args.yes)
+    (device_id,) = seed_collection(collection, devices=1, days=args.days)
+    first = collection.find_one(sort=[("devicetime", 1)])["devicetime"]
+    last = collection.find_one(sort=[("devicetime", -1)])["devicetime"]
+    start = first.strftime("%Y-%m-%d %H:%M:%S")
+    end = last.strftime("%Y-%m-%d %H:%M:%S")
+
+    print(f"1 device x {args.days} days ({collection.estimated_document_count()} records)\n") # noqa
+    print(f"{'variant':<16}{'get-data':>20}{'devicetimes':>20}{'duplicates':>20}") # noqa
+    try:
+        # One slice spanning the whole range: the single-cursor baseline
+        fetch_data.FETCH_SLICE_HOURS = (args.days + 1) * 24
+        fetch_data.FETCH_PARALLELISM = 1
+        baseline = await run("serial", device_id, start, end, args.repeat)
+
+        for hours in args.slice_hours:
+            for parallelism in args.parallelism:
+                fetch_data.FETCH_SLICE_HOURS = hours
+                fetch_data.FETCH_PARALLELISM = parallelism
+                await run(
+                    f"{hours:g}h x {parallelism}",
+                    device_id, start, end, args.repeat, baseline,
+                )
+    finally:
+        await fetch_data.close_async_client()
+        collection.drop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
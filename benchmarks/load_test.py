@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+HTTP load test: Poisson arrivals over a weighted endpoint mix.
+
+Seeds the benchmarks.scratch database on `--mongo-uri` (local by default)
+with `--devices` x `--days` of synthetic data, starts the app on it with
+uvicorn (or targets `--url`, which must serve that same database), then drives each `--rates` step (requests/s) for
+`--duration` seconds. Arrivals are open-loop, and latency is measured
+from each request's scheduled arrival, so time spent queued behind a
+saturated server or connection pool is counted. Each step reports
+throughput, p50/p95/p99 latency and error rate per endpoint. Needs a
+mongod and aiohttp.
+
+    python -m benchmarks.load_test --rates 5 20 50 100 --duration 30
+    python -m benchmarks.load_test --mix get-data=5 all-device-status=1
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+from benchmarks.scratch import (
+    SCRATCH_DB_NAME,
+    add_mongo_arguments,
+    clear_collection,
+    scratch_collection,
+    use_scratch_database,
+)
+
+use_scratch_database()
+
+import aiohttp  # noqa: E402
+import numpy as np  # noqa: E402
+
+from app.config import COLLECTION_NAME  # noqa: E402
+from benchmarks.synthetic import seed_collection  # noqa: E402
+
+DEFAULT_MIX = {
+    "get-data": 30,
+    "all-device-status": 20,
+    "device-status": 15,
+    "battery-status": 15,
+    "find-duplicates": 10,
+    "render-chart": 10,
+}
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def parse_mix(items):
+    """["get-data=3", ...] -> {"get-data": 3.0, ...}"""
+    mix = {}
+    for item in items:
+        name, _, weight = item.partition("=")
+        if name not in DEFAULT_MIX:
+            raise SystemExit(f"Unknown endpoint in mix: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class Workload:
+    """Builds a random request for each endpoint in the mix"""
+
+    def __init__(self, device_ids, start, end, window_hours, chart_bodies, seed=0): # noqa
+        self.device_ids = device_ids
+        self.start = start
+        self.end = end
+        self.window = timedelta(hours=window_hours)
+        self.chart_bodies = chart_bodies
+        self.rng = random.Random(seed)
+
+    def _range(self):
+        span = (self.end - self.start - self.window).total_seconds()
+        first = self.start + timedelta(seconds=self.rng.uniform(0, max(span, 0))) # noqa
+        return first.strftime(TIME_FORMAT), (first + self.window).strftime(TIME_FORMAT) # noqa
+
+    def request(self, endpoint):
+        """(method, path, query params, JSON body) for one request"""
+        device_id = self.rng.choice(self.device_ids)
+        if endpoint == "get-data":
+            start, end = self._range()
+            return "GET", "/api/get-data", {"device_id": device_id, "start_date": start, "end_date": end}, None # noqa
+        if endpoint == "find-duplicates":
+            start, end = self._range()
+            return "GET", "/api/find-duplicates", {"device_id": device_id, "start": start, "end": end}, None # noqa
+        if endpoint == "all-device-status":
+            return "GET", "/api/all-device-status", {}, None
+        if endpoint == "device-status":
+            return "GET", "/api/device-status", {"device_id": device_id}, None
+        if endpoint == "battery-status":
+            return "GET", "/api/battery-status", {"device_id": device_id}, None
+        if endpoint == "render-chart":
+            return "POST", "/api/render-chart", {}, self.rng.choice(self.chart_bodies) # noqa
+        raise ValueError(f"Unknown endpoint: {endpoint}")
+
+
+def is_ok(endpoint, status, content_type):
+    # render-chart reports failures as 200 text/plain
+    if endpoint == "render-chart":
+        return status == 304 or (status == 200 and content_type.startswith("image/")) # noqa
+    return status < 400
+
+
+async def send(session, base_url, endpoint, request, scheduled, timeout, results): # noqa
+    method, path, params, body = request
+    error = None
+    try:
+        async with session.request(
+            method, base_url + path, params=params, json=body,
+            timeout=aiohttp.ClientTimeout(total=timeout),
+        ) as response:
+            await response.read()
+            if not is_ok(endpoint, response.status, response.content_type):
+                error = f"HTTP {response.status}"
+    except asyncio.TimeoutError:
+        error = "timeout"
+    except aiohttp.ClientError as e:
+        error = type(e).__name__
+    results[endpoint].append((time.perf_counter() - scheduled, error))
+
+
+async def run_step(session, base_url, workload, mix, rate, duration, timeout, seed): # noqa
+    """Open-loop Poisson arrivals at `rate` req/s; returns per-endpoint results""" # noqa
+    rng = np.random.default_rng(seed)
+    names = list(mix)
+    weights = np.array([mix[name] for name in names])
+    weights /= weights.sum()
+    results = defaultdict(list)
+    tasks = []
+
+    started = time.perf_counter()
+    scheduled = started
+    while True:
+        scheduled += rng.exponential(1 / rate)
+        if scheduled - started > duration:
+            break
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        endpoint = names[rng.choice(len(names), p=weights)]
+        tasks.append(asyncio.create_task(send(
+            session, base_url, endpoint, workload.request(endpoint),
+            scheduled, timeout, results,
+        )))
+    await asyncio.gather(*tasks)
+    return results, time.perf_counter() - started
+
+
+def summarize(results, elapsed):
+    """Per-endpoint (and total) throughput, latency percentiles, errors"""
+    rows = {}
+    everything = []
+    for endpoint in sorted(results):
+        samples = results[endpoint]
+        everything.extend(samples)
+        rows[endpoint] = _row(samples, elapsed)
+    rows["total"] = _row(everything, elapsed)
+    return rows
+
+
+def _row(samples, elapsed):
+    latencies = np.array([latency for latency, _ in samples]) * 1000
+    errors = Counter(error for _, error in samples if error)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if samples else (0, 0, 0) # noqa
+    return {
+        "requests": len(samples),
+        "throughput": round(len(samples) / elapsed, 2),
+        "p50_ms": round(float(p50), 1),
+        "p95_ms": round(float(p95), 1),
+        "p99_ms": round(float(p99), 1),
+        "error_rate": round(sum(errors.values()) / len(samples), 4) if samples else 0.0, # noqa
+        "errors": dict(errors),
+    }
+
+
+def print_step(rate, rows):
+    print(f"\n▶ {rate:g} req/s offered")
+    print(
+        f"{'endpoint':<20}{'reqs':>7}{'req/s':>9}{'p50 ms':>10}"
+        f"{'p95 ms':>10}{'p99 ms':>10}{'errors':>9}"
+    )
+    for endpoint, row in rows.items():
+        print(
+            f"{endpoint:<20}{row['requests']:>7}{row['throughput']:>9.1f}"
+            f"{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}" # noqa
+            f"{row['error_rate']:>8.1%}"
+            + (f"  {row['errors']}" if row["errors"] else "")
+        )
+
+
+def start_server(port, env):
+    """uvicorn on the scratch database; no email scheduler, fresh result cache""" # noqa
+    return subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "app.main:app",
+            "--host", "127.0.0.1", "--port", str(port),
+            "--log-level", "warning",
+        ],
+        env=env,
+    )
+
+
+async def wait_ready(session, base_url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(base_url + "/api/result-cache-stats") as response: # noqa
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.5)
+    raise SystemExit(f"Server at {base_url} did not come up in {timeout}s")
+
+
+async def chart_bodies(session, base_url, device_ids, start, window_hours):
+    """render-chart payloads as the dashboard posts them: get-data records""" # noqa
+    bodies = []
+    end = start + timedelta(hours=window_hours)
+    for device_id in device_ids[:5]:
+        params = {
+            "device_id": device_id,
+            "start_date": start.strftime(TIME_FORMAT),
+            "end_date": end.strftime(TIME_FORMAT),
+        }
+        async with session.get(base_url + "/api/get-data", params=params) as response: # noqa
+            data = await response.json()
+        bodies.append({
+            "records": data.get("records", []),
+            "start_date": params["start_date"],
+            "end_date": params["end_date"],
+        })
+    return bodies
+
+
+async def drive(args, base_url, device_ids, start, end):
+    mix = parse_mix(args.mix) if args.mix else DEFAULT_MIX
+    connector = aiohttp.TCPConnector(limit=args.connections)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await wait_ready(session, base_url)
+        bodies = await chart_bodies(session, base_url, device_ids, start, args.window_hours) # noqa
+        workload = Workload(device_ids, start, end, args.window_hours, bodies)
+
+        print(f"{len(device_ids)} devices x {args.days} days, mix {mix}, {args.connections} connections") # noqa
+        steps = []
+        for n, rate in enumerate(args.rates):
+            results, elapsed = await run_step(
+                session, base_url, workload, mix, rate,
+                args.duration, args.timeout, seed=n,
+            )
+            rows = summarize(results, elapsed)
+            print_step(rate, rows)
+            steps.append({"rate": rate, "elapsed": round(elapsed, 2), "endpoints": rows}) # noqa
+    return mix, steps
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", help="target a running server instead of starting one") # noqa
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--devices", type=int, default=20)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--rates", type=float, nargs="+", default=[5, 20, 50, 100]) # noqa
+    parser.add_argument("--duration", type=float, default=30, help="seconds per rate step") # noqa
+    parser.add_argument("--mix", nargs="+", metavar="ENDPOINT=WEIGHT")
+    parser.add_argument("--window-hours", type=float, default=24, help="range of get-data/find-duplicates/chart requests") # noqa
+    parser.add_argument("--connections", type=int, default=100)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--keep-data", action="store_true")
+    parser.add_argument("--output", help="also write results as JSON")
+    add_mongo_arguments(parser)
+    args = parser.parse_args()
+
+    collection = scratch_collection(args.mongo_uri, COLLECTION_NAME)
+    # Status summaries and rollups left by an earlier run would describe
+    # another fleet, so the whole scratch database starts empty
+    db = collection.database
+    for name in db.list_collection_names():
+        clear_collection(db[name], args.yes)
+    device_ids = seed_collection(
+        collection, devices=args.devices, days=args.days,
+        gap_ratio=0.02, duplicate_ratio=0.01, battery_decay=0.01,
+    )
+    end = datetime.utcnow()
+    start = end - timedelta(days=args.days)
+
+    server = None
+    cache_dir = tempfile.TemporaryDirectory()
+    base_url = args.url
+    if base_url is None:
+        base_url = f"http://127.0.0.1:{args.port}"
+        server = start_server(args.port, {
+            **os.environ,
+            "MONGO_URI": args.mongo_uri,
+            "DB_NAME": SCRATCH_DB_NAME,
+            "DEVICE_EMAIL_MAP": "{}",
+            "RESULT_CACHE_PATH": os.path.join(cache_dir.name, "results.sqlite3"), # noqa
+        })
+    try:
+        mix, steps = asyncio.run(drive(args, base_url.rstrip("/"), device_ids, start, end)) # noqa
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+        cache_dir.cleanup()
+        if not args.keep_data:
+            collection.drop()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "devices": args.devices,
+                    "days": args.days,
+                    "duration": args.duration,
+                    "connections": args.connections,
+                    "mix": mix,
+                    "steps": steps,
+                },
+                f,
+                indent=2,
+            )
+        print(f"\n📄 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
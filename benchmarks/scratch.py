@@ -0,0 +1,70 @@
+"""
+Scratch MongoDB database for the benchmarks that need a mongod.
+
+app.config loads the deployment .env, so a benchmark that used its
+MONGO_URI/DB_NAME could seed into (and drop) production collections.
+Benchmarks instead take --mongo-uri, defaulting to a local mongod, and
+always work in SCRATCH_DB_NAME. Call use_scratch_database() before any
+app module is imported so the app's own clients point there too.
+"""
+import argparse
+import os
+import sys
+
+from pymongo import MongoClient
+
+DEFAULT_MONGO_URI = "mongodb://localhost:27017"
+SCRATCH_DB_NAME = "aquesa_benchmark"
+
+
+def add_mongo_arguments(parser):
+    parser.add_argument(
+        "--mongo-uri", default=DEFAULT_MONGO_URI,
+        help=f"mongod to seed and query (default {DEFAULT_MONGO_URI}; never read from .env)", # noqa
+    )
+    parser.add_argument(
+        "--yes", action="store_true",
+        help="drop scratch collections that already hold data without asking", # noqa
+    )
+
+
+def use_scratch_database(argv=None):
+    """
+    Force MONGO_URI (from --mongo-uri) and DB_NAME for this process.
+
+    Both are set outright, not defaulted, so exported deployment settings
+    and .env (which load_dotenv never lets override) are ignored.
+    """
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--mongo-uri", default=DEFAULT_MONGO_URI)
+    args, _ = parser.parse_known_args(sys.argv[1:] if argv is None else argv)
+    os.environ["MONGO_URI"] = args.mongo_uri
+    os.environ["DB_NAME"] = SCRATCH_DB_NAME
+    return args.mongo_uri
+
+
+def scratch_collection(mongo_uri, name):
+    """`name` in the scratch database; never any other database"""
+    client = MongoClient(mongo_uri, uuidRepresentation="standard")
+    return client[SCRATCH_DB_NAME][name]
+
+
+def clear_collection(collection, assume_yes=False):
+    """
+    Drop a scratch collection before seeding it.
+
+    Refuses anything outside SCRATCH_DB_NAME, and asks before dropping a
+    collection that already holds data unless `assume_yes`.
+    """
+    if collection.database.name != SCRATCH_DB_NAME:
+        raise SystemExit(
+            f"Refusing to drop {collection.full_name}: not in {SCRATCH_DB_NAME}" # noqa
+        )
+    count = collection.estimated_document_count()
+    if count and not assume_yes:
+        answer = input(
+            f"⚠️ {collection.full_name} already holds {count} documents. Drop it? [y/N] " # noqa
+        )
+        if answer.strip().lower() not in ("y", "yes"):
+            raise SystemExit("Aborted; nothing was dropped")
+    collection.drop()
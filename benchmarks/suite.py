@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark suite over a synthetic fleet, with results saved as JSON.
+
+Generates `--devices` x `--days` of raw_data_ts documents with outages,
+duplicates and battery decay, then times the analysis and report paths
+on them: missing intervals, duplicates, the web and email charts, the
+email CSV and the fleet status rows. Results are written to
+benchmarks/results/<commit>.json so runs on two commits can be diffed:
+
+    python -m benchmarks.suite --devices 20 --days 30
+    python -m benchmarks.suite --compare OLD.json NEW.json
+
+--mongo also seeds the benchmarks.scratch database on --mongo-uri (local
+by default) and times the fleet status aggregation in MongoDB (full scan
+and summary fold).
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.scratch import (
+    add_mongo_arguments,
+    clear_collection,
+    use_scratch_database,
+)
+
+use_scratch_database()
+
+from app.chart_renderer import render_chart  # noqa: E402
+from app.columnar import columns_from_documents  # noqa: E402
+from app.device_status import format_status_row, sort_status_rows  # noqa: E402
+from app.duplicates import find_duplicates  # noqa: E402
+from app.email_reports import (  # noqa: E402
+    battery_status_from_rows,
+    email_chart_spec,
+    generate_csv_for_email,
+)
+from app.main import _records_chart_spec  # noqa: E402
+from app.missings import find_missing_intervals  # noqa: E402
+from benchmarks.synthetic import (  # noqa: E402
+    fleet_device_ids,
+    make_device_docs,
+    make_fleet_docs,
+)
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+START = datetime(2024, 1, 1)
+
+
+def git_commit():
+    """Short commit id, with "-dirty" when the tree has local changes"""
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], text=True
+        ).strip()
+        dirty = subprocess.check_output(
+            ["git", "status", "--porcelain", "--untracked-files=no"], text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return f"{commit}-dirty" if dirty else commit
+
+
+def timed(fn, repeat):
+    """Median and best wall time in ms over `repeat` runs, after a warm-up"""
+    fn()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        "median_ms": round(statistics.median(timings), 3),
+        "min_ms": round(min(timings), 3),
+        "repeat": repeat,
+    }
+
+
+def hourly_rows(docs):
+    """Hourly rollup rows (as read_hourly_rows returns) for one device"""
+    rows = {}
+    for doc in docs:
+        t = doc["devicetime"]
+        bucket = t.replace(minute=0, second=0, microsecond=0)
+        row = rows.setdefault(bucket, {"bucket": bucket, "csm": 0, "bvt_sum": 0.0, "bvt_n": 0}) # noqa
+        binfo = doc["data"]["binfo"]
+        row["csm"] += doc["data"]["evt"]["csm"]
+        row["bvt_sum"] += binfo["bvt"]
+        row["bvt_n"] += 1
+        row["last"] = {"t": t, "bvt": binfo["bvt"], "bpon": binfo["bpon"]}
+    for row in rows.values():
+        row["bvt_mean"] = row["bvt_sum"] / row["bvt_n"]
+    return [rows[bucket] for bucket in sorted(rows)]
+
+
+def device_aggregates(docs):
+    """Per-device (first_seen, latest_time, count), as the $group yields"""
+    groups = {}
+    for doc in docs:
+        device_id, t = doc["data"]["devId"], doc["devicetime"]
+        first, latest, count = groups.get(device_id, (t, t, 0))
+        groups[device_id] = (min(first, t), max(latest, t), count + 1)
+    return groups
+
+
+def run_cases(args, faults):
+    """Time every in-process case; returns {name: timings}"""
+    device_ids = fleet_device_ids(args.devices)
+    device_id = device_ids[0]
+    docs = list(make_device_docs(device_id, START, args.days, **faults))
+    columns = columns_from_documents(docs)
+    report_from = docs[-1]["devicetime"] - timedelta(days=1)
+    day = [doc for doc in docs if doc["devicetime"] > report_from]
+    rows = hourly_rows(day)
+    battery = battery_status_from_rows(rows)
+    groups = device_aggregates(make_fleet_docs(device_ids, START, args.days, **faults)) # noqa
+    now = START + timedelta(days=args.days)
+
+    def fleet_status_rows():
+        return sort_status_rows([
+            format_status_row(device, latest, first, count, now)
+            for device, (first, latest, count) in groups.items()
+        ])
+
+    cases = {
+        "find_missing_intervals": (
+            lambda: find_missing_intervals(columns, 5, args.tolerance),
+            len(docs),
+        ),
+        "find_duplicates": (lambda: find_duplicates(columns), len(docs)),
+        "records_chart": (
+            lambda: render_chart(_records_chart_spec(day, "start", "end")),
+            len(day),
+        ),
+        "email_chart": (
+            lambda: render_chart(email_chart_spec(rows, device_id, battery)),
+            len(rows),
+        ),
+        "email_csv": (
+            lambda: generate_csv_for_email(day, device_id), len(day)
+        ),
+        "fleet_status_rows": (fleet_status_rows, len(groups)),
+    }
+
+    results = {}
+    for name, (fn, items) in cases.items():
+        if args.only and name not in args.only:
+            continue
+        results[name] = {**timed(fn, args.repeat), "items": items}
+        print_result(name, results[name])
+    return results
+
+
+def run_mongo_cases(args, faults):
+    """Fleet status aggregation against a seeded scratch database"""
+    from app import device_status
+    from app.main import _aggregate_all_device_status
+
+    raw, summary, meta = device_status._collections()
+    for collection in (raw, summary, meta):
+        clear_collection(collection, args.yes)
+
+    results = {}
+    try:
+        batch = []
+        for doc in make_fleet_docs(fleet_device_ids(args.devices), START, args.days, **faults): # noqa
+            batch.append(doc)
+            if len(batch) >= 5000:
+                raw.insert_many(batch, ordered=False)
+                batch = []
+        if batch:
+            raw.insert_many(batch, ordered=False)
+        records = raw.estimated_document_count()
+        now = datetime.utcnow()
+
+        # The first fold builds the summary; later passes are incremental
+        started = time.perf_counter()
+        device_status.fold_new_records(now)
+        elapsed = (time.perf_counter() - started) * 1000
+        results["fleet_status_fold"] = {
+            "median_ms": round(elapsed, 3), "min_ms": round(elapsed, 3),
+            "repeat": 1, "items": records,
+        }
+        results["fleet_status_aggregate"] = {
+            **timed(lambda: _aggregate_all_device_status(now), args.repeat),
+            "items": records,
+        }
+        results["fleet_status_summary"] = {
+            **timed(lambda: device_status.read_fleet_status(now), args.repeat), # noqa
+            "items": args.devices,
+        }
+        for name in ("fleet_status_fold", "fleet_status_aggregate", "fleet_status_summary"): # noqa
+            print_result(name, results[name])
+    finally:
+        for collection in (raw, summary, meta):
+            collection.drop()
+    return results
+
+
+def print_result(name, result):
+    print(
+        f"{name:<26}{result['median_ms']:>12.2f}{result['min_ms']:>12.2f}"
+        f"{result['items']:>10}"
+    )
+
+
+def compare(old_path, new_path, threshold):
+    """Print per-case changes; returns the number of regressions"""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+
+    print(f"{old['commit']} -> {new['commit']}\n")
+    print(f"{'case':<26}{'old ms':>12}{'new ms':>12}{'change':>10}")
+    regressions = 0
+    for name in sorted(set(old["results"]) | set(new["results"])):
+        before = old["results"].get(name, {}).get("median_ms")
+        after = new["results"].get(name, {}).get("median_ms")
+        if before is None or after is None:
+            print(f"{name:<26}{before or '-':>12}{after or '-':>12}{'n/a':>10}")
+            continue
+        change = (after - before) / before * 100 if before else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  ⚠️ slower"
+            regressions += 1
+        print(f"{name:<26}{before:>12.2f}{after:>12.2f}{change:>+9.1f}%{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--devices", type=int, default=20)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--gap-ratio", type=float, default=0.02)
+    parser.add_argument("--duplicate-ratio", type=float, default=0.01)
+    parser.add_argument("--battery-decay", type=float, default=0.01, help="volts per day") # noqa
+    parser.add_argument("--tolerance", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", nargs="+", help="run only these cases")
+    parser.add_argument("--mongo", action="store_true", help="also time MongoDB fleet status (needs mongod)") # noqa
+    add_mongo_arguments(parser)
+    parser.add_argument("--output", help="results file (default: benchmarks/results/<commit>.json)") # noqa
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    parser.add_argument("--threshold", type=float, default=10.0, help="%% slowdown reported as a regression") # noqa
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.threshold) else 0)
+
+    faults = {
+        "gap_ratio": args.gap_ratio,
+        "duplicate_ratio": args.duplicate_ratio,
+        "battery_decay": args.battery_decay,
+    }
+    commit = git_commit()
+    print(f"{args.devices} devices x {args.days} days at 5-minute cadence ({commit})\n") # noqa
+    print(f"{'case':<26}{'median ms':>12}{'min ms':>12}{'items':>10}")
+
+    results = run_cases(args, faults)
+    if args.mongo:
+        results.update(run_mongo_cases(args, faults))
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(
+            {
+                "commit": commit,
+                "created_at": datetime.utcnow().isoformat(timespec="seconds"), # noqa
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "params": {
+                    "devices": args.devices,
+                    "days": args.days,
+                    "tolerance": args.tolerance,
+                    "repeat": args.repeat,
+                    **faults,
+                },
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+    print(f"\n📄 Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Synthetic raw_data_ts documents for benchmarks.
+
+Documents mirror the production shape: Binary UUID `deviceid`,
+`devicetime`, and `data.devId` / `data.evt` / `data.binfo`. Faults seen
+in the field can be injected per device: outages (gaps), re-sent records
+(duplicates) and a battery that runs down over the range.
+"""
+import uuid
+from datetime import datetime, timedelta
+
+import numpy as np
+from bson import Binary, UuidRepresentation
+
+REPORT_INTERVAL = timedelta(minutes=5)
+SLOTS_PER_DAY = timedelta(days=1) // REPORT_INTERVAL
+
+BATTERY_VOLTAGE = 3.9  # steady reading when there is no decay
+BATTERY_FULL = 4.1
+BATTERY_FLAT = 3.0
+MAX_OUTAGE_SLOTS = 12
+
+
+def fleet_device_ids(devices):
+    """Stable device ids, so runs on different commits see the same fleet"""
+    return [str(uuid.UUID(int=n + 1)) for n in range(devices)]
+
+
+def _outage_mask(rng, slots, gap_ratio):
+    """False for slots knocked out by outages of 1..MAX_OUTAGE_SLOTS slots"""
+    keep = np.ones(slots, dtype=bool)
+    mean_length = (1 + MAX_OUTAGE_SLOTS) / 2
+    outages = int(slots * gap_ratio / mean_length)
+    firsts = rng.integers(0, slots, size=outages)
+    lengths = rng.integers(1, MAX_OUTAGE_SLOTS + 1, size=outages)
+    for first, length in zip(firsts, lengths):
+        keep[first:first + length] = False
+    return keep
+
+
+def make_device_docs(
+    device_id,
+    start,
+    days,
+    seed=0,
+    gap_ratio=0.0,
+    duplicate_ratio=0.0,
+    battery_decay=0.0,
+):
+    """
+    Yield one device's documents at a 5-minute cadence, in devicetime order.
+
+    `gap_ratio` drops about that share of slots in outages, `duplicate_ratio`
+    sends that share of records twice and `battery_decay` lowers bvt by
+    that many volts per day from BATTERY_FULL (bpon goes to 0 once flat).
+    """
+    rng = np.random.default_rng(seed)
+    binary_id = Binary.from_uuid(uuid.UUID(device_id), UuidRepresentation.STANDARD) # noqa
+    slots = int(timedelta(days=days) / REPORT_INTERVAL)
+    consumption = rng.poisson(3, size=slots)
+    etm = np.cumsum(consumption)
+
+    keep = _outage_mask(rng, slots, gap_ratio) if gap_ratio else np.ones(slots, dtype=bool) # noqa
+    copies = 1 + (rng.random(slots) < duplicate_ratio) if duplicate_ratio else np.ones(slots, dtype=int) # noqa
+    if battery_decay:
+        voltage = BATTERY_FULL - battery_decay * np.arange(slots) / SLOTS_PER_DAY # noqa
+        voltage = np.maximum(voltage, BATTERY_FLAT).round(3)
+    else:
+        voltage = np.full(slots, BATTERY_VOLTAGE)
+
+    for i in np.flatnonzero(keep):
+        bvt = float(voltage[i])
+        for _ in range(copies[i]):
+            # A fresh dict per copy: insert_many sets _id in place
+            yield {
+                "deviceid": binary_id,
+                "devicetime": start + int(i) * REPORT_INTERVAL,
+                "data": {
+                    "devId": device_id,
+                    "evt": {"etm": int(etm[i]), "csm": int(consumption[i])},
+                    "binfo": {"bvt": bvt, "bpon": int(bvt > BATTERY_FLAT)},
+                },
+            }
+
+
+def make_fleet_docs(device_ids, start, days, **faults):
+    """Yield documents for every device in `device_ids`, device by device"""
+    for n, device_id in enumerate(device_ids):
+        yield from make_device_docs(device_id, start, days, seed=n, **faults)
+
+
+def seed_collection(collection, devices=1, days=7, start=None, batch=5000, **faults): # noqa
+    """
+    Insert synthetic data for `devices` new devices; returns their ids.
+
+    `faults` (gap_ratio, duplicate_ratio, battery_decay) are passed on to
+    make_device_docs.
+    """
+    start = start or (datetime.utcnow() - timedelta(days=days)).replace(
+        second=0, microsecond=0
+    )
+    collection.create_index([("deviceid", 1), ("devicetime", 1)])
+
+    device_ids = []
+    for n in range(devices):
+        device_id = str(uuid.uuid4())
+        device_ids.append(device_id)
+        pending = []
+        for doc in make_device_docs(device_id, start, days, seed=n, **faults):
+            pending.append(doc)
+            if len(pending) >= batch:
+                collection.insert_many(pending, ordered=False)
+                pending = []
+        if pending:
+            collection.insert_many(pending, ordered=False)
+    return device_ids
@@ -21,16 +21,14 @@ document.getElementById("dataForm").addEventListener("submit", async function (e
     // ✅ Show number of records and date range
     resultBox.innerHTML = `<p>✅ <strong>${data.count} records</strong> found from <strong>${data.start_time}</strong> to <strong>${data.end_time}</strong></p>`;
 
-    // 🎯 Send data to chart API
-    const chartRes = await fetch("/api/render-chart", {
-      method: "POST",
-      headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({
-        records: data.records,
-        start_date: startDate,
-        end_date: endDate
-      })
+    // 🎯 Chart is aggregated server-side, no need to upload the records
+    const chartParams = new URLSearchParams({
+      device_id: deviceId,
+      start: startDate,
+      end: endDate,
+      bucket: "hour"
     });
+    const chartRes = await fetch(`/api/chart?${chartParams.toString()}`);
 
     if (chartRes.ok) {
       const blob = await chartRes.blob();
@@ -44,16 +42,15 @@ document.getElementById("dataForm").addEventListener("submit", async function (e
       const chartLink = document.getElementById("download-chart");
       chartLink.href = imageUrl;
 
-      // 📥 Generate CSV
-      let csv = "devicetime,csm\n";
-      data.records.forEach(rec => {
-        const csm = rec?.data?.evt?.csm || 0;
-        csv += `${rec.devicetime},${csm}\n`;
+      // 📥 CSV is streamed by the server for the full range
+      const csvParams = new URLSearchParams({
+        device_id: deviceId,
+        start_date: startDate,
+        end_date: endDate,
+        columns: "csm",
+        gzip: "true"
       });
-
-      const csvBlob = new Blob([csv], { type: "text/csv" });
-      const csvUrl = URL.createObjectURL(csvBlob);
-      document.getElementById("download-csv").href = csvUrl;
+      document.getElementById("download-csv").href = `/api/export.csv?${csvParams.toString()}`;
 
       document.getElementById("download-buttons").style.display = "flex";
     } else {
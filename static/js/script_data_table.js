@@ -2,8 +2,13 @@ console.log("✅ script_data_table.js loaded");
 
 let currentData = [];
 let currentPage = 1;
+let pageStartIndex = 0;
 let pageSize = 100;
 let totalRecords = 0;
+let totalIsEstimate = false;
+let nextCursor = null;
+let prevCursor = null;
+let currentQuery = null;
 
 document.getElementById("dataForm").addEventListener("submit", async function (e) {
   e.preventDefault();
@@ -24,20 +29,17 @@ document.getElementById("dataForm").addEventListener("submit", async function (e
   }
 
   // ✅ Convert to backend format (YYYY-MM-DD HH:mm:ss)
-  const startFormatted = startDate + ":00";
-  const endFormatted = endDate + ":00";
-
- 
+  currentQuery = {
+    deviceId: deviceId,
+    startDate: startDate + ":00",
+    endDate: endDate + ":00"
+  };
 
   resultDiv.innerHTML = "⏳ Loading data...";
   tableContainer.style.display = "none";
 
   try {
-    const response = await fetch(
-      `/api/get-data?device_id=${deviceId}&start_date=${encodeURIComponent(startFormatted)}&end_date=${encodeURIComponent(endFormatted)}`
-    );
-
-    const data = await response.json();
+    const data = await fetchPage(null, "next");
 
     if (data.error) {
       resultDiv.innerHTML = `<p style="color:red;">❌ ${data.error}</p>`;
@@ -49,33 +51,84 @@ document.getElementById("dataForm").addEventListener("submit", async function (e
       return;
     }
 
-    currentData = data.records;
-    totalRecords = data.count;
+    totalRecords = data.total_estimate;
+    totalIsEstimate = data.total_is_estimate;
     currentPage = 1;
+    pageStartIndex = 0;
+    applyPage(data);
 
-    resultDiv.innerHTML = `<p style="color:green;">✅ Successfully loaded ${totalRecords} records</p>`;
+    const prefix = totalIsEstimate ? "about " : "";
+    resultDiv.innerHTML = `<p style="color:green;">✅ Found ${prefix}${totalRecords} records</p>`;
 
-    displayTable();
     tableContainer.style.display = "block";
   } catch (err) {
     resultDiv.innerHTML = `<p style="color:red;">❌ Error: ${err.message}</p>`;
   }
 });
 
+// 📄 Fetch a single page from the keyset-paginated API
+async function fetchPage(cursor, direction, size = pageSize) {
+  const params = new URLSearchParams({
+    device_id: currentQuery.deviceId,
+    start_date: currentQuery.startDate,
+    end_date: currentQuery.endDate,
+    page_size: size,
+    direction: direction
+  });
+  if (cursor) {
+    params.set("cursor", cursor);
+  }
+
+  const response = await fetch(`/api/get-data-page?${params.toString()}`);
+  return response.json();
+}
+
+async function goToPage(cursor, direction, pageNumber, size = pageSize) {
+  const resultDiv = document.getElementById("result");
+  try {
+    const data = await fetchPage(cursor, direction, size);
+    if (data.error) {
+      resultDiv.innerHTML = `<p style="color:red;">❌ ${data.error}</p>`;
+      return;
+    }
+    // Position of the first returned record, from what was actually read
+    if (pageNumber === 1 && !cursor) {
+      pageStartIndex = 0;
+    } else if (!cursor) {
+      pageStartIndex = Math.max(0, totalRecords - data.records.length);
+    } else if (direction === "next") {
+      pageStartIndex += currentData.length;
+    } else {
+      pageStartIndex = Math.max(0, pageStartIndex - data.records.length);
+    }
+    currentPage = pageNumber;
+    applyPage(data);
+  } catch (err) {
+    resultDiv.innerHTML = `<p style="color:red;">❌ Error: ${err.message}</p>`;
+  }
+}
+
+function applyPage(data) {
+  currentData = data.records;
+  nextCursor = data.next_cursor;
+  prevCursor = data.prev_cursor;
+  displayTable();
+}
+
+function getTotalPages() {
+  return Math.max(1, Math.ceil(totalRecords / pageSize));
+}
+
 function displayTable() {
   const tableBody = document.getElementById("tableBody");
-  const startIndex = (currentPage - 1) * pageSize;
-  const endIndex = Math.min(startIndex + pageSize, currentData.length);
-  const pageData = currentData.slice(startIndex, endIndex);
+  const startIndex = pageStartIndex;
+  const endIndex = startIndex + currentData.length;
 
   // Clear existing rows
   tableBody.innerHTML = "";
 
   // Add rows
-  pageData.forEach(record => {
-    console.log("🔎 Full Record:", record);  // log entire object
-    console.log("➡ binfo:", record.data?.binfo); // log binfo specifically
-
+  currentData.forEach(record => {
     const row = document.createElement("tr");
 
     const deviceId = record.deviceid || "N/A";
@@ -107,126 +160,93 @@ function displayTable() {
 });
 
 
-  document.getElementById("totalRecords").textContent = totalRecords;
+  const prefix = totalIsEstimate ? "~" : "";
+  document.getElementById("totalRecords").textContent = `${prefix}${totalRecords}`;
   document.getElementById("showingRecords").textContent = `${startIndex + 1}-${endIndex}`;
   document.getElementById("currentPage").textContent = currentPage;
-  document.getElementById("totalPages").textContent = Math.ceil(currentData.length / pageSize);
+  document.getElementById("totalPages").textContent = `${prefix}${getTotalPages()}`;
 
   updatePagination();
 }
 
+// Keyset pagination can only step relative to the current page, or jump to either end
 function updatePagination() {
   const pagination = document.getElementById("pagination");
-  const totalPages = Math.ceil(currentData.length / pageSize);
+  const totalPages = getTotalPages();
 
   pagination.innerHTML = "";
 
+  const firstBtn = document.createElement("button");
+  firstBtn.textContent = "« First";
+  firstBtn.disabled = !prevCursor;
+  firstBtn.onclick = () => goToPage(null, "next", 1);
+  pagination.appendChild(firstBtn);
+
   const prevBtn = document.createElement("button");
-  prevBtn.textContent = "« Previous";
-  prevBtn.disabled = currentPage === 1;
-  prevBtn.onclick = () => {
-    if (currentPage > 1) {
-      currentPage--;
-      displayTable();
-    }
-  };
+  prevBtn.textContent = "‹ Previous";
+  prevBtn.disabled = !prevCursor;
+  prevBtn.onclick = () => goToPage(prevCursor, "prev", Math.max(1, currentPage - 1));
   pagination.appendChild(prevBtn);
 
-  const startPage = Math.max(1, currentPage - 2);
-  const endPage = Math.min(totalPages, currentPage + 2);
-
-  if (startPage > 1) {
-    const firstBtn = document.createElement("button");
-    firstBtn.textContent = "1";
-    firstBtn.onclick = () => {
-      currentPage = 1;
-      displayTable();
-    };
-    pagination.appendChild(firstBtn);
-
-    if (startPage > 2) {
-      const ellipsis = document.createElement("span");
-      ellipsis.textContent = "...";
-      ellipsis.style.margin = "0 10px";
-      pagination.appendChild(ellipsis);
-    }
-  }
+  const pageLabel = document.createElement("span");
+  pageLabel.textContent = `Page ${currentPage}`;
+  pageLabel.style.margin = "0 10px";
+  pagination.appendChild(pageLabel);
 
-  for (let i = startPage; i <= endPage; i++) {
-    const pageBtn = document.createElement("button");
-    pageBtn.textContent = i;
-    pageBtn.className = i === currentPage ? "active" : "";
-    pageBtn.onclick = () => {
-      currentPage = i;
-      displayTable();
-    };
-    pagination.appendChild(pageBtn);
-  }
+  const nextBtn = document.createElement("button");
+  nextBtn.textContent = "Next ›";
+  nextBtn.disabled = !nextCursor;
+  nextBtn.onclick = () => goToPage(nextCursor, "next", currentPage + 1);
+  pagination.appendChild(nextBtn);
 
-  if (endPage < totalPages) {
-    if (endPage < totalPages - 1) {
-      const ellipsis = document.createElement("span");
-      ellipsis.textContent = "...";
-      ellipsis.style.margin = "0 10px";
-      pagination.appendChild(ellipsis);
-    }
+  const lastBtn = document.createElement("button");
+  lastBtn.textContent = "Last »";
+  lastBtn.disabled = !nextCursor;
+  // A short last page keeps its first record on a forward page boundary,
+  // so "Previous" from it lines up with the pages reached by "Next"
+  const lastPageSize = totalIsEstimate ? pageSize : (totalRecords % pageSize || pageSize);
+  lastBtn.onclick = () => goToPage(null, "prev", totalPages, lastPageSize);
+  pagination.appendChild(lastBtn);
+}
 
-    const lastBtn = document.createElement("button");
-    lastBtn.textContent = totalPages;
-    lastBtn.onclick = () => {
-      currentPage = totalPages;
-      displayTable();
-    };
-    pagination.appendChild(lastBtn);
+// 📥 Exports cover the whole range, so they fetch it on demand
+async function fetchAllRecords() {
+  if (!currentQuery) {
+    return [];
   }
-
-  const nextBtn = document.createElement("button");
-  nextBtn.textContent = "Next »";
-  nextBtn.disabled = currentPage === totalPages;
-  nextBtn.onclick = () => {
-    if (currentPage < totalPages) {
-      currentPage++;
-      displayTable();
-    }
-  };
-  pagination.appendChild(nextBtn);
+  const response = await fetch(
+    `/api/get-data?device_id=${currentQuery.deviceId}&start_date=${encodeURIComponent(currentQuery.startDate)}&end_date=${encodeURIComponent(currentQuery.endDate)}`
+  );
+  const data = await response.json();
+  return data.records || [];
 }
 
 function exportToCSV() {
-  if (currentData.length === 0) {
+  if (!currentQuery) {
     alert("No data to export");
     return;
   }
 
-  let csv = "Device ID,Device Time,ETM,CSM,Battery Voltage,Battery Power\n";
-
-  currentData.forEach(record => {
-    const deviceId = record.deviceid || "";
-    const deviceTime = record.devicetime || "";
-    const etm = record.data?.evt?.etm || "";
-    const csm = record.data?.evt?.csm || "";
-    const bvt = record.data?.binfo?.bvt || "";
-    const bpon = record.data?.binfo?.bpon !== undefined ? (record.data.binfo.bpon ? "On" : "Off") : "";
-
-    csv += `"${deviceId}","${deviceTime}","${etm}","${csm}","${bvt}","${bpon}"\n`;
+  // Streamed (and gzip-encoded) by the server, so large ranges never sit in the page
+  const params = new URLSearchParams({
+    device_id: currentQuery.deviceId,
+    start_date: currentQuery.startDate,
+    end_date: currentQuery.endDate,
+    gzip: "true"
   });
-
-  const blob = new Blob([csv], { type: "text/csv" });
-  const url = window.URL.createObjectURL(blob);
   const a = document.createElement("a");
-  a.href = url;
-  a.download = `aquesa_data_${new Date().toISOString().split('T')[0]}.csv`;
+  a.href = `/api/export.csv?${params.toString()}`;
   a.click();
-  window.URL.revokeObjectURL(url);
 }
 
-function exportToJSON() {
-  if (currentData.length === 0) {
+async function exportToJSON() {
+  const allData = await fetchAllRecords();
+  if (allData.length === 0) {
     alert("No data to export");
     return;
   }
 
-  const jsonData = JSON.stringify(currentData, null, 2);
+  const jsonData = JSON.stringify(allData, null, 2);
   const blob = new Blob([jsonData], { type: "application/json" });
   const url = window.URL.createObjectURL(blob);
   const a = document.createElement("a");
@@ -2,36 +2,63 @@ function getParam(name) {
     const url = new URL(window.location.href);
     return url.searchParams.get(name);
   }
-  
-  async function fetchDuplicates(device_id, start, end) {
+
+  let dupQuery = null;
+  let dupNextCursor = null;
+  let dupShown = 0;
+
+  async function fetchDuplicates(device_id, start, end, cursor = null) {
     const result = document.getElementById("result");
-    result.innerHTML = "<p>⏳ Loading...</p>";
+    if (!cursor) {
+      dupQuery = { device_id, start, end };
+      dupShown = 0;
+      result.innerHTML = "<p>⏳ Loading...</p>";
+    }
   
     try {
-      const res = await fetch(`/api/find-duplicates?device_id=${encodeURIComponent(device_id)}&start=${encodeURIComponent(start)}&end=${encodeURIComponent(end)}`);
+      let url = `/api/find-duplicates?device_id=${encodeURIComponent(device_id)}&start=${encodeURIComponent(start)}&end=${encodeURIComponent(end)}`;
+      if (cursor) {
+        url += `&cursor=${encodeURIComponent(cursor)}`;
+      }
+      const res = await fetch(url);
       const data = await res.json();
   
-      console.log("Data received:", data);  // Debug
-  
       if (data.error) {
         result.innerHTML = `<p style="color:red;">❌ ${data.error}</p>`;
         return;
       }
   
-      if (!data.duplicates || data.duplicates.length === 0) {
+      if (!cursor && (!data.duplicates || data.duplicates.length === 0)) {
         result.innerHTML = "<p>✅ No duplicates found.</p>";
         return;
       }
-  
-      let html = `<p><strong>${data.count} duplicate record(s) found:</strong></p>`;
-      html += "<table border='1' cellpadding='8'><tr><th>Device ID</th><th>Device Time</th></tr>";
-  
+
+      if (!cursor) {
+        result.innerHTML = `
+          <p><strong id="dupSummary"></strong></p>
+          <table border='1' cellpadding='8'>
+            <thead><tr><th>Device ID</th><th>Device Time</th><th>Copies</th></tr></thead>
+            <tbody id="dupRows"></tbody>
+          </table>
+          <button id="dupMore" style="display:none; margin-top:10px;">Load more</button>`;
+        document.getElementById("dupMore").addEventListener("click", () => {
+          fetchDuplicates(dupQuery.device_id, dupQuery.start, dupQuery.end, dupNextCursor);
+        });
+      }
+
+      // Append this page's rows; earlier pages stay on screen
+      const rows = document.getElementById("dupRows");
+      let html = "";
       data.duplicates.forEach(d => {
-        html += `<tr><td>${d.deviceid}</td><td>${d.devicetime}</td></tr>`;
+        html += `<tr><td>${d.deviceid}</td><td>${d.devicetime}</td><td>${d.count}</td></tr>`;
       });
-  
-      html += "</table>";
-      result.innerHTML = html;
+      rows.insertAdjacentHTML("beforeend", html);
+
+      dupShown += data.count;
+      dupNextCursor = data.next_cursor;
+      const more = data.has_more ? "+" : "";
+      document.getElementById("dupSummary").textContent = `${dupShown}${more} duplicate record(s) found:`;
+      document.getElementById("dupMore").style.display = data.has_more ? "inline-block" : "none";
   
     } catch (err) {
       console.error("Fetch error:", err);
@@ -57,4 +84,3 @@ function getParam(name) {
       fetchDuplicates(device_id, start, end);
     });
   });
-    
\ No newline at end of file
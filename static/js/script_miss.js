@@ -3,12 +3,12 @@ function getParam(name) {
   return url.searchParams.get(name);
 }
 
-  async function fetchMissing(device_id, start, end) {
+  async function fetchMissing(device_id, start, end, interval_minutes = 5, tolerance = 0) {
     const result = document.getElementById("result");
     result.innerHTML = "⏳ Checking…";
   
     try {
-      const res = await fetch(`/api/missing-intervals?device_id=${encodeURIComponent(device_id)}&start=${encodeURIComponent(start)}&end=${encodeURIComponent(end)}`);
+      const res = await fetch(`/api/missing-intervals?device_id=${encodeURIComponent(device_id)}&start=${encodeURIComponent(start)}&end=${encodeURIComponent(end)}&interval_minutes=${encodeURIComponent(interval_minutes)}&tolerance=${encodeURIComponent(tolerance)}`);
       const data = await res.json();
       // console.log("API ➜", data);
     
@@ -22,10 +22,10 @@ function getParam(name) {
         return;
       }
     
-      let html = `<p><strong>⚠️ ${data.count} missing intervals:</strong></p>`;
-      html += "<table border='1'><tr><th>Start</th><th>End</th></tr>";
+      let html = `<p><strong>⚠️ ${data.count} gaps, ${data.missing_slots} missing ${data.interval_minutes}-minute intervals:</strong></p>`;
+      html += "<table border='1'><tr><th>Start</th><th>End</th><th>Missing Intervals</th></tr>";
       data.missing_intervals.forEach(i => {
-        html += `<tr><td>${i.missing_interval_start}</td><td>${i.missing_interval_end}</td></tr>`;
+        html += `<tr><td>${i.missing_interval_start}</td><td>${i.missing_interval_end}</td><td>${i.missing_slots}</td></tr>`;
       });
       html += "</table>";
       result.innerHTML = html;
@@ -41,7 +41,7 @@ function getParam(name) {
     const end = getParam("end");
   
     if (device_id && start && end) {
-      fetchDuplicates(device_id, start, end);
+      fetchMissing(device_id, start, end);
     }
   
     // Also handle manual form submission
@@ -50,6 +50,8 @@ function getParam(name) {
       const device_id = document.getElementById("device_id").value.trim();
       const start = document.getElementById("start").value.trim();
       const end = document.getElementById("end").value.trim();
-      fetchMissing(device_id, start, end);
+      const interval_minutes = document.getElementById("interval_minutes").value || 5;
+      const tolerance = document.getElementById("tolerance").value || 0;
+      fetchMissing(device_id, start, end, interval_minutes, tolerance);
     });
   });
\ No newline at end of file
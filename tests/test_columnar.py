@@ -0,0 +1,172 @@
+"""
+The raw-batch decoder in app.columnar against the bson.decode path.
+
+Every case decodes the same records twice: from concatenated raw BSON
+(the find_raw_batches path, fixed-offset layouts included) and from
+bson.decode'd dicts. Both must give identical columns.
+"""
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+import bson
+import numpy as np
+from bson import Binary, Code, Decimal128, Int64, Regex
+
+from app import fetch_data
+from app.columnar import (
+    ColumnDecoder,
+    columns_from_batches,
+    columns_from_documents,
+)
+
+DEVICE_ID = str(uuid.UUID(int=1))
+DEVICE = Binary.from_uuid(uuid.UUID(DEVICE_ID))
+START = datetime(2024, 1, 1)
+COLUMNS = ("devicetime", "etm", "csm", "bvt", "bpon", "device_codes")
+
+
+def record(i, etm=None, csm=2, bvt=3.9, bpon=1):
+    return {
+        "deviceid": DEVICE,
+        "devicetime": START + timedelta(minutes=5 * i),
+        "data": {
+            "evt": {"etm": float(i) if etm is None else etm, "csm": csm},
+            "binfo": {"bvt": bvt, "bpon": bpon},
+        },
+    }
+
+
+def mixed_records():
+    """Uniform records around every variant the decoder has to handle"""
+    docs = [record(i) for i in range(20)]
+    docs += [
+        record(20, etm=7),                    # int32
+        record(21, etm=Int64(2**40)),         # int64 past float32 precision
+        record(22, etm=Int64(3)),             # int64 that fits in int32
+        record(23, csm=None),                 # null
+        record(24, csm="n/a"),                # string
+        record(25, csm=Decimal128("1.5")),    # decimal128
+        record(26, bpon=True),                # bool instead of int
+        record(27, bpon=0),
+        {"deviceid": DEVICE, "devicetime": START + timedelta(minutes=140)},  # missing data # noqa
+        {"deviceid": DEVICE, "devicetime": START, "data": {"evt": {"etm": 1.0}}},  # missing fields # noqa
+        {                                     # reordered fields
+            "data": {
+                "binfo": {"bpon": 1, "bvt": 3.5},
+                "evt": {"csm": 4, "etm": 9.0},
+            },
+            "devicetime": START + timedelta(minutes=145),
+            "deviceid": DEVICE,
+        },
+        {"devicetime": START + timedelta(minutes=150), "data": {}},  # no deviceid # noqa
+        {"deviceid": DEVICE, "devicetime": "2024-01-01 12:55:00"},  # string time # noqa
+        {**record(30), "note": Regex("^x")},  # unsized type outside the values # noqa
+        record(31, bvt=Code("return 1")),     # unsized type as a value
+    ]
+    return docs
+
+
+def encode(docs):
+    return b"".join(bson.encode(doc) for doc in docs)
+
+
+def assert_same_columns(actual, expected):
+    for name in COLUMNS:
+        np.testing.assert_array_equal(
+            getattr(actual, name), getattr(expected, name), err_msg=name
+        )
+    assert actual.device_ids == expected.device_ids
+
+
+def test_raw_batch_matches_decode_path():
+    batch = encode(mixed_records())
+    expected = columns_from_documents(bson.decode_all(batch))
+    actual = columns_from_batches([batch])
+    assert_same_columns(actual, expected)
+
+    assert actual.etm[21] == 2**40
+    assert np.isnan(actual.csm[23]) and np.isnan(actual.csm[24])
+    assert actual.csm[25] == 1.5
+    assert actual.bvt[-2] == np.float32(3.9)
+    assert np.isnan(actual.bvt[-1])
+    assert actual.device_codes[-4] == -1
+
+
+def test_uniform_records_take_the_fixed_offset_path():
+    docs = [record(i) for i in range(50)]
+    decoder = ColumnDecoder()
+    decoder.add_batch(encode(docs))
+    assert decoder.fast == 50 and decoder.fallback == 0
+    assert_same_columns(decoder.columns(), columns_from_documents(docs))
+
+
+def test_unknown_bson_types_fall_back_per_record():
+    docs = [record(i) for i in range(10)]
+    docs[3]["note"] = Regex("^x")
+    docs[7]["data"]["binfo"]["bvt"] = Code("return 1")
+    decoder = ColumnDecoder()
+    decoder.add_batch(encode(docs))
+    assert decoder.fallback >= 2
+    assert_same_columns(decoder.columns(), columns_from_documents(docs))
+
+
+class _RawCursor:
+    """find_raw_batches cursor over in-memory records"""
+
+    def __init__(self, docs):
+        self._docs = docs
+        self._batch_size = 101
+
+    def sort(self, key, direction):
+        self._docs = sorted(self._docs, key=lambda doc: doc[key], reverse=direction < 0) # noqa
+        return self
+
+    def batch_size(self, size):
+        self._batch_size = size
+        return self
+
+    async def _batches(self):
+        for i in range(0, len(self._docs), self._batch_size):
+            yield encode(self._docs[i:i + self._batch_size])
+
+    def __aiter__(self):
+        return self._batches()
+
+
+class _RawCollection:
+    def __init__(self, docs):
+        self._docs = docs
+
+    def find_raw_batches(self, query, projection):
+        bounds = query["devicetime"]
+
+        def matches(doc):
+            t = doc["devicetime"]
+            return (
+                t >= bounds["$gte"]
+                and ("$lt" not in bounds or t < bounds["$lt"])
+                and ("$lte" not in bounds or t <= bounds["$lte"])
+            )
+
+        return _RawCursor([doc for doc in self._docs if matches(doc)])
+
+
+def test_read_columns_matches_decode_path(monkeypatch):
+    docs = [
+        doc for doc in mixed_records()
+        if isinstance(doc.get("devicetime"), datetime) and "deviceid" in doc
+    ]
+    docs.reverse()  # the cursor's sort must restore devicetime order
+    monkeypatch.setattr(fetch_data, "raw_collection", lambda: _RawCollection(docs)) # noqa
+    monkeypatch.setattr(fetch_data, "MONGO_BATCH_SIZE", 7)
+    monkeypatch.setattr(fetch_data, "FETCH_SLICE_HOURS", 1)
+
+    query, _, _ = fetch_data.build_range_query(
+        DEVICE_ID, "2024-01-01 00:00:00", "2024-01-01 23:59:59"
+    )
+    actual = asyncio.run(fetch_data.read_columns(query, deviceid=True))
+
+    ordered = sorted(docs, key=lambda doc: doc["devicetime"])
+    expected = columns_from_documents(bson.decode_all(encode(ordered)))
+    assert_same_columns(actual, expected)
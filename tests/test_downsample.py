@@ -0,0 +1,78 @@
+"""
+LTTB point selection and min/max envelopes from app.downsample.
+"""
+import numpy as np
+import pytest
+
+from app.downsample import downsample_series, lttb_indices, minmax_envelope
+
+
+def series(n, seed=3):
+    rng = np.random.default_rng(seed)
+    x = np.arange(n, dtype=np.int64) * 300_000
+    y = np.sin(np.arange(n) / 50) + rng.normal(0, 0.1, n)
+    return x, y
+
+
+@pytest.mark.parametrize("n, threshold", [(1000, 100), (1000, 3), (101, 100), (5000, 777)]) # noqa
+def test_lttb_returns_threshold_points_in_order(n, threshold):
+    x, y = series(n)
+    keep = lttb_indices(x, y, threshold)
+    assert keep.size == threshold
+    assert np.all(np.diff(keep) > 0)
+
+
+def test_lttb_keeps_the_first_and_last_point():
+    x, y = series(1000)
+    keep = lttb_indices(x, y, 50)
+    assert keep[0] == 0 and keep[-1] == 999
+
+
+@pytest.mark.parametrize("threshold", [10, 11, 50, 2, 0])
+def test_lttb_passes_short_series_through(threshold):
+    x, y = series(10)
+    np.testing.assert_array_equal(lttb_indices(x, y, threshold), np.arange(10)) # noqa
+
+
+def test_lttb_keeps_an_isolated_spike():
+    x = np.arange(1000)
+    y = np.zeros(1000)
+    y[437] = 50.0
+    assert 437 in lttb_indices(x, y, 20)
+
+
+def test_envelope_buckets_cover_every_point():
+    x, y = series(1000)
+    env_t, env_min, env_max = minmax_envelope(x, y, 40)
+    assert env_t.size == env_min.size == env_max.size == 40
+    assert env_t[0] == x[0]
+    assert env_min.min() == y.min() and env_max.max() == y.max()
+    assert np.all(env_min <= env_max)
+
+
+def test_envelope_of_short_and_empty_series():
+    x, y = series(5)
+    env_t, env_min, env_max = minmax_envelope(x, y, 40)
+    np.testing.assert_array_equal(env_t, x)
+    np.testing.assert_array_equal(env_min, y)
+    np.testing.assert_array_equal(env_max, y)
+    assert all(part.size == 0 for part in minmax_envelope([], np.array([]), 40)) # noqa
+
+
+def test_downsample_series_drops_missing_values_first():
+    x, y = series(500)
+    y[::7] = np.nan
+    result = downsample_series(x, y, 60)
+    present = ~np.isnan(y)
+    assert result["raw_points"] == int(present.sum())
+    assert len(result["t"]) == len(result["v"]) == 60
+    assert result["t"][0] == x[present][0] and result["t"][-1] == x[present][-1] # noqa
+    assert not np.isnan(result["v"]).any()
+    assert len(result["envelope"]["t"]) == 60
+
+
+def test_downsample_series_passes_small_series_through():
+    x, y = series(30)
+    result = downsample_series(x, y, 100)
+    assert result["t"] == x.tolist()
+    assert result["v"] == y.tolist()
@@ -0,0 +1,102 @@
+"""
+Time-sliced reads in app.fetch_data: slice boundaries, config validation
+and the overall duplicate-scan deadline.
+"""
+import asyncio
+import os
+import subprocess
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+from pymongo.errors import ExecutionTimeout
+
+from app import fetch_data
+
+START = datetime(2024, 1, 1)
+
+
+def range_query(hours):
+    return {
+        "deviceid": "dev",
+        "devicetime": {"$gte": START, "$lte": START + timedelta(hours=hours)},
+    }
+
+
+def test_slices_tile_the_range_exactly():
+    slices = fetch_data.slice_query(range_query(10), timedelta(hours=3))
+    bounds = [part["devicetime"] for part in slices]
+    assert bounds == [
+        {"$gte": START, "$lt": START + timedelta(hours=3)},
+        {"$gte": START + timedelta(hours=3), "$lt": START + timedelta(hours=6)}, # noqa
+        {"$gte": START + timedelta(hours=6), "$lt": START + timedelta(hours=9)}, # noqa
+        # The last slice keeps the inclusive end
+        {"$gte": START + timedelta(hours=9), "$lte": START + timedelta(hours=10)}, # noqa
+    ]
+    assert all(part["deviceid"] == "dev" for part in slices)
+
+
+def test_non_positive_slice_span_is_rejected():
+    for span in (timedelta(0), timedelta(hours=-1)):
+        with pytest.raises(ValueError):
+            fetch_data.slice_query(range_query(10), span)
+
+
+@pytest.mark.parametrize("name, value", [
+    ("FETCH_SLICE_HOURS", "0"),
+    ("FETCH_SLICE_HOURS", "-2"),
+    ("FETCH_PARALLELISM", "0"),
+])
+def test_config_rejects_non_positive_slicing(name, value):
+    result = subprocess.run(
+        [sys.executable, "-c", "import app.config"],
+        env={**os.environ, name: value},
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode != 0
+    assert name in result.stderr
+
+
+class _SlowAggregations:
+    """Collection whose aggregations take `seconds` and find nothing"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.max_time_ms = []
+
+    async def aggregate(self, pipeline, **options):
+        self.max_time_ms.append(options.get("maxTimeMS"))
+        await asyncio.sleep(self.seconds)
+        return self
+
+    async def to_list(self):
+        return []
+
+
+def test_duplicate_scan_budget_covers_the_whole_scan(monkeypatch):
+    collection = _SlowAggregations(0.05)
+    monkeypatch.setattr(fetch_data, "raw_collection", lambda: collection)
+    monkeypatch.setattr(fetch_data, "FETCH_PARALLELISM", 1)
+    monkeypatch.setattr(fetch_data, "FETCH_SLICE_HOURS", 1)
+
+    with pytest.raises(ExecutionTimeout):
+        asyncio.run(fetch_data.get_duplicates_page(
+            range_query(100), time_budget_ms=180
+        ))
+
+    # Each slice only got what was left, and scanning stopped at the budget
+    budgets = collection.max_time_ms
+    assert 2 <= len(budgets) <= 5
+    assert budgets[0] <= 180
+    assert all(later < earlier for earlier, later in zip(budgets, budgets[1:])) # noqa
+
+
+def test_duplicate_scan_without_budget_sets_no_max_time(monkeypatch):
+    collection = _SlowAggregations(0)
+    monkeypatch.setattr(fetch_data, "raw_collection", lambda: collection)
+    monkeypatch.setattr(fetch_data, "FETCH_SLICE_HOURS", 24)
+
+    page = asyncio.run(fetch_data.get_duplicates_page(range_query(72)))
+    assert collection.max_time_ms == [None] * 4
+    assert page["count"] == 0 and not page["has_more"]
@@ -0,0 +1,88 @@
+"""
+Gap runs from app.missings: slot bucketing, run merging and tolerance.
+"""
+import numpy as np
+
+from app.missings import find_gap_runs, find_missing_runs
+
+START = np.datetime64("2024-01-01T00:00:00", "ns")
+
+
+def at(*minutes):
+    """datetime64 timestamps `minutes` after START"""
+    return START + np.array(minutes, dtype="timedelta64[m]")
+
+
+def every(first, last, step=5):
+    return list(range(first, last + 1, step))
+
+
+def test_no_gaps():
+    times = at(*every(0, 600))
+    assert find_missing_runs(times) == []
+
+
+def test_jitter_within_a_slot_is_not_a_gap():
+    times = at(0, 6, 14, 17, 24, 29)  # one record in each 5-minute slot
+    assert find_missing_runs(times) == []
+
+
+def test_gap_right_after_the_first_record():
+    times = at(0, *every(20, 60))
+    assert find_missing_runs(times) == [{
+        "missing_interval_start": "2024-01-01 00:05:00",
+        "missing_interval_end": "2024-01-01 00:20:00",
+        "missing_slots": 3,
+    }]
+
+
+def test_gap_right_before_the_last_record():
+    times = at(*every(0, 40), 120)
+    assert find_missing_runs(times) == [{
+        "missing_interval_start": "2024-01-01 00:45:00",
+        "missing_interval_end": "2024-01-01 02:00:00",
+        "missing_slots": 15,
+    }]
+
+
+def test_adjacent_missing_slots_merge_into_one_run():
+    times = at(0, 5, 60, 65)
+    runs = find_missing_runs(times)
+    assert len(runs) == 1
+    assert runs[0]["missing_slots"] == 10
+
+
+def test_tolerance_ignores_short_runs_only():
+    # runs of 1, 2 and 4 missing slots
+    times = at(0, 10, 25, 50)
+    assert [run["missing_slots"] for run in find_missing_runs(times)] == [1, 2, 4] # noqa
+    assert [run["missing_slots"] for run in find_missing_runs(times, tolerance_slots=1)] == [2, 4] # noqa
+    assert [run["missing_slots"] for run in find_missing_runs(times, tolerance_slots=2)] == [4] # noqa
+    assert find_missing_runs(times, tolerance_slots=4) == []
+
+
+def test_duplicate_timestamps_are_one_slot():
+    times = at(0, 0, 5, 5, 5, 20, 20)
+    assert [run["missing_slots"] for run in find_missing_runs(times)] == [2]
+
+
+def test_unsorted_input_gives_the_same_runs():
+    sorted_times = at(0, 5, 5, 30, 35, 90)
+    shuffled = sorted_times[[3, 0, 5, 1, 4, 2]]
+    assert find_missing_runs(shuffled) == find_missing_runs(sorted_times)
+
+
+def test_fewer_than_two_slots_have_no_gaps():
+    for slots in ([], [7], [7, 7]):
+        first, counts = find_gap_runs(np.array(slots, dtype=np.int64))
+        assert first.size == 0 and counts.size == 0
+
+
+def test_interval_minutes_sets_the_slot_width():
+    times = at(0, 15, 60)
+    runs = find_missing_runs(times, interval_minutes=15)
+    assert runs == [{
+        "missing_interval_start": "2024-01-01 00:30:00",
+        "missing_interval_end": "2024-01-01 01:00:00",
+        "missing_slots": 2,
+    }]
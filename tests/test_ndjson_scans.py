@@ -0,0 +1,181 @@
+"""
+NDJSON scans in app.fetch_data: streamed findings match the JSON path,
+and runs that straddle a cursor batch are reported once.
+"""
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+import bson
+import orjson
+from bson import Binary
+
+from app import fetch_data
+from app.duplicates import DuplicateScanner, find_duplicates
+from app.missings import GapScanner, find_missing_runs
+
+DEVICE_ID = str(uuid.UUID(int=1))
+DEVICE = Binary.from_uuid(uuid.UUID(DEVICE_ID))
+START = datetime(2024, 1, 1)
+
+
+def record(minute):
+    return {
+        "deviceid": DEVICE,
+        "devicetime": START + timedelta(minutes=minute),
+        "data": {"evt": {"etm": float(minute), "csm": 2}},
+    }
+
+
+class _RawCursor:
+    """find_raw_batches cursor over in-memory records"""
+
+    def __init__(self, docs):
+        self._docs = docs
+        self._batch_size = 101
+        self.closed = False
+
+    def sort(self, key, direction):
+        self._docs = sorted(self._docs, key=lambda doc: doc[key], reverse=direction < 0) # noqa
+        return self
+
+    def batch_size(self, size):
+        self._batch_size = size
+        return self
+
+    async def _batches(self):
+        for i in range(0, len(self._docs), self._batch_size):
+            yield b"".join(bson.encode(doc) for doc in self._docs[i:i + self._batch_size]) # noqa
+
+    def __aiter__(self):
+        return self._batches()
+
+    async def close(self):
+        self.closed = True
+
+
+class _RawCollection:
+    def __init__(self, docs):
+        self._docs = docs
+        self.cursors = []
+
+    def find_raw_batches(self, query, projection):
+        bounds = query["devicetime"]
+
+        def matches(doc):
+            t = doc["devicetime"]
+            return (
+                t >= bounds["$gte"]
+                and ("$lt" not in bounds or t < bounds["$lt"])
+                and ("$lte" not in bounds or t <= bounds["$lte"])
+            )
+
+        cursor = _RawCursor([doc for doc in self._docs if matches(doc)])
+        self.cursors.append(cursor)
+        return cursor
+
+
+def use_records(monkeypatch, minutes, batch_size):
+    collection = _RawCollection([record(minute) for minute in minutes])
+    monkeypatch.setattr(fetch_data, "raw_collection", lambda: collection)
+    monkeypatch.setattr(fetch_data, "MAX_RECORDS_LIMIT", batch_size)
+    monkeypatch.setattr(fetch_data, "MONGO_BATCH_SIZE", batch_size)
+    monkeypatch.setattr(fetch_data, "FETCH_SLICE_HOURS", 6)
+    query, _, _ = fetch_data.build_range_query(
+        DEVICE_ID, "2024-01-01 00:00:00", "2024-01-01 23:59:59"
+    )
+    return collection, query
+
+
+def stream(query, scanner, deviceid=False):
+    """(chunks, findings, summary) from iter_scan_ndjson"""
+    async def collect():
+        return [
+            chunk async for chunk in
+            fetch_data.iter_scan_ndjson(query, scanner, deviceid=deviceid)
+        ]
+
+    chunks = asyncio.run(collect())
+    lines = [orjson.loads(line) for line in b"".join(chunks).splitlines()]
+    assert "summary" in lines[-1], lines[-1]
+    return chunks, lines[:-1], lines[-1]["summary"]
+
+
+def every(first, last, step=5):
+    return list(range(first, last + 1, step))
+
+
+def test_streamed_gaps_match_the_json_scan(monkeypatch):
+    minutes = every(0, 100) + every(130, 300) + [303, 331] + every(400, 1435)
+    collection, query = use_records(monkeypatch, minutes, batch_size=7)
+
+    _, found, summary = stream(query, GapScanner(5, 0))
+    times = asyncio.run(fetch_data.get_devicetimes(query))
+    expected = find_missing_runs(times, 5, 0)
+
+    assert len(expected) == 3
+    assert found == expected
+    assert summary["count"] == len(expected)
+    assert summary["missing_slots"] == sum(run["missing_slots"] for run in expected) # noqa
+    assert summary["records"] == len(minutes)
+    assert collection.cursors[0].closed  # the streaming cursor
+
+
+def test_streamed_gaps_honour_tolerance(monkeypatch):
+    minutes = every(0, 50) + every(65, 200) + every(260, 400)
+    _, query = use_records(monkeypatch, minutes, batch_size=5)
+
+    _, found, _ = stream(query, GapScanner(5, 2))
+    times = asyncio.run(fetch_data.get_devicetimes(query))
+    assert found == find_missing_runs(times, 5, 2)
+    assert [run["missing_slots"] for run in found] == [11]
+
+
+def test_gap_across_a_batch_boundary_is_reported_once(monkeypatch):
+    # The first batch ends at minute 15 and the second starts at minute 60
+    _, query = use_records(monkeypatch, every(0, 15) + every(60, 75), batch_size=4) # noqa
+
+    chunks, found, summary = stream(query, GapScanner(5, 0))
+    assert found == [{
+        "missing_interval_start": "2024-01-01 00:20:00",
+        "missing_interval_end": "2024-01-01 01:00:00",
+        "missing_slots": 8,
+    }]
+    assert summary["count"] == 1 and summary["missing_slots"] == 8
+    # Emitted with the batch that closed it, ahead of the summary line
+    assert len(chunks) == 2 and b"missing_interval_start" in chunks[0]
+
+
+def test_streamed_duplicates_match_the_json_scan(monkeypatch):
+    # Batches of four: [0 5 5 15] [15 15 20 25] [30 30 35], so the group
+    # at minute 15 straddles the first boundary
+    minutes = [0, 5, 5, 15, 15, 15, 20, 25, 30, 30, 35]
+    collection, query = use_records(monkeypatch, minutes, batch_size=4)
+
+    _, found, summary = stream(query, DuplicateScanner(), deviceid=True)
+    columns = asyncio.run(fetch_data.read_columns(query, (), deviceid=True))
+    expected = find_duplicates(columns)
+
+    assert found == expected
+    assert [(group["devicetime"][-8:], group["count"]) for group in found] == [ # noqa
+        ("00:05:00", 2), ("00:15:00", 3), ("00:30:00", 2),
+    ]
+    assert all(group["deviceid"] == DEVICE_ID for group in found)
+    assert summary == {"records": len(minutes), "count": 3}
+    assert collection.cursors[0].closed
+
+
+def test_scan_errors_are_reported_in_band(monkeypatch):
+    _, query = use_records(monkeypatch, every(0, 60), batch_size=4)
+
+    class Broken(GapScanner):
+        def feed(self, columns):
+            raise RuntimeError("boom")
+
+    async def collect():
+        return [
+            chunk async for chunk in
+            fetch_data.iter_scan_ndjson(query, Broken())
+        ]
+
+    assert asyncio.run(collect()) == [b'{"error":"boom"}\n']
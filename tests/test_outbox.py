@@ -0,0 +1,108 @@
+"""
+The SQLite email outbox: idempotent enqueue, leased claims, retry backoff
+and parking undeliverable messages as dead.
+"""
+from datetime import date
+from email.message import EmailMessage
+
+import pytest
+
+from app import outbox as outbox_module
+from app.outbox import DEAD, PENDING, SENT, EmailOutbox, report_key
+
+NOW = 1_700_000_000.0
+
+
+def message(subject="Daily report"):
+    msg = EmailMessage()
+    msg["From"] = "reports@example.com"
+    msg["To"] = "owner@example.com"
+    msg["Subject"] = subject
+    msg.set_content("report body")
+    return msg
+
+
+@pytest.fixture
+def outbox(tmp_path, monkeypatch):
+    monkeypatch.setattr(outbox_module, "EMAIL_RETRY_BASE_SECONDS", 60)
+    monkeypatch.setattr(outbox_module, "EMAIL_RETRY_MAX_SECONDS", 600)
+    box = EmailOutbox(str(tmp_path / "outbox.sqlite3"), max_attempts=4)
+    yield box
+    box.close()
+
+
+def test_enqueue_is_idempotent_per_key(outbox):
+    key = report_key("dev-1", date(2024, 1, 1))
+    assert outbox.enqueue(key, "dev-1", "owner@example.com", message(), now=NOW) # noqa
+    assert not outbox.enqueue(key, "dev-1", "owner@example.com", message("again"), now=NOW) # noqa
+    assert outbox.stats() == {PENDING: 1, SENT: 0, DEAD: 0}
+
+
+def test_claim_due_takes_only_due_messages_and_leases_them(outbox):
+    outbox.enqueue("due", "dev-1", "a@example.com", message(), now=NOW)
+    outbox.enqueue("later", "dev-2", "b@example.com", message(), now=NOW + 100) # noqa
+
+    claimed = outbox.claim_due(now=NOW, lease_seconds=300)
+    assert [item["key"] for item in claimed] == ["due"]
+    assert claimed[0]["to_email"] == "a@example.com"
+    assert claimed[0]["message"]["Subject"] == "Daily report"
+    assert claimed[0]["attempts"] == 0
+
+    # Leased: other senders skip it until the lease runs out
+    assert [item["key"] for item in outbox.claim_due(now=NOW + 200)] == ["later"] # noqa
+    assert [item["key"] for item in outbox.claim_due(now=NOW + 301)] == ["due"] # noqa
+
+
+def test_claim_due_respects_the_limit(outbox):
+    for i in range(5):
+        outbox.enqueue(f"k{i}", "dev", "a@example.com", message(), now=NOW + i)
+    assert len(outbox.claim_due(now=NOW + 10, limit=3)) == 3
+    assert len(outbox.claim_due(now=NOW + 10, limit=3)) == 2
+
+
+def test_mark_failed_backs_off_exponentially_up_to_the_cap(outbox, monkeypatch): # noqa
+    monkeypatch.setattr(outbox_module, "EMAIL_RETRY_MAX_SECONDS", 200)
+    outbox.max_attempts = 10
+    outbox.enqueue("k", "dev", "a@example.com", message(), now=NOW)
+
+    delays = []
+    for _ in range(4):
+        assert outbox.mark_failed("k", "451 try later", now=NOW) == PENDING
+        delays.append(outbox.next_due_at() - NOW)
+    assert delays == [60, 120, 200, 200]
+
+    # Not due again until the backoff has passed
+    assert outbox.claim_due(now=NOW + 199) == []
+    assert [item["attempts"] for item in outbox.claim_due(now=NOW + 200)] == [4] # noqa
+
+
+def test_message_goes_dead_after_max_attempts(outbox):
+    outbox.enqueue("k", "dev", "a@example.com", message(), now=NOW)
+    statuses = [outbox.mark_failed("k", "550 rejected", now=NOW) for _ in range(4)] # noqa
+    assert statuses == [PENDING, PENDING, PENDING, DEAD]
+    assert outbox.status_of("k") == DEAD
+    assert outbox.claim_due(now=NOW + 10**6) == []
+    assert outbox.next_due_at() is None
+    assert outbox.stats() == {PENDING: 0, SENT: 0, DEAD: 1}
+
+
+def test_mark_sent_and_unknown_keys(outbox):
+    outbox.enqueue("k", "dev", "a@example.com", message(), now=NOW)
+    outbox.mark_sent("k", now=NOW)
+    assert outbox.status_of("k") == SENT
+    assert outbox.claim_due(now=NOW + 10**6) == []
+    assert outbox.mark_failed("missing", "x", now=NOW) is None
+    assert outbox.status_of("missing") is None
+
+
+def test_pending_messages_survive_a_reopen(tmp_path):
+    path = str(tmp_path / "outbox.sqlite3")
+    box = EmailOutbox(path)
+    box.enqueue("k", "dev", "a@example.com", message(), now=NOW)
+    box.close()
+
+    reopened = EmailOutbox(path)
+    try:
+        assert [item["key"] for item in reopened.claim_due(now=NOW)] == ["k"]
+    finally:
+        reopened.close()
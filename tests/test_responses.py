@@ -0,0 +1,105 @@
+"""
+FastJSONResponse: encoding, Accept-Encoding negotiation and keeping bulky
+bodies off the event loop.
+"""
+import asyncio
+import gzip
+import threading
+
+import orjson
+
+from app import responses
+from app.responses import FastJSONResponse, negotiate_encoding
+
+
+def send_response(response, accept_encoding=""):
+    """Run `response` as ASGI; returns (status, headers, body, encode thread)""" # noqa
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "headers": [(b"accept-encoding", accept_encoding.encode())],
+    }
+    messages = []
+    threads = []
+    finish_body = response._finish_body
+
+    def spy(encoding):
+        threads.append(threading.current_thread())
+        finish_body(encoding)
+
+    response._finish_body = spy
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(response(scope, receive, send))
+    start, body = messages[0], messages[1]["body"]
+    headers = {k.decode(): v.decode() for k, v in start["headers"]}
+    assert int(headers["content-length"]) == len(body)
+    return start["status"], headers, body, threads[0]
+
+
+def records(n):
+    return {"count": n, "records": [{"i": i, "v": "x" * 200} for i in range(n)]} # noqa
+
+
+def test_small_payload_is_encoded_inline_and_left_uncompressed():
+    status, headers, body, thread = send_response(
+        FastJSONResponse({"ok": True}), "gzip"
+    )
+    assert status == 200
+    assert orjson.loads(body) == {"ok": True}
+    assert "content-encoding" not in headers
+    assert thread is threading.main_thread()
+
+
+def test_bulky_payload_is_encoded_and_compressed_off_the_loop():
+    content = records(2000)
+    response = FastJSONResponse(content)
+    assert response.body == b""  # nothing encoded on the event loop yet
+
+    status, headers, body, thread = send_response(response, "gzip")
+    assert headers["content-encoding"] == "gzip"
+    assert headers["vary"] == "Accept-Encoding"
+    assert orjson.loads(gzip.decompress(body)) == content
+    assert thread is not threading.main_thread()
+
+
+def test_large_encoded_body_is_compressed_off_the_loop(monkeypatch):
+    monkeypatch.setattr(responses, "RESPONSE_OFFLOAD_MIN_BYTES", 10_000)
+    content = {"blob": "y" * 50_000}
+    response = FastJSONResponse(content)
+    assert response.body  # not bulky by item count: encoded up front
+
+    _, headers, body, thread = send_response(response, "gzip")
+    assert orjson.loads(gzip.decompress(body)) == content
+    assert thread is not threading.main_thread()
+
+
+def test_bulky_payload_without_accepted_encoding():
+    content = records(1500)
+    _, headers, body, _ = send_response(FastJSONResponse(content), "identity")
+    assert "content-encoding" not in headers
+    assert orjson.loads(body) == content
+
+
+def test_status_code_and_headers_survive_deferred_encoding():
+    response = FastJSONResponse(
+        records(1000), status_code=206, headers={"x-total": "1000"}
+    )
+    status, headers, body, _ = send_response(response)
+    assert status == 206
+    assert headers["x-total"] == "1000"
+    assert orjson.loads(body)["count"] == 1000
+
+
+def test_negotiate_encoding():
+    assert negotiate_encoding("gzip") == "gzip"
+    assert negotiate_encoding("gzip;q=0, identity") is None
+    assert negotiate_encoding("") is None
+    if responses.brotli is not None:
+        assert negotiate_encoding("gzip, br") == "br"
+        assert negotiate_encoding("br;q=0.5, gzip") == "gzip"
@@ -0,0 +1,132 @@
+"""
+The on-disk result cache: LRU eviction by bytes, batched hit-time
+flushes and which ranges are eligible for caching.
+"""
+import gzip
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import result_cache as result_cache_module
+from app.main import _settled_result_key
+from app.result_cache import ResultCache, result_key
+
+BODY_BYTES = 1000
+
+
+def body():
+    # Random bytes don't compress, so every entry costs about BODY_BYTES
+    return os.urandom(BODY_BYTES)
+
+
+@pytest.fixture
+def now():
+    return time.time()
+
+
+@pytest.fixture
+def cache(tmp_path):
+    # Room for three entries, not four
+    cache = ResultCache(str(tmp_path / "results.sqlite3"), max_bytes=3 * BODY_BYTES + 100) # noqa
+    yield cache
+    cache.close()
+
+
+def used_at(cache, key):
+    row = cache._conn.execute(
+        "SELECT used_at FROM results WHERE key = ?", (key,)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def test_round_trip_is_gzip(cache, now):
+    stored = cache.put("k", b'{"a": 1}', now=now)
+    assert gzip.decompress(stored) == b'{"a": 1}'
+    assert cache.get("k", now=now) == stored
+    assert cache.get("missing", now=now) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_evicts_least_recently_used_by_bytes(cache, now):
+    for i, key in enumerate("abc"):
+        cache.put(key, body(), now=now + i)
+    assert cache.get("a", now=now + 3) is not None  # a is now the newest
+
+    cache.put("d", body(), now=now + 4)
+    assert cache.get("b", now=now + 5) is None
+    assert all(cache.get(key, now=now + 5) for key in "acd")
+    stats = cache.stats()
+    assert stats["entries"] == 3 and stats["evictions"] == 1
+    assert stats["bytes"] <= stats["max_bytes"]
+
+
+def test_body_larger_than_the_cache_is_not_stored(cache, now):
+    stored = cache.put("huge", os.urandom(10 * BODY_BYTES), now=now)
+    assert gzip.decompress(stored)
+    assert cache.get("huge", now=now) is None
+    assert cache.stats()["bytes"] == 0
+
+
+def test_replacing_a_key_keeps_the_size_exact(cache, now):
+    cache.put("k", body(), now=now)
+    size = cache.stats()["bytes"]
+    cache.put("k", body(), now=now + 1)
+    assert cache.stats()["bytes"] == pytest.approx(size, abs=20)
+    assert cache.stats()["entries"] == 1
+
+
+def test_hits_are_held_in_memory_until_a_flush(cache, now):
+    cache.put("k", body(), now=now)
+    cache.get("k", now=now + 5)
+    assert used_at(cache, "k") == now  # no write on a read
+
+    cache.get("k", now=now + 10 + result_cache_module.TOUCH_FLUSH_SECONDS)
+    assert used_at(cache, "k") == now + 10 + result_cache_module.TOUCH_FLUSH_SECONDS # noqa
+
+
+def test_touches_flush_after_a_batch_of_hits(cache, now, monkeypatch):
+    monkeypatch.setattr(result_cache_module, "TOUCH_BATCH", 2)
+    cache.put("a", body(), now=now)
+    cache.put("b", body(), now=now)
+    cache.get("a", now=now + 1)
+    assert used_at(cache, "a") == now
+    cache.get("b", now=now + 2)
+    assert (used_at(cache, "a"), used_at(cache, "b")) == (now + 1, now + 2)
+
+
+def test_touches_survive_close(tmp_path, now):
+    path = str(tmp_path / "results.sqlite3")
+    cache = ResultCache(path)
+    cache.put("k", b"{}", now=now)
+    cache.get("k", now=now + 5)
+    cache.close()
+
+    reopened = ResultCache(path)
+    try:
+        assert used_at(reopened, "k") == now + 5
+        assert reopened.stats()["bytes"] > 0
+    finally:
+        reopened.close()
+
+
+def test_only_settled_ranges_are_cached():
+    fmt = "%Y-%m-%d %H:%M:%S"
+    old_end = (datetime.utcnow() - timedelta(days=2)).strftime(fmt)
+    open_end = (datetime.utcnow() + timedelta(minutes=1)).strftime(fmt)
+
+    assert _settled_result_key("get-data", "dev", "2024-01-01 00:00:00", old_end) == result_key( # noqa
+        "get-data", "dev", "2024-01-01 00:00:00", old_end
+    )
+    assert _settled_result_key("get-data", "dev", "2024-01-01 00:00:00", open_end) is None # noqa
+    assert _settled_result_key("get-data", "dev", "2024-01-01 00:00:00", "yesterday") is None # noqa
+
+
+def test_result_key_orders_params():
+    assert result_key("gaps", "d", "s", "e", tolerance=1, interval_minutes=5) == result_key( # noqa
+        "gaps", "d", "s", "e", interval_minutes=5, tolerance=1
+    )
+    assert result_key("gaps", "d", "s", "e", tolerance=1) != result_key(
+        "gaps", "d", "s", "e", tolerance=2
+    )
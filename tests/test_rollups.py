@@ -0,0 +1,49 @@
+"""
+Read planning in app.rollups: which hours come from rollup rows and which
+are aggregated from raw data.
+"""
+from datetime import datetime
+
+from app.rollups import plan_daily_read, plan_hourly_read
+
+DEVICE = "device"
+
+
+def test_rollups_serve_only_hours_before_the_settled_watermark():
+    start = datetime(2024, 1, 1, 0, 30)
+    end = datetime(2024, 1, 1, 23, 59, 59)
+    settled = datetime(2024, 1, 1, 20)
+
+    rollup, raw = plan_hourly_read(DEVICE, start, end, settled)
+    assert rollup["bucket"] == {"$gte": datetime(2024, 1, 1, 1), "$lt": settled} # noqa
+    assert [q["devicetime"] for q in raw] == [
+        {"$gte": start, "$lt": datetime(2024, 1, 1, 1)},
+        # Unsettled hours can still receive late ingests: read them raw
+        {"$gte": settled, "$lte": end},
+    ]
+
+
+def test_closed_range_before_the_watermark_is_all_rollups():
+    start = datetime(2024, 1, 1)
+    end = datetime(2024, 1, 1, 23, 59, 59)
+    rollup, raw = plan_hourly_read(DEVICE, start, end, datetime(2024, 1, 3))
+    assert rollup["bucket"] == {"$gte": start, "$lt": datetime(2024, 1, 2)}
+    assert raw == []
+
+
+def test_no_watermark_reads_everything_raw():
+    start = datetime(2024, 1, 1)
+    end = datetime(2024, 1, 2)
+    rollup, raw = plan_hourly_read(DEVICE, start, end, None)
+    assert rollup is None
+    assert raw == [{"deviceid": DEVICE, "devicetime": {"$gte": start, "$lte": end}}] # noqa
+
+
+def test_daily_rollups_stop_at_the_last_settled_day():
+    start = datetime(2024, 1, 1)
+    end = datetime(2024, 1, 10, 23, 59, 59)
+    settled = datetime(2024, 1, 8, 13)
+
+    daily, hourly_ranges = plan_daily_read(DEVICE, start, end, settled)
+    assert daily["bucket"] == {"$gte": start, "$lt": datetime(2024, 1, 8)}
+    assert hourly_ranges == [(datetime(2024, 1, 8), end)]
@@ -0,0 +1,131 @@
+"""
+SMTPSessionPool against a local fake SMTP server: session reuse,
+recycling after max_messages and reconnecting after a dropped session.
+"""
+import asyncio
+from email.message import EmailMessage
+
+from app.smtp_pool import SMTPSessionPool
+
+
+class FakeSMTPServer:
+    """
+    Minimal SMTP server on localhost that records delivered messages.
+
+    With `drop_after`, a connection that has accepted that many messages
+    is closed without a reply at the next MAIL command, so the client only
+    learns mid-send that its session is gone.
+    """
+
+    def __init__(self, drop_after=None):
+        self.drop_after = drop_after
+        self.messages = []
+        self.connections = 0
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0) # noqa
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        accepted = 0
+
+        async def reply(line):
+            writer.write(line.encode() + b"\r\n")
+            await writer.drain()
+
+        await reply("220 fake ESMTP")
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line.decode().strip().upper()
+                if command.startswith(("EHLO", "HELO")):
+                    await reply("250-fake\r\n250 8BITMIME")
+                elif command == "DATA":
+                    await reply("354 end with <CRLF>.<CRLF>")
+                    body = []
+                    while (line := await reader.readline()) != b".\r\n":
+                        body.append(line)
+                    self.messages.append(b"".join(body))
+                    accepted += 1
+                    await reply("250 queued")
+                elif command.startswith("MAIL") and self.drop_after and accepted >= self.drop_after: # noqa
+                    break
+                elif command == "QUIT":
+                    await reply("221 bye")
+                    break
+                else:  # MAIL, RCPT, RSET, NOOP
+                    await reply("250 ok")
+        finally:
+            writer.close()
+
+
+def message(i):
+    msg = EmailMessage()
+    msg["From"] = "reports@example.com"
+    msg["To"] = "owner@example.com"
+    msg["Subject"] = f"Report {i}"
+    msg.set_content(f"body {i}")
+    return msg
+
+
+def run_pool(server, count, concurrency=1, **pool_options):
+    """Send `count` messages through a pool; returns the pool's stats"""
+
+    async def main():
+        port = await server.start()
+        try:
+            async with SMTPSessionPool(
+                hostname="127.0.0.1", port=port, username="", password="",
+                start_tls=False, timeout=5, **pool_options,
+            ) as pool:
+                for first in range(0, count, concurrency):
+                    await asyncio.gather(*(
+                        pool.send_message(message(i))
+                        for i in range(first, min(count, first + concurrency))
+                    ))
+                return pool.stats()
+        finally:
+            await server.stop()
+
+    return asyncio.run(main())
+
+
+def test_one_session_carries_many_messages():
+    server = FakeSMTPServer()
+    stats = run_pool(server, 5, size=1, max_messages=100)
+    assert stats == {"sessions": 1, "connects": 1, "messages_sent": 5}
+    assert server.connections == 1
+    assert len(server.messages) == 5
+
+
+def test_sessions_are_recycled_after_max_messages():
+    server = FakeSMTPServer()
+    stats = run_pool(server, 5, size=1, max_messages=2)
+    assert stats["connects"] == 3
+    assert len(server.messages) == 5
+
+
+def test_pool_reconnects_after_a_dropped_session():
+    server = FakeSMTPServer(drop_after=2)
+    stats = run_pool(server, 5, size=1, max_messages=100)
+    # Dropped during messages 3 and 5, which are retried on a new session
+    assert stats == {"sessions": 1, "connects": 3, "messages_sent": 5}
+    assert server.connections == 3
+    subjects = [b"Subject: Report %d" % i for i in range(5)]
+    assert all(any(s in m for m in server.messages) for s in subjects)
+
+
+def test_concurrent_senders_share_the_sessions():
+    server = FakeSMTPServer()
+    stats = run_pool(server, 12, concurrency=4, size=3, max_messages=100)
+    assert stats["connects"] == 3
+    assert stats["messages_sent"] == 12
+    assert len(server.messages) == 12